@@ -0,0 +1,324 @@
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from Utilities.Logger import logger
+from Utilities.NewsStore import flatten_dates
+
+
+NEWS_COLUMNS = ["Date", "Source", "Title", "Summary", "Relevance"]
+
+# Coverage model of the days imported from a CSV file (filtered elsewhere, with unknown settings)
+IMPORT_MODEL = "csv"
+
+# Text dates sort chronologically, so the (Date, Source, Title) key also serves the date range reads
+_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class AggregatedNewsStore:
+    """
+    Transactional store of the news selected by the FilterAgent, shared by all threads and worker
+    processes of a backtest.
+
+    The news are kept in SQLite (WAL mode) with a unique key on (Date, Source, Title). Each filtered
+    day is upserted in a single short transaction, so concurrent workers never lose each other's rows
+    and a write costs O(rows of the day) rather than a rewrite of the whole table. When the same news
+    is selected again, the longer Relevance is kept. Lookback windows are read with range queries on
+    the key's index.
+
+    A coverage table records which days the FilterAgent has processed, with which model and prompt
+    version, and how many news it kept, so days without relevant news are not filtered again and
+    days missing from a partially filtered window are.
+
+    A verdict table memoises the FilterAgent's decision on every article it was shown (selected or
+    not, with the relevance), keyed by article hash, model and prompt version, so an article is
+    judged once even when it is filtered again in another chunking or window.
+
+    The CSV file (output_path) remains the exchange format: an existing CSV is imported on first use
+    (and again whenever it is replaced), and export_csv writes the table back once a backtest ends.
+    """
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, db_path: str, csv_path: str = None):
+        """
+        :param db_path: Path to the SQLite database.
+        :param csv_path: CSV file imported into the store when it changed since the last import or export.
+        """
+        self.db_path = str(db_path)
+        self.csv_path = str(csv_path) if csv_path else None
+        self._local = threading.local()
+        self.log = logger(name="AggregatedNewsStore", log_file="Logs/backtest.log")
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._create_tables()
+        if self.csv_path is not None:
+            self.import_csv(self.csv_path)
+
+    @classmethod
+    def shared(cls, db_path: str, csv_path: str = None):
+        """Returns the store instance of the current process for the given database."""
+        key = (os.getpid(), os.path.abspath(db_path))
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(db_path, csv_path=csv_path)
+            return cls._instances[key]
+
+    @classmethod
+    def from_output_path(cls, output_path: str, db_path: str = None):
+        """Shared store of an aggregated news CSV (the database defaults to a .sqlite file next to it)."""
+        db_path = db_path or Path(output_path).with_suffix(".sqlite")
+        return cls.shared(str(db_path), csv_path=str(output_path))
+
+    def __reduce__(self):
+        # Connections are per process and thread: re-attach to the worker's own instance
+        return (AggregatedNewsStore.shared, (self.db_path, self.csv_path))
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """SQLite connection of the current thread."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _create_tables(self):
+        conn = self.connection
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS news (
+                Date TEXT NOT NULL,
+                Source TEXT NOT NULL,
+                Title TEXT NOT NULL,
+                Summary TEXT,
+                Relevance TEXT,
+                UNIQUE (Date, Source, Title)
+            )""")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS coverage (
+                Day TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                news_count INTEGER NOT NULL,
+                processed REAL NOT NULL,
+                PRIMARY KEY (Day, model, prompt_version)
+            )""")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS verdicts (
+                article TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                selected INTEGER NOT NULL,
+                Title TEXT,
+                Relevance TEXT,
+                processed REAL NOT NULL,
+                PRIMARY KEY (article, model, prompt_version)
+            )""")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    @staticmethod
+    def _records(df: pd.DataFrame) -> list:
+        """Rows of a news DataFrame as (Date, Source, Title, Summary, Relevance) tuples (rows without a date are skipped)."""
+        df = df.reindex(columns=NEWS_COLUMNS)
+        dates = pd.to_datetime(df["Date"], errors="coerce")
+        df = df.assign(Date=dates.dt.strftime(_DATE_FORMAT))[dates.notna()]
+        df = df.assign(Source=df["Source"].fillna(""), Title=df["Title"].fillna(""))
+        df = df.astype(object).where(df.notna(), None)
+        return list(df.itertuples(index=False, name=None))
+
+    def upsert(self, df: pd.DataFrame) -> int:
+        """
+        Inserts the news of a DataFrame in one transaction; news already stored keep the longer Relevance.
+
+        :param df: DataFrame with Date, Source, Title, Summary and Relevance columns.
+        :return: Number of rows written.
+        """
+        records = self._records(df) if df is not None and not df.empty else []
+        if not records:
+            return 0
+
+        self._write_many("""
+            INSERT INTO news (Date, Source, Title, Summary, Relevance) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (Date, Source, Title) DO UPDATE SET
+                Summary = COALESCE(excluded.Summary, news.Summary),
+                Relevance = CASE WHEN LENGTH(COALESCE(excluded.Relevance, '')) > LENGTH(COALESCE(news.Relevance, ''))
+                                 THEN excluded.Relevance ELSE news.Relevance END
+            """, records)
+        return len(records)
+
+    def _write_many(self, statement: str, rows: list):
+        """Executes a statement for all rows in one transaction, so readers never see part of them."""
+        conn = self.connection
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(statement, rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def window(self, filter_dates=None) -> pd.DataFrame:
+        """
+        Returns the news published on any of the given calendar days, sorted by date (then insertion order).
+
+        :param filter_dates: (Nested) list of dates. If None, the whole table is returned.
+        """
+        query = "SELECT Date, Source, Title, Summary, Relevance FROM news"
+        params = []
+        if filter_dates:
+            days = np.unique(np.array([pd.Timestamp(date).normalize().to_datetime64() for date in flatten_dates(filter_dates)],
+                                      dtype="datetime64[ns]"))
+            if len(days) == 0:
+                return pd.DataFrame(columns=NEWS_COLUMNS)
+
+            # Consecutive days are merged into one range per index search
+            breaks = np.flatnonzero(np.diff(days) != np.timedelta64(1, "D")) + 1
+            range_starts = days[np.r_[0, breaks]]
+            range_ends = days[np.r_[breaks - 1, len(days) - 1]] + np.timedelta64(1, "D")
+            query += " WHERE " + " OR ".join(["(Date >= ? AND Date < ?)"] * len(range_starts))
+            for start, end in zip(range_starts, range_ends):
+                params += [pd.Timestamp(start).strftime(_DATE_FORMAT), pd.Timestamp(end).strftime(_DATE_FORMAT)]
+
+        rows = self.connection.execute(query + " ORDER BY Date, rowid", params).fetchall()
+        df = pd.DataFrame(rows, columns=NEWS_COLUMNS)
+        df["Date"] = pd.to_datetime(df["Date"], format=_DATE_FORMAT)
+        return df
+
+    def covered_days(self, days: list, model: str = None, prompt_version: str = None) -> set:
+        """
+        Days of the list (YYYY-MM-DD) already processed by the FilterAgent.
+
+        :param days: Days to check.
+        :param model: Filter model; None accepts any model and prompt version, including the days
+                      imported from a CSV (recorded with the model IMPORT_MODEL).
+        :param prompt_version: Version of the filter prompt and settings (required with a model).
+        """
+        days = sorted(set(days))
+        if not days:
+            return set()
+        placeholders = ", ".join("?" * len(days))
+
+        if model is not None:
+            rows = self.connection.execute(f"SELECT Day FROM coverage WHERE model = ? AND prompt_version = ? AND Day IN ({placeholders})",
+                                           [model, prompt_version, *days]).fetchall()
+        else:
+            rows = self.connection.execute(f"SELECT DISTINCT Day FROM coverage WHERE Day IN ({placeholders})", days).fetchall()
+        return {row[0] for row in rows}
+
+    def mark_covered(self, news_counts: dict, model: str, prompt_version: str):
+        """
+        Records days as processed by the FilterAgent.
+
+        :param news_counts: {day (YYYY-MM-DD): number of news kept} (0 for days without relevant news).
+        :param model: Filter model.
+        :param prompt_version: Version of the filter prompt and settings.
+        """
+        now = time.time()
+        self._write_many(
+            "INSERT OR REPLACE INTO coverage (Day, model, prompt_version, news_count, processed) VALUES (?, ?, ?, ?, ?)",
+            [(day, model, prompt_version, int(count), now) for day, count in news_counts.items()],
+        )
+
+    def verdicts(self, articles: list, model: str, prompt_version: str) -> dict:
+        """
+        Memoised FilterAgent verdicts of the given articles.
+
+        :param articles: Article hashes (see article_hashes).
+        :param model: Filter model.
+        :param prompt_version: Version of the FilterAgent prompts.
+        :return: {article hash: (selected, Title, Relevance)} of the articles already judged.
+        """
+        articles = list(dict.fromkeys(articles))
+        conn = self.connection
+        found = {}
+        # Stay well below SQLite's bound variable limit
+        for start in range(0, len(articles), 500):
+            batch = articles[start:start + 500]
+            rows = conn.execute(f"SELECT article, selected, Title, Relevance FROM verdicts WHERE model = ? AND prompt_version = ? "
+                                f"AND article IN ({', '.join('?' * len(batch))})", [model, prompt_version, *batch]).fetchall()
+            found.update({article: (bool(selected), title, relevance) for article, selected, title, relevance in rows})
+        return found
+
+    def record_verdicts(self, verdicts: dict, model: str, prompt_version: str):
+        """
+        Memoises FilterAgent verdicts.
+
+        :param verdicts: {article hash: (selected, Title, Relevance)}; Title is the one stored with the
+                         selected news (None for rejected articles).
+        :param model: Filter model.
+        :param prompt_version: Version of the FilterAgent prompts.
+        """
+        now = time.time()
+        self._write_many(
+            "INSERT OR REPLACE INTO verdicts (article, model, prompt_version, selected, Title, Relevance, processed) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(article, model, prompt_version, int(bool(selected)), title, relevance, now)
+             for article, (selected, title, relevance) in verdicts.items()],
+        )
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM news").fetchone()[0]
+
+    @staticmethod
+    def _signature(path) -> str:
+        stat = os.stat(path)
+        return f"{stat.st_ino}:{stat.st_mtime_ns}:{stat.st_size}"
+
+    def _set_meta(self, name: str, value: str):
+        self.connection.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, value))
+
+    def import_csv(self, csv_path: str) -> int:
+        """Upserts an aggregated news CSV, unless it is unchanged since the last import or export."""
+        if not os.path.exists(csv_path):
+            return 0
+        signature = self._signature(csv_path)
+        row = self.connection.execute("SELECT value FROM meta WHERE name = 'csv_signature'").fetchone()
+        if row is not None and row[0] == signature:
+            return 0
+
+        try:
+            df = pd.read_csv(csv_path)
+        except Exception as e:
+            self.log.error(f"Error loading existing CSV {csv_path}: {e}")
+            return 0
+
+        count = self.upsert(df)
+        # The CSV's days count as filtered (rows saved by a partially failed filtering do not cover their day)
+        days = pd.to_datetime(df["Date"], errors="coerce").dropna().dt.strftime("%Y-%m-%d") if "Date" in df.columns else pd.Series(dtype=str)
+        self.mark_covered(days.value_counts().to_dict(), IMPORT_MODEL, signature)
+        self._set_meta("csv_signature", signature)
+        self.log.info(f"Imported {count} news entries from {csv_path} into {self.db_path}")
+        return count
+
+    def export_csv(self, csv_path: str = None):
+        """Writes the whole store to the CSV file (atomically), sorted by date."""
+        csv_path = csv_path or self.csv_path
+        df = self.window()
+        if df.empty:
+            self.log.warning("No filtered news to export.")
+            return
+
+        tmp_path = f"{csv_path}.{os.getpid()}.tmp"
+        df.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, csv_path)
+        if csv_path == self.csv_path:
+            # The export is not imported back on the next run
+            self._set_meta("csv_signature", self._signature(csv_path))
+        self.log.info(f"Exported {len(df)} filtered news entries to {csv_path}")
+
+
+def article_hashes(df: pd.DataFrame) -> list:
+    """Stable hash of every article of a news DataFrame (its date, source, title and summary)."""
+    if df.empty:
+        return []
+    dates = pd.to_datetime(df["Date"]).dt.strftime(_DATE_FORMAT)
+    keys = zip(dates, df["Source"].fillna("").astype(str), df["Title"].fillna("").astype(str), df["Summary"].fillna("").astype(str))
+    return [hashlib.sha256("\x1f".join(" ".join(part.split()) for part in key).encode("utf-8")).hexdigest()[:32] for key in keys]
@@ -0,0 +1,71 @@
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from Backtest.Scheduler import ProgressTracker
+from LLMAgent.Transport import close_async_sessions
+from Utilities.Logger import logger
+
+
+async def run_dates_async(single_day_backtest_async, date_range, max_concurrency: int = 50, budget=None):
+    """
+    Runs the single-day backtests of all dates concurrently on the running event loop.
+
+    At most `max_concurrency` dates are in flight at any time. Input prompt aggregation is
+    handed to a single background thread: the MacroAggregator keeps the current date as state,
+    so it must not be shared between threads, and the event loop stays free for LLM requests.
+
+    :param single_day_backtest_async: Coroutine function (date, aggregation_executor) -> list of results.
+    :param date_range: Dates to backtest (started in this order).
+    :param max_concurrency: Maximum number of dates in flight.
+    :param budget: Optional UsageBudget; dates not yet started when it would be exceeded are skipped.
+    :return: List of per-date result lists (empty for dates that raised an exception or were skipped).
+    """
+    log = logger(name="AsyncExecution", log_file="Logs/backtest.log")
+    semaphore = asyncio.Semaphore(max_concurrency)
+    tracker = ProgressTracker(total=len(date_range), log=log)
+    in_flight, finished = 0, 0
+    date_finished = asyncio.Event()
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="Aggregation") as aggregation_executor:
+
+        async def run_date(date):
+            nonlocal in_flight, finished
+            async with semaphore:
+                if budget is not None:
+                    # Hold further dates until the first one has finished and gives a per-date cost
+                    while budget.needs_estimate(in_flight, finished):
+                        await date_finished.wait()
+                    # Checked without yielding to the loop, so dates woken together see each other in flight
+                    if not budget.allows(in_flight, finished):
+                        return []
+                in_flight += 1
+                start_time = time.time()
+                try:
+                    result = await single_day_backtest_async(date, aggregation_executor)
+                finally:
+                    in_flight -= 1
+                    finished += 1
+                    date_finished.set()
+                tracker.update(date, time.time() - start_time)
+                return result
+
+        try:
+            outcomes = await asyncio.gather(*(run_date(date) for date in date_range), return_exceptions=True)
+        finally:
+            await close_async_sessions()
+
+    results = []
+    for date, outcome in zip(date_range, outcomes):
+        if isinstance(outcome, BaseException):
+            log.error(f"Backtest failed for date [{date}]: {outcome!r}")
+            results.append([])
+        else:
+            results.append(outcome)
+
+    return results
+
+
+def backtest_async(single_day_backtest_async, date_range, max_concurrency: int = 50, budget=None):
+    """Runs the asyncio execution mode to completion in the current process."""
+    return asyncio.run(run_dates_async(single_day_backtest_async, date_range, max_concurrency=max_concurrency, budget=budget))
@@ -1,13 +1,21 @@
 import pandas as pd
-import multiprocessing
+import asyncio
 import time
 import os
 from datetime import timedelta
+from functools import partial
 
 from Backtest import MacroAggregator
+from Backtest.PromptCorpus import PromptCorpus, aggregate_input_prompt
+from Backtest.AsyncExecution import backtest_async
+from Backtest.Checkpoint import CheckpointStore, completed_result_dates
+from Backtest.Scheduler import DateScheduler, order_dates
+from LLMAgent.ChatHistoryWriter import merge_chat_history
+from LLMAgent.UsageMeter import UsageBudget, usage_tags, summarise_usage, usage_summary_path
 from LLMAgent import TradingAgent, MultiAgentNetwork
 from LLMAgent.InstructionPrompt import *
 from Utilities import logger
+from Utilities.Tracing import span, traced, propagate_context, start_trace, stop_trace, summarise
 
 
 # Single Agent Strategy
@@ -15,8 +23,14 @@ class NewsDrivenStrategy:
 
     def __init__(self, dates: list, filter_agent: bool, chunk_size: int, num_processes: int, asset: str, 
                  ticker: str, lookback_period: int, model_aggregate: str, model_trading: str, trading_system_prompt: bool, 
-                 results_path: str, chat_history_path: str, aggregator: MacroAggregator):
+                 results_path: str, chat_history_path: str, aggregator: MacroAggregator,
+                 prompt_corpus_path: str = None, use_prompt_corpus: bool = False, llm_client: dict = None,
+                 execution_mode: str = "process", max_concurrency: int = 50, checkpoint_path: str = None,
+                 date_ordering: str = "chronological", worker_init: bool = False,
+                 trace_dir: str = None):
         """Initialize the strategy with the given parameters."""
+        # Constructor arguments, so pool workers can rebuild the strategy once instead of receiving it per date
+        self.init_kwargs = {key: value for key, value in locals().items() if key not in ("self", "aggregator")}
         self.asset = asset
         self.ticker = ticker
         self.lookback_period = lookback_period
@@ -29,8 +43,20 @@ class NewsDrivenStrategy:
         self.trading_system_prompt = trading_system_prompt
         self.results_path = results_path
         self.chat_history_path = chat_history_path
+        self.prompt_corpus_path = prompt_corpus_path
+        self.use_prompt_corpus = use_prompt_corpus
+        self.llm_client = llm_client
+        self.execution_mode = execution_mode
+        self.session_policy = (llm_client or {}).get("session_policy", "per_date")
+        self.max_concurrency = max_concurrency
+        self.date_ordering = date_ordering
+        self.worker_init = worker_init
+        self.trace_dir = trace_dir
 
         self.aggregator = aggregator
+        self.prompt_corpus = PromptCorpus(prompt_corpus_path) if prompt_corpus_path else None
+        self.checkpoint_path = checkpoint_path
+        self.checkpoints = CheckpointStore(checkpoint_path) if checkpoint_path else None
 
         self.name = "NewsDrivenAgent"
         self.logger_name = "backtest"
@@ -38,7 +64,14 @@ class NewsDrivenStrategy:
         self.risk_tolerance = "medium"
 
         # Decision making agent for trading
-        self.agent = TradingAgent(
+        self.agent = self._new_agent()
+
+        # Set up logging
+        self.log = logger(name="NewsDrivenStrategy", log_file=f"Logs/backtest.log")
+
+    def _new_agent(self):
+        """Builds a trading agent with a fresh chat history."""
+        return TradingAgent(
             asset=self.asset,
             ticker=self.ticker,
             name=self.name,
@@ -48,90 +81,244 @@ class NewsDrivenStrategy:
             risk_tolerance=self.risk_tolerance,
             has_system_prompt=self.trading_system_prompt,
             chat_history_path=self.chat_history_path,
+            llm_client=self.llm_client,
         )
 
-        # Set up logging
-        self.log = logger(name="NewsDrivenStrategy", log_file=f"Logs/backtest.log")
+    def run_date(self, date):
+        """Run backtest for a single date with the strategy's own aggregator and agent."""
+        return self.single_day_backtest(date, self.lookback_period, self.aggregator, self.filter_agent, self.chunk_size, self.agent)
 
     def single_day_backtest(self, date, lookback_period, aggregator, filter_agent, chunk_size, agent):
         """Run backtest for a single date."""
-        log = logger(name="NewsDrivenStrategy", log_file=f"Logs/backtest.log")
-        results = []
-        
-        # Aggregate data for the current date
-        log.info(f"Running backtest for date: [{date}]")
-
-        # Measure aggregation time
-        log.info(f"Aggregating data for {date.strftime('%Y-%m-%d')}...")
-        aggregation_start_time = time.time()
-        start_date = date - timedelta(days=lookback_period)
-        filter_dates = [start_date + timedelta(days=i) for i in range(lookback_period + 1)]
-
-        aggregator.set_current_date(current_date=date)  # To filter only the current date
-        input_prompt = aggregator.aggregate_all(
-            filter_dates=[filter_dates],
-            filter_agent=filter_agent,
-            chunk_size=chunk_size
-        )
+        with span("date", date=date.strftime("%Y-%m-%d")), usage_tags(date=date.strftime("%Y-%m-%d")):
+            log = logger(name="NewsDrivenStrategy", log_file=f"Logs/backtest.log")
+            results = []
         
-        aggregation_elapsed_time = time.time() - aggregation_start_time
-        log.info(f"Finished aggregating data for {date.strftime('%Y-%m-%d')} (Took {aggregation_elapsed_time:.2f} seconds)")
+            # Aggregate data for the current date
+            log.info(f"Running backtest for date: [{date}]")
 
-        # Get trading decision from the agent
-        start_time = time.time()
+            # Load the materialised prompt, or aggregate data for the current date
+            with span("aggregation"):
+                input_prompt = self.load_prepared_prompt(date, log=log)
+                if input_prompt is None:
+                    input_prompt = aggregate_input_prompt(aggregator, date, lookback_period, filter_agent, chunk_size, log=log)
 
-        # prediction, explanation = "N/A", "N/A" # Debugging purposes
-        prediction, explanation = agent.get_trading_decision(input_prompt)
-        decision = sentiment_to_decision(prediction=prediction)
-        elapsed_time = time.time() - start_time
+            # Start a fresh conversation per date (serial runs reuse the same agent for every date)
+            if self.session_policy == "per_date":
+                agent.reset_session()
 
-        # Log trading decision
-        log.info(f"Prediction: {prediction} | Trading decision {decision} for date: [{date}]")
-        log.info(f"Decision time: {elapsed_time:.2f} seconds for date: [{date}]")
+            # Get trading decision from the agent
+            start_time = time.time()
 
-        # Store backtest results for the current date and chat_history
-        results.append({"Date": date, "Agent": self.name, "Prediction": prediction, "Decision": decision, "Explanation": explanation})
-        agent.save_chat_history(date=date)
+            # prediction, explanation = "N/A", "N/A" # Debugging purposes
+            with span("decision"), usage_tags(phase="decision"):
+                prediction, explanation = agent.get_trading_decision(input_prompt)
+            decision = sentiment_to_decision(prediction=prediction)
+            elapsed_time = time.time() - start_time
+
+            # Log trading decision
+            log.info(f"Prediction: {prediction} | Trading decision {decision} for date: [{date}]")
+            log.info(f"Decision time: {elapsed_time:.2f} seconds for date: [{date}]")
+
+            # Store backtest results for the current date and chat_history
+            results.append({"Date": date, "Agent": self.name, "Prediction": prediction, "Decision": decision, "Explanation": explanation})
+            with span("save"):
+                agent.save_chat_history(date=date)
+                self.save_checkpoint(date, results)
+
+            return results
+
+    async def single_day_backtest_async(self, date, aggregation_executor):
+        """Run backtest for a single date on the event loop (asyncio execution mode)."""
+        with span("date", date=date.strftime("%Y-%m-%d")), usage_tags(date=date.strftime("%Y-%m-%d")):
+            log = logger(name="NewsDrivenStrategy", log_file=f"Logs/backtest.log")
+            results = []
+
+            log.info(f"Running backtest for date: [{date}]")
+
+            # Load the materialised prompt, or aggregate data for the current date in the aggregation thread
+            with span("aggregation"):
+                input_prompt = self.load_prepared_prompt(date, log=log)
+                if input_prompt is None:
+                    input_prompt = await asyncio.get_running_loop().run_in_executor(
+                        aggregation_executor, propagate_context(aggregate_input_prompt),
+                        self.aggregator, date, self.lookback_period, self.filter_agent, self.chunk_size, log,
+                    )
+
+            # Concurrent dates must not share chat histories
+            agent = self._new_agent()
+
+            # Get trading decision from the agent
+            start_time = time.time()
+            with span("decision"), usage_tags(phase="decision"):
+                prediction, explanation = await agent.aget_trading_decision(input_prompt)
+            decision = sentiment_to_decision(prediction=prediction)
+            elapsed_time = time.time() - start_time
 
-        return results
+            # Log trading decision
+            log.info(f"Prediction: {prediction} | Trading decision {decision} for date: [{date}]")
+            log.info(f"Decision time: {elapsed_time:.2f} seconds for date: [{date}]")
+
+            # Store backtest results for the current date and chat_history
+            results.append({"Date": date, "Agent": self.name, "Prediction": prediction, "Decision": decision, "Explanation": explanation})
+            with span("save"):
+                agent.save_chat_history(date=date)
+                self.save_checkpoint(date, results)
 
-    def backtest(self):
-        """Run a backtest over the specified date range with optional multiprocessing."""
+            return results
+
+    def backtest(self, resume: bool = False):
+        """
+        Run a backtest over the specified date range with optional multiprocessing.
+
+        :param resume: Skip the dates already completed in the results file or the checkpoints.
+        """
         open("Logs/backtest.log", "w").close()
         results = []
 
-        date_range = pd.date_range(start=self.dates[0], end=self.dates[1])
-        date_range = date_range[~date_range.weekday.isin([5, 6])] # Decision affects next position
+        # One trace file per run; worker processes inherit it
+        trace_path = start_trace(self.trace_dir) if self.trace_dir else None
 
-        self.log.info(f"Starting backtesting with {self.num_processes} processes and {self.lookback_period} lookback periods")
+        # Cost and token caps of this run (None without caps)
+        budget = UsageBudget.from_config(self.llm_client)
 
-        if self.num_processes == 1:
-            # Serial processing
-            for date in date_range:
-                day_results = self.single_day_backtest(date, self.lookback_period, self.aggregator, self.filter_agent, self.chunk_size, self.agent)
-                results.append(day_results)
+        date_range = self.get_date_range()
+        if resume:
+            date_range, resumed_results = self.resume_dates(date_range)
+            results.append(resumed_results)
+
+        self.log.info(f"Starting backtesting with {self.num_processes} processes ({self.execution_mode} mode, max_concurrency={self.max_concurrency}) and {self.lookback_period} lookback periods")
+        if self.use_prompt_corpus and self.prompt_corpus is not None and not self.prompt_corpus.check_manifest(self.prompt_settings()):
+            raise ValueError(f"Prompt corpus {self.prompt_corpus_path} was prepared with different settings; prepare it again "
+                             f"with --prepare --overwrite, or set use_prompt_corpus to False to aggregate inline")
+
+        if self.execution_mode == "async":
+            # Single process with many dates in flight on one event loop
+            results += backtest_async(self.single_day_backtest_async, order_dates(date_range, self.date_ordering),
+                                      max_concurrency=self.max_concurrency, budget=budget)
         else:
-            # Parallel processing
-            with multiprocessing.Pool(processes=self.num_processes) as pool:
-                results = pool.starmap(self.single_day_backtest, [
-                    (date, self.lookback_period, self.aggregator, self.filter_agent, self.chunk_size, self.agent) 
-                    for date in date_range
-                ])
+            # Serial or parallel processing: dates are handed out one at a time and streamed back as they finish
+            scheduler = DateScheduler(num_processes=self.num_processes, ordering=self.date_ordering, budget=budget)
+            if self.worker_init and self.num_processes > 1:
+                # Each worker builds its own aggregator and agents once; tasks only carry a date
+                runs = scheduler.run(run_worker_date, date_range, initializer=init_strategy_worker,
+                                     initargs=(type(self), self.init_kwargs, self.aggregator.init_kwargs))
+            else:
+                task = partial(self.single_day_backtest, lookback_period=self.lookback_period, aggregator=self.aggregator,
+                               filter_agent=self.filter_agent, chunk_size=self.chunk_size, agent=self.agent)
+                runs = scheduler.run(task, date_range)
+            for date, day_results in runs:
+                results.append(day_results)
 
         # Flatten the list of results and convert to DataFrame
         flat_results = [item for sublist in results for item in sublist]
         results_df = pd.DataFrame(flat_results, columns=["Date", "Agent", "Prediction", "Decision", "Explanation"])
 
         self.save_results(results_df)
+        merge_chat_history(self.chat_history_path, compress=(self.llm_client or {}).get("chat_history_compress", False))
+        self.aggregator.export_news()
+        self.save_usage(budget)
+
+        if trace_path is not None:
+            stop_trace()
+            self.log.info(f"Stage latency breakdown (python Utilities/Tracing.py {trace_path}):\n{summarise(trace_path).to_string()}")
 
         return results_df
     
 
+    def resume_dates(self, date_range):
+        """
+        Splits the date range into the dates still to run and the results of completed dates.
+        A date is completed if every agent has a valid ("Error"-free) prediction in the results file
+        or in its checkpoint; checkpointed results are returned so they reach the results file.
+        """
+        agents = [self.name]
+        done_in_results = completed_result_dates(self.results_path, date_range, agents)
+        done_in_checkpoints = self.checkpoints.completed_dates(date_range, agents) if self.checkpoints else set()
+
+        resumed_results = [result for date in sorted(done_in_checkpoints - done_in_results) for result in self.checkpoints.load(date)]
+        pending = date_range[~date_range.isin(list(done_in_results | done_in_checkpoints))]
+
+        self.log.info(f"Resuming backtest: {len(date_range) - len(pending)} dates already completed "
+                      f"({len(done_in_results)} in results, {len(done_in_checkpoints - done_in_results)} only in checkpoints), {len(pending)} to run")
+        return pending, resumed_results
+
+    def save_usage(self, budget=None):
+        """Writes the token and cost breakdown by date, agent, phase and model next to the results file."""
+        ledger_path = (self.llm_client or {}).get("usage_ledger_path")
+        if not ledger_path or not os.path.exists(ledger_path):
+            return
+
+        summary_path = usage_summary_path(self.results_path)
+        os.makedirs(summary_path.parent, exist_ok=True)
+        summarise_usage(ledger_path).to_csv(summary_path, index=False)
+        if budget is not None:
+            self.log.info(f"Usage of this run: {budget.report()}")
+        self.log.info(f"Usage breakdown saved to {summary_path} (ledger: {ledger_path})")
+
+    @traced("checkpoint")
+    def save_checkpoint(self, date, results):
+        """Durably records the results of a finished date."""
+        if self.checkpoints is not None:
+            self.checkpoints.save(date, results)
+
+    def get_date_range(self):
+        """Backtest dates (weekends are skipped, the decision affects the next position)."""
+        date_range = pd.date_range(start=self.dates[0], end=self.dates[1])
+        return date_range[~date_range.weekday.isin([5, 6])]
+
+    def load_prepared_prompt(self, date, log):
+        """Returns the prompt from the prepared corpus, or None to aggregate inline."""
+        if not self.use_prompt_corpus or self.prompt_corpus is None:
+            return None
+
+        input_prompt = self.prompt_corpus.load(date)
+        if input_prompt is None:
+            log.warning(f"No prepared prompt for {date.strftime('%Y-%m-%d')} in {self.prompt_corpus_path}, aggregating inline")
+        else:
+            log.info(f"Loaded prepared prompt for {date.strftime('%Y-%m-%d')} from {self.prompt_corpus_path}")
+        return input_prompt
+
+    def prepare_prompts(self, overwrite=False):
+        """Materialise the input prompts of the whole backtest date range into the prompt corpus."""
+        if self.prompt_corpus is None:
+            raise ValueError("prompt_corpus_path must be set to prepare prompts")
+
+        return self.prompt_corpus.prepare(
+            aggregator=self.aggregator,
+            date_range=self.get_date_range(),
+            lookback_period=self.lookback_period,
+            filter_agent=self.filter_agent,
+            chunk_size=self.chunk_size,
+            num_processes=self.num_processes,
+            settings=self.prompt_settings(),
+            overwrite=overwrite,
+        )
+
+    def prompt_settings(self):
+        """Aggregation settings that determine the rendered prompts."""
+        return {
+            "asset": self.asset,
+            "lookback_period": self.lookback_period,
+            "filter_agent": self.filter_agent,
+            "chunk_size": self.chunk_size,
+            "last_periods_list": list(self.aggregator.last_periods_list),
+            "news_prefilter": self.aggregator.prefilter.settings if self.aggregator.prefilter is not None else None,
+            "model_aggregate": self.aggregator.model_aggregate,
+            "filter_prompt_version": self.aggregator.agent.prompt_version(),
+            "macro_csv_list": [str(path) for path in self.aggregator.macro_csv_list],
+            "mapping_csv": str(self.aggregator.mapping_csv),
+        }
+
+
     # Concatenate new results to the old results csv (duplicate entries will be replaced)
     def save_results(self, df: pd.DataFrame):
         os.makedirs(os.path.dirname(self.results_path), exist_ok=True)
 
         # Filter out rows where Prediction is "Error"
+        num_errors = int((df["Prediction"] == "Error").sum())
+        if num_errors > 0:
+            self.log.warning(f"Dropping {num_errors} 'Error' predictions (failed LLM calls) from the results")
         df = df[df["Prediction"] != "Error"]
 
         if df.empty:
@@ -164,8 +351,14 @@ class DebateDrivenStrategy:
     def __init__(self, dates: list, filter_agent: bool, chunk_size: int, num_processes: int, 
                  max_rounds: int, asset: str, lookback_period: int, verbose_debate: bool,
                  ticker: str, model_aggregate: str, model_trading: str, trading_system_prompt: bool, 
-                 results_path: str, chat_history_path: str, aggregator: MacroAggregator):
+                 results_path: str, chat_history_path: str, aggregator: MacroAggregator,
+                 prompt_corpus_path: str = None, use_prompt_corpus: bool = False, llm_client: dict = None,
+                 execution_mode: str = "process", max_concurrency: int = 50, checkpoint_path: str = None,
+                 date_ordering: str = "chronological", worker_init: bool = False,
+                 trace_dir: str = None):
         """Initialize the strategy with the given parameters."""
+        # Constructor arguments, so pool workers can rebuild the strategy once instead of receiving it per date
+        self.init_kwargs = {key: value for key, value in locals().items() if key not in ("self", "aggregator")}
         self.asset = asset
         self.ticker = ticker
         self.lookback_period = lookback_period
@@ -180,9 +373,21 @@ class DebateDrivenStrategy:
         self.trading_system_prompt = trading_system_prompt
         self.results_path = results_path
         self.chat_history_path=chat_history_path
+        self.prompt_corpus_path = prompt_corpus_path
+        self.use_prompt_corpus = use_prompt_corpus
+        self.llm_client = llm_client
+        self.execution_mode = execution_mode
+        self.session_policy = (llm_client or {}).get("session_policy", "per_date")
+        self.max_concurrency = max_concurrency
+        self.date_ordering = date_ordering
+        self.worker_init = worker_init
+        self.trace_dir = trace_dir
 
 
         self.aggregator = aggregator
+        self.prompt_corpus = PromptCorpus(prompt_corpus_path) if prompt_corpus_path else None
+        self.checkpoint_path = checkpoint_path
+        self.checkpoints = CheckpointStore(checkpoint_path) if checkpoint_path else None
 
         self.name = ["RiskAverseAgent", "RiskNeutralAgent", "RiskSeekingAgent"]
         self.logger_name = ["backtest", "backtest", "backtest"]
@@ -190,7 +395,14 @@ class DebateDrivenStrategy:
         self.risk_tolerance = ["low", "medium", "high"]
 
         # Decision making agent for trading
-        self.network = MultiAgentNetwork(
+        self.network = self._new_network()
+
+        # Set up logging
+        self.log = logger(name="DebateDrivenStrategy", log_file=f"Logs/backtest.log")
+
+    def _new_network(self):
+        """Builds a multi-agent network whose agents have fresh chat histories."""
+        return MultiAgentNetwork(
             asset=self.asset,
             ticker=self.ticker,
             name=self.name,
@@ -201,77 +413,221 @@ class DebateDrivenStrategy:
             has_system_prompt=self.trading_system_prompt,
             chat_history_path=self.chat_history_path,
             verbose_debate=self.verbose_debate,
+            llm_client=self.llm_client,
         )
 
-        # Set up logging
-        self.log = logger(name="DebateDrivenStrategy", log_file=f"Logs/backtest.log")
+    def run_date(self, date):
+        """Run backtest for a single date with the strategy's own aggregator and agent network."""
+        return self.single_day_backtest(date, self.lookback_period, self.aggregator, self.filter_agent, self.chunk_size, self.network)
 
     def single_day_backtest(self, date, lookback_period, aggregator, filter_agent, chunk_size, network):
         """Run backtest for a single date."""
-        log = logger(name="DebateDrivenStrategy", log_file=f"Logs/backtest.log")
-        results = []
+        with span("date", date=date.strftime("%Y-%m-%d")), usage_tags(date=date.strftime("%Y-%m-%d")):
+            log = logger(name="DebateDrivenStrategy", log_file=f"Logs/backtest.log")
+            results = []
         
-        # Aggregate data for the current date
-        log.info(f"Running backtest for date: [{date}]")
-
-        # Measure aggregation time
-        log.info(f"Aggregating data for {date.strftime('%Y-%m-%d')}...")
-        aggregation_start_time = time.time()
-        start_date = date - timedelta(days=lookback_period)
-        filter_dates = [start_date + timedelta(days=i) for i in range(lookback_period + 1)]
-
-        aggregator.set_current_date(current_date=date)  # To filter only the current date
-        input_prompt = aggregator.aggregate_all(
-            filter_dates=[filter_dates],
-            filter_agent=filter_agent,
-            chunk_size=chunk_size
-        )
-        
-        aggregation_elapsed_time = time.time() - aggregation_start_time
-        log.info(f"Finished aggregating data for {date.strftime('%Y-%m-%d')} (Took {aggregation_elapsed_time:.2f} seconds)")
-
-        # Get trading decision from the agent
-        start_time = time.time()
-        final_opinions = network.get_trading_decision(input_prompt=input_prompt, max_rounds=self.max_rounds)
-
-        elapsed_time = time.time() - start_time
-        log.info(f"Decision time: {elapsed_time:.2f} seconds for date: [{date}]")
-
-        results = self._extract_final_opinions(date=date, final_opinions=final_opinions, log=log)
-        network.save_chat_history(date=date)
-        return results
-
-    def backtest(self):
-        """Run a backtest over the specified date range with optional multiprocessing."""
+            # Aggregate data for the current date
+            log.info(f"Running backtest for date: [{date}]")
+
+            # Load the materialised prompt, or aggregate data for the current date
+            with span("aggregation"):
+                input_prompt = self.load_prepared_prompt(date, log=log)
+                if input_prompt is None:
+                    input_prompt = aggregate_input_prompt(aggregator, date, lookback_period, filter_agent, chunk_size, log=log)
+
+            # Start a fresh conversation per date (serial runs reuse the same network for every date)
+            if self.session_policy == "per_date":
+                network.reset_session()
+
+            # Get trading decision from the agent
+            start_time = time.time()
+            with span("debate"):
+                final_opinions = network.get_trading_decision(input_prompt=input_prompt, max_rounds=self.max_rounds)
+
+            elapsed_time = time.time() - start_time
+            log.info(f"Decision time: {elapsed_time:.2f} seconds for date: [{date}]")
+
+            results = self._extract_final_opinions(date=date, final_opinions=final_opinions, log=log)
+            with span("save"):
+                network.save_chat_history(date=date)
+                self.save_checkpoint(date, results)
+            return results
+
+    async def single_day_backtest_async(self, date, aggregation_executor):
+        """Run backtest for a single date on the event loop (asyncio execution mode)."""
+        with span("date", date=date.strftime("%Y-%m-%d")), usage_tags(date=date.strftime("%Y-%m-%d")):
+            log = logger(name="DebateDrivenStrategy", log_file=f"Logs/backtest.log")
+
+            log.info(f"Running backtest for date: [{date}]")
+
+            # Load the materialised prompt, or aggregate data for the current date in the aggregation thread
+            with span("aggregation"):
+                input_prompt = self.load_prepared_prompt(date, log=log)
+                if input_prompt is None:
+                    input_prompt = await asyncio.get_running_loop().run_in_executor(
+                        aggregation_executor, propagate_context(aggregate_input_prompt),
+                        self.aggregator, date, self.lookback_period, self.filter_agent, self.chunk_size, log,
+                    )
+
+            # Concurrent dates must not share chat histories
+            network = self._new_network()
+
+            # Get trading decision from the agents
+            start_time = time.time()
+            with span("debate"):
+                final_opinions = await network.aget_trading_decision(input_prompt=input_prompt, max_rounds=self.max_rounds)
+
+            elapsed_time = time.time() - start_time
+            log.info(f"Decision time: {elapsed_time:.2f} seconds for date: [{date}]")
+
+            results = self._extract_final_opinions(date=date, final_opinions=final_opinions, log=log)
+            with span("save"):
+                network.save_chat_history(date=date)
+                self.save_checkpoint(date, results)
+            return results
+
+    def backtest(self, resume: bool = False):
+        """
+        Run a backtest over the specified date range with optional multiprocessing.
+
+        :param resume: Skip the dates already completed in the results file or the checkpoints.
+        """
         open("Logs/backtest.log", "w").close()
         results = []
 
-        date_range = pd.date_range(start=self.dates[0], end=self.dates[1])
-        date_range = date_range[~date_range.weekday.isin([4, 5])] # Decision affects next position
+        # One trace file per run; worker processes inherit it
+        trace_path = start_trace(self.trace_dir) if self.trace_dir else None
 
-        self.log.info(f"Starting backtesting with {self.num_processes} processes, {self.lookback_period} lookback periods and verbose_debate={self.verbose_debate}")
+        # Cost and token caps of this run (None without caps)
+        budget = UsageBudget.from_config(self.llm_client)
 
-        if self.num_processes == 1:
-            # Serial processing
-            for date in date_range:
-                day_results = self.single_day_backtest(date, self.lookback_period, self.aggregator, self.filter_agent, self.chunk_size, self.network)
-                results.append(day_results)
+        date_range = self.get_date_range()
+        if resume:
+            date_range, resumed_results = self.resume_dates(date_range)
+            results.append(resumed_results)
+
+        self.log.info(f"Starting backtesting with {self.num_processes} processes ({self.execution_mode} mode, max_concurrency={self.max_concurrency}), {self.lookback_period} lookback periods and verbose_debate={self.verbose_debate}")
+        if self.use_prompt_corpus and self.prompt_corpus is not None and not self.prompt_corpus.check_manifest(self.prompt_settings()):
+            raise ValueError(f"Prompt corpus {self.prompt_corpus_path} was prepared with different settings; prepare it again "
+                             f"with --prepare --overwrite, or set use_prompt_corpus to False to aggregate inline")
+
+        if self.execution_mode == "async":
+            # Single process with many dates and debate rounds in flight on one event loop
+            results += backtest_async(self.single_day_backtest_async, order_dates(date_range, self.date_ordering),
+                                      max_concurrency=self.max_concurrency, budget=budget)
         else:
-            # Parallel processing
-            with multiprocessing.Pool(processes=self.num_processes) as pool:
-                results = pool.starmap(self.single_day_backtest, [
-                    (date, self.lookback_period, self.aggregator, self.filter_agent, self.chunk_size, self.network) 
-                    for date in date_range
-                ])
+            # Serial or parallel processing: dates are handed out one at a time and streamed back as they finish
+            scheduler = DateScheduler(num_processes=self.num_processes, ordering=self.date_ordering, budget=budget)
+            if self.worker_init and self.num_processes > 1:
+                # Each worker builds its own aggregator and agents once; tasks only carry a date
+                runs = scheduler.run(run_worker_date, date_range, initializer=init_strategy_worker,
+                                     initargs=(type(self), self.init_kwargs, self.aggregator.init_kwargs))
+            else:
+                task = partial(self.single_day_backtest, lookback_period=self.lookback_period, aggregator=self.aggregator,
+                               filter_agent=self.filter_agent, chunk_size=self.chunk_size, network=self.network)
+                runs = scheduler.run(task, date_range)
+            for date, day_results in runs:
+                results.append(day_results)
 
         # Flatten the list of results and convert to DataFrame
         flat_results = [item for sublist in results for item in sublist]
         results_df = pd.DataFrame(flat_results, columns=["Date", "Agent", "Prediction", "Decision", "Explanation"])
 
         self.save_results(results_df)
+        merge_chat_history(self.chat_history_path, compress=(self.llm_client or {}).get("chat_history_compress", False))
+        self.aggregator.export_news()
+        self.save_usage(budget)
+
+        if trace_path is not None:
+            stop_trace()
+            self.log.info(f"Stage latency breakdown (python Utilities/Tracing.py {trace_path}):\n{summarise(trace_path).to_string()}")
 
         return results_df
     
+    def resume_dates(self, date_range):
+        """
+        Splits the date range into the dates still to run and the results of completed dates.
+        A date is completed if every agent has a valid ("Error"-free) prediction in the results file
+        or in its checkpoint; checkpointed results are returned so they reach the results file.
+        """
+        agents = list(self.name)
+        done_in_results = completed_result_dates(self.results_path, date_range, agents)
+        done_in_checkpoints = self.checkpoints.completed_dates(date_range, agents) if self.checkpoints else set()
+
+        resumed_results = [result for date in sorted(done_in_checkpoints - done_in_results) for result in self.checkpoints.load(date)]
+        pending = date_range[~date_range.isin(list(done_in_results | done_in_checkpoints))]
+
+        self.log.info(f"Resuming backtest: {len(date_range) - len(pending)} dates already completed "
+                      f"({len(done_in_results)} in results, {len(done_in_checkpoints - done_in_results)} only in checkpoints), {len(pending)} to run")
+        return pending, resumed_results
+
+    def save_usage(self, budget=None):
+        """Writes the token and cost breakdown by date, agent, phase and model next to the results file."""
+        ledger_path = (self.llm_client or {}).get("usage_ledger_path")
+        if not ledger_path or not os.path.exists(ledger_path):
+            return
+
+        summary_path = usage_summary_path(self.results_path)
+        os.makedirs(summary_path.parent, exist_ok=True)
+        summarise_usage(ledger_path).to_csv(summary_path, index=False)
+        if budget is not None:
+            self.log.info(f"Usage of this run: {budget.report()}")
+        self.log.info(f"Usage breakdown saved to {summary_path} (ledger: {ledger_path})")
+
+    @traced("checkpoint")
+    def save_checkpoint(self, date, results):
+        """Durably records the results of a finished date."""
+        if self.checkpoints is not None:
+            self.checkpoints.save(date, results)
+
+    def get_date_range(self):
+        """Backtest dates (Fridays and Saturdays are skipped, the decision affects the next position)."""
+        date_range = pd.date_range(start=self.dates[0], end=self.dates[1])
+        return date_range[~date_range.weekday.isin([4, 5])]
+
+    def load_prepared_prompt(self, date, log):
+        """Returns the prompt from the prepared corpus, or None to aggregate inline."""
+        if not self.use_prompt_corpus or self.prompt_corpus is None:
+            return None
+
+        input_prompt = self.prompt_corpus.load(date)
+        if input_prompt is None:
+            log.warning(f"No prepared prompt for {date.strftime('%Y-%m-%d')} in {self.prompt_corpus_path}, aggregating inline")
+        else:
+            log.info(f"Loaded prepared prompt for {date.strftime('%Y-%m-%d')} from {self.prompt_corpus_path}")
+        return input_prompt
+
+    def prepare_prompts(self, overwrite=False):
+        """Materialise the input prompts of the whole backtest date range into the prompt corpus."""
+        if self.prompt_corpus is None:
+            raise ValueError("prompt_corpus_path must be set to prepare prompts")
+
+        return self.prompt_corpus.prepare(
+            aggregator=self.aggregator,
+            date_range=self.get_date_range(),
+            lookback_period=self.lookback_period,
+            filter_agent=self.filter_agent,
+            chunk_size=self.chunk_size,
+            num_processes=self.num_processes,
+            settings=self.prompt_settings(),
+            overwrite=overwrite,
+        )
+
+    def prompt_settings(self):
+        """Aggregation settings that determine the rendered prompts."""
+        return {
+            "asset": self.asset,
+            "lookback_period": self.lookback_period,
+            "filter_agent": self.filter_agent,
+            "chunk_size": self.chunk_size,
+            "last_periods_list": list(self.aggregator.last_periods_list),
+            "news_prefilter": self.aggregator.prefilter.settings if self.aggregator.prefilter is not None else None,
+            "model_aggregate": self.aggregator.model_aggregate,
+            "filter_prompt_version": self.aggregator.agent.prompt_version(),
+            "macro_csv_list": [str(path) for path in self.aggregator.macro_csv_list],
+            "mapping_csv": str(self.aggregator.mapping_csv),
+        }
+
     def _extract_final_opinions(self, date, final_opinions: dict, log: logger):
 
         results = []
@@ -305,6 +661,9 @@ class DebateDrivenStrategy:
         os.makedirs(os.path.dirname(self.results_path), exist_ok=True)
         
         # Filter out rows where Prediction is "Error"
+        num_errors = int((df["Prediction"] == "Error").sum())
+        if num_errors > 0:
+            self.log.warning(f"Dropping {num_errors} 'Error' predictions (failed LLM calls) from the results")
         df = df[df["Prediction"] != "Error"]
 
         if os.path.exists(self.results_path) and os.path.getsize(self.results_path) > 0:
@@ -326,3 +685,24 @@ class DebateDrivenStrategy:
             df.to_csv(self.results_path, index=False)
             self.log.info(f"Results saved to {self.results_path}")
 
+
+# Strategy of the current pool worker, built once by init_strategy_worker
+_worker_strategy = None
+
+
+def init_strategy_worker(strategy_cls, strategy_kwargs: dict, aggregator_kwargs: dict):
+    """
+    Pool initializer: builds the aggregator and the strategy (with its agents) once per worker process.
+
+    :param strategy_cls: NewsDrivenStrategy or DebateDrivenStrategy.
+    :param strategy_kwargs: Constructor arguments of the strategy (without the aggregator).
+    :param aggregator_kwargs: Constructor arguments of the MacroAggregator.
+    """
+    global _worker_strategy
+    aggregator = MacroAggregator(**aggregator_kwargs)
+    _worker_strategy = strategy_cls(aggregator=aggregator, **strategy_kwargs)
+
+
+def run_worker_date(date):
+    """Pool task: runs a date on the strategy of the current worker."""
+    return _worker_strategy.run_date(date)
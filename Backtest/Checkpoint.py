@@ -0,0 +1,67 @@
+import os
+import json
+import pandas as pd
+from pathlib import Path
+
+from Utilities.Logger import logger
+
+
+class CheckpointStore:
+
+    def __init__(self, checkpoint_path: str):
+        """
+        Durable per-date checkpoints of backtest results.
+
+        Each date is written as its own JSON file (YYYY-MM-DD.json) by the worker as soon as the date
+        finishes, with an atomic rename, so a crash or interruption loses at most the dates in flight.
+
+        :param checkpoint_path: Directory of the checkpoints.
+        """
+        self.checkpoint_path = Path(checkpoint_path)
+        self.log = logger(name="Checkpoint", log_file="Logs/backtest.log")
+
+    def _date_path(self, date):
+        return self.checkpoint_path / f"{pd.Timestamp(date).strftime('%Y-%m-%d')}.json"
+
+    def save(self, date, results: list):
+        """Atomically writes the results of a date."""
+        os.makedirs(self.checkpoint_path, exist_ok=True)
+        records = [{**result, "Date": pd.Timestamp(result["Date"]).isoformat()} for result in results]
+
+        date_path = self._date_path(date)
+        tmp_path = date_path.with_name(f"{date_path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(records, f)
+        os.replace(tmp_path, date_path)
+
+    def load(self, date) -> list:
+        """Returns the checkpointed results of a date (empty if there is none)."""
+        try:
+            with open(self._date_path(date), "r") as f:
+                records = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return []
+        return [{**record, "Date": pd.Timestamp(record["Date"])} for record in records]
+
+    def completed_dates(self, date_range, agents: list) -> set:
+        """Dates whose checkpoint holds a valid prediction of every agent."""
+        return {date for date in date_range if is_complete(self.load(date), agents)}
+
+
+def is_complete(results: list, agents: list) -> bool:
+    """Whether the results hold a non-"Error" prediction of every agent."""
+    valid_agents = {result["Agent"] for result in results if result["Prediction"] != "Error"}
+    return set(agents) <= valid_agents
+
+
+def completed_result_dates(results_path, date_range, agents: list) -> set:
+    """Dates of the date range for which the results file already holds a valid prediction of every agent."""
+    if not os.path.exists(results_path) or os.path.getsize(results_path) == 0:
+        return set()
+
+    results_df = pd.read_csv(results_path)
+    results_df = results_df[results_df["Prediction"] != "Error"]
+    results_df["Date"] = pd.to_datetime(results_df["Date"])
+
+    agents_by_date = results_df.groupby("Date")["Agent"].agg(set)
+    return {date for date in date_range if date in agents_by_date.index and set(agents) <= agents_by_date[date]}
@@ -1,15 +1,23 @@
 import pandas as pd
 import numpy as np
 import random
+import hashlib
+import json
 import textwrap
 import sys
 import os
 from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from Utilities.Logger import logger
+from Utilities.Tracing import traced, propagate_context
+from Utilities.NewsStore import NewsStore, flatten_dates
+from Backtest.NewsPrefilter import NewsPrefilter
+from Backtest.AggregatedNewsStore import AggregatedNewsStore, NEWS_COLUMNS, article_hashes
 from LLMAgent.InstructionPrompt import *
 from LLMAgent import FilterAgent
+from LLMAgent.MacroAgent import match_titles
 from procoder.functional import format_prompt
 from procoder.prompt import NamedBlock
 
@@ -26,16 +34,28 @@ MACROECONOMIC_NEWS_PROMPT = NamedBlock(
     """)
 )
 
+# News block of a window whose days were all filtered without keeping any news
+NO_RELEVANT_NEWS = "No relevant news were selected for this period."
+
 class MacroAggregator:
 
     def __init__(self, news_path: str, prompt_num_relevance: str, asset: str, model_aggregate: str, 
                  aggregate_system_prompt: str, output_path: str, verbose: bool, macro_csv_list: list, 
-                 last_periods_list: list, mapping_csv: str):
+                 last_periods_list: list, mapping_csv: str, llm_client: dict = None, filter_concurrency: int = 4,
+                 prefilter_model: str = "bm25", prefilter_top_k: int = 60, prefilter_vocabulary=None,
+                 news_store_path: str = None):
         """
         Initializes the MacroAggregator.
         
         :param config: An instance of MacroAggregatorConfig containing all parameters.
+        :param filter_concurrency: Maximum number of news chunks filtered by the FilterAgent at the same time.
+        :param prefilter_model: Local relevance ranking ahead of the FilterAgent ("bm25", "tfidf" or None for random chunk sampling).
+        :param prefilter_top_k: Number of top-ranked news passed on to the FilterAgent.
+        :param prefilter_vocabulary: Asset vocabulary of the ranking (list or {term: weight}; None for the rates and bond terms).
+        :param news_store_path: SQLite store of the filtered news (None for a .sqlite file next to output_path).
         """
+        # Constructor arguments, so pool workers can rebuild the aggregator once
+        self.init_kwargs = {key: value for key, value in locals().items() if key != "self"}
         self.news_path = news_path
         self.prompt_num_relevance = prompt_num_relevance
         self.asset = asset
@@ -46,11 +66,18 @@ class MacroAggregator:
         self.macro_csv_list = macro_csv_list
         self.last_periods_list = last_periods_list
         self.mapping_csv = mapping_csv
+        self.llm_client = llm_client
+        self.filter_concurrency = max(int(filter_concurrency), 1)
+        self.prefilter = NewsPrefilter(model=prefilter_model, top_k=prefilter_top_k, asset=asset,
+                                       vocabulary=prefilter_vocabulary) if prefilter_model else None
+        # Filtered news shared by all workers (upserted per day, exported to output_path at the end of a backtest)
+        self.news_store = AggregatedNewsStore.from_output_path(output_path, db_path=news_store_path)
         self.agent = FilterAgent(name="FilterAgent", 
                                  asset=self.asset, 
                                  prompt_num_relevance=self.prompt_num_relevance, 
                                  model=self.model_aggregate,
-                                 has_system_prompt=self.aggregate_system_prompt)
+                                 has_system_prompt=self.aggregate_system_prompt,
+                                 llm_client=self.llm_client)
         
         self.log = logger(name="MacroAggregator", log_file=f"Logs/backtest.log")
 
@@ -58,13 +85,15 @@ class MacroAggregator:
     def set_current_date(self, current_date):
         self.current_date = current_date
 
+    @traced("aggregate_news")
     def aggregate_news(self, filter_dates=None, filter_agent=False, max_retries=3, chunk_size=15):
         """
-        Loads the filtered news CSV and returns entries matching the given list of dates.
-        If filter_agent is True, it calls aggregate_news_llm instead of loading from the file.
+        Loads the filtered news of the given list of dates from the news store. Days of the window that
+        were never filtered (with any model, or imported from the CSV) are filtered first.
+        If filter_agent is True, it calls aggregate_news_llm instead of loading from the store.
 
         :param filter_dates: List of dates to filter the news.
-        :param filter_agent: Flag to control whether to use aggregate_news_llm instead of loading from file.
+        :param filter_agent: Flag to control whether to use aggregate_news_llm instead of loading from the store.
         :param max_retries: Maximum number of retries for failed filtering attempts.
         :param chunk_size: Number of news items to process in each chunk.
         :return: DataFrame containing filtered news for the specified dates.
@@ -74,66 +103,188 @@ class MacroAggregator:
             return self.aggregate_news_llm(filter_dates=filter_dates, max_retries=max_retries, chunk_size=chunk_size)
 
         try:
-            news_chunk, num_news = format_macro_news(csv_file=self.output_path, filter_dates=filter_dates, chunk_size=np.inf)
-            self.log.info(f"Loaded filtered news from {self.output_path}")
+            # Days without coverage are filtered, including those missing from a partially filtered window
+            uncovered = self.uncovered_days(filter_dates, chunk_size=chunk_size, any_version=True)
+            if uncovered:
+                self.log.info(f"{len(uncovered)} days of the window were never filtered ({', '.join(uncovered)}), using aggregate_news_llm...")
+                return self.aggregate_news_llm(filter_dates=filter_dates, max_retries=max_retries, chunk_size=chunk_size, any_version=True)
 
-            # Check if news_chunk is empty or has zero length, use aggregate_news_llm if true
-            if len(news_chunk) == 0:
-                self.log.info("News chunk is empty or has zero length, using aggregate_news_llm...")
-                return self.aggregate_news_llm(filter_dates=filter_dates, max_retries=max_retries, chunk_size=chunk_size)
+            # Indexed date range read
+            df = self.news_store.window(filter_dates)
+            news_chunk, num_news = chunk_news_entries(df, chunk_size=np.inf), len(df)
+            self.log.info(f"Loaded {num_news} filtered news from {self.news_store.db_path}")
 
             return news_chunk, num_news
-        except FileNotFoundError:
-            self.log.warning(f"File not found: {self.output_path}")
         except Exception as e:
-            self.log.error(f"Error loading CSV: {e}")
+            self.log.error(f"Error loading filtered news: {e}")
 
         return pd.DataFrame(), -1
 
 
-    def aggregate_news_llm(self, filter_dates, max_retries=3, chunk_size=15, max_chunks=10):
+    @traced("aggregate_news_llm")
+    def aggregate_news_llm(self, filter_dates, max_retries=3, chunk_size=15, max_chunks=10, any_version=False):
         """
-        Processes and concatenates impactful news for all given dates and saves it as a CSV.
+        Processes and concatenates impactful news for the given dates not covered yet, and upserts it into the news store.
+        Days already filtered with the same model and prompt version (including days without relevant news) are skipped,
+        and articles the FilterAgent already judged with the same model and prompts are taken from the verdict memo.
 
         :param filter_dates: List of dates to filter news.
         :param max_retries: Maximum number of retries for failed filtering attempts.
+        :param chunk_size: Number of news items in each FilterAgent chunk.
+        :param max_chunks: Maximum number of chunks filtered per day.
+        :param any_version: Also skip days filtered with another model or prompt version (or imported from a CSV).
         :return: Concatenated DataFrame of impactful news.
         """
-        all_news = []
-        news_chunks, num_news = format_macro_news(self.news_path, filter_dates=filter_dates, chunk_size=chunk_size)
-
-        # Cap the number of news chunks to reduce LLM load
-        if len(news_chunks) > max_chunks:
-            self.log.warning(f"Capping number of news chunks from {len(news_chunks)} to {max_chunks} to reduce LLM load.")
-            news_chunks = random.sample(news_chunks, max_chunks)
-
-        for i, chunk in enumerate(news_chunks):
-            attempts = 0
-            status_flag = False
-            impactful_news = pd.DataFrame()
-            
-            while attempts < max_retries and not status_flag:
-                impactful_news, status_flag = self.agent.filter_news(chunk)
-                attempts += 1
-                if not status_flag:
-                    self.log.warning(f"Retrying filter_news for chunk {i+1} (Attempt {attempts}/{max_retries})")
-
-                self.log.info(f"Received {len(impactful_news)} impactful news items for chunk {i+1} (Attempt {attempts}/{max_retries})")
-
-            all_news.append(impactful_news)
-
+        version = self.filter_version(chunk_size, max_chunks)
+        days = self.uncovered_days(filter_dates, chunk_size=chunk_size, max_chunks=max_chunks, any_version=any_version)
+        if not days:
+            self.log.info(f"All days of the window were already filtered with {self.model_aggregate} (prompt version {version})")
+            window = self.news_store.window(filter_dates)
+            return (chunk_news_entries(window, chunk_size=1e6), len(window)), 0
+
+        news = NewsStore.from_path(self.news_path).window(days)
+        if self.prefilter is not None and not news.empty:
+            # Rank each uncovered day's news locally; only its top-K candidates (most relevant first) reach the FilterAgent
+            news = pd.concat([self.prefilter.select(day_news) for _, day_news in news.groupby(news["Date"].dt.normalize(), sort=True)])
+        candidates = news.assign(Article=article_hashes(news))
+
+        # Articles already judged with this model and prompt (in another window, chunking or run) are taken from the memo
+        prompt_version = self.agent.prompt_version()
+        memo = self.news_store.verdicts(candidates["Article"].tolist(), self.model_aggregate, prompt_version)
+        judged = candidates["Article"].isin(memo.keys())
+        selected = {article: verdict for article, verdict in memo.items() if verdict[0]}
+        remembered = candidates[candidates["Article"].isin(selected.keys())]
+        remembered = remembered.assign(Title=[selected[article][1] for article in remembered["Article"]],
+                                       Relevance=[selected[article][2] for article in remembered["Article"]])
+        pending = candidates[~judged]
+        if judged.any():
+            self.log.info(f"{judged.sum()} of {len(candidates)} candidate news already judged by the FilterAgent "
+                          f"({len(remembered)} relevant), {len(pending)} left to filter")
+
+        # Chunks hold the news of a single day, so every covered day had its own candidates judged
+        groups = []
+        for day, day_pending in pending.groupby(pending["Date"].dt.normalize(), sort=True):
+            step = len(day_pending) if not np.isfinite(chunk_size) else max(int(chunk_size), 1)
+            day_groups = [day_pending.iloc[i:i + step] for i in range(0, len(day_pending), step)]
+
+            # Cap the number of news chunks per day to reduce LLM load
+            if len(day_groups) > max_chunks:
+                self.log.warning(f"Capping number of news chunks of {day:%Y-%m-%d} from {len(day_groups)} to {max_chunks} to reduce LLM load.")
+                day_groups = day_groups[:max_chunks] if self.prefilter is not None else random.sample(day_groups, max_chunks)
+            groups += day_groups
+        news_chunks = [chunk_news_entries(group, chunk_size=np.inf)[0] for group in groups]
+
+        # Chunks are filtered concurrently, each in its own conversation and with its own retries,
+        # so a day costs about its slowest chunk rather than the sum of all chunks
+        with ThreadPoolExecutor(max_workers=min(self.filter_concurrency, max(len(news_chunks), 1)),
+                                thread_name_prefix="FilterAgent") as executor:
+            futures = [executor.submit(propagate_context(self.filter_chunk), i, chunk, max_retries)
+                       for i, chunk in enumerate(news_chunks)]
+            all_news, status_flags = zip(*[future.result() for future in futures]) if futures else ((), ())
+
+        for i, impactful_news in enumerate(all_news):
             if self.verbose:
                 self.log.info(f"=== News Chunk {i+1} ===")
                 for _, row in impactful_news.iterrows():
                     self.log.info(f"Title: {row['Title']}")
                     self.log.info(f"Relevance: {row['Relevance']}\n")
 
-        new_df = pd.concat(all_news, ignore_index=True) if all_news else pd.DataFrame()
-        self.save_news_chunks(self.output_path, new_df)
+        # Every article of a successfully filtered chunk gets a verdict (failed chunks are judged again next time)
+        verdicts = {}
+        for group, impactful_news, status_flag in zip(groups, all_news, status_flags):
+            if status_flag:
+                verdicts.update(self.chunk_verdicts(group, impactful_news))
+        self.news_store.record_verdicts(verdicts, self.model_aggregate, prompt_version)
+
+        frames = [frame for frame in (remembered[NEWS_COLUMNS], *all_news) if not frame.empty]
+        new_df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        self.save_news(new_df)
+
+        # Days are only covered once every chunk was filtered successfully (failed days are retried on the next run)
+        if all(status_flags):
+            kept = pd.to_datetime(new_df["Date"]).dt.strftime("%Y-%m-%d").value_counts() if not new_df.empty else pd.Series(dtype=int)
+            self.news_store.mark_covered({day: kept.get(day, 0) for day in days}, self.model_aggregate, version)
+        else:
+            self.log.warning(f"Filtering failed for {len(status_flags) - sum(status_flags)} chunks; {len(days)} days stay uncovered")
+
+        window = self.news_store.window(filter_dates)
+        return (chunk_news_entries(window, chunk_size=1e6), len(window)), len(new_df)
+
+
+    def filter_chunk(self, i, chunk, max_retries=3):
+        """
+        Filters one news chunk with a fresh FilterAgent conversation, retrying failed attempts.
+
+        :param i: Index of the chunk (for logging).
+        :param chunk: Formatted news entries of the chunk.
+        :param max_retries: Maximum number of attempts.
+        :return: DataFrame of the impactful news of the chunk (empty if all attempts failed) and whether an attempt succeeded.
+        """
+        agent = self.agent.new_session()
+        attempts = 0
+        status_flag = False
+        impactful_news = pd.DataFrame()
+
+        while attempts < max_retries and not status_flag:
+            impactful_news, status_flag = agent.filter_news(chunk)
+            attempts += 1
+            if not status_flag:
+                self.log.warning(f"Retrying filter_news for chunk {i+1} (Attempt {attempts}/{max_retries})")
+
+            self.log.info(f"Received {len(impactful_news)} impactful news items for chunk {i+1} (Attempt {attempts}/{max_retries})")
 
-        return format_macro_news(self.output_path, filter_dates=filter_dates, chunk_size=1e6), len(new_df)
+        return impactful_news, status_flag
 
+    @staticmethod
+    def chunk_verdicts(group, impactful_news) -> dict:
+        """
+        FilterAgent verdict of every article of a filtered chunk.
+
+        :param group: News of the chunk, with an Article (hash) column.
+        :param impactful_news: News selected by the FilterAgent (titles as returned by the LLM).
+        :return: {article hash: (selected, Title, Relevance)}.
+        """
+        verdicts = {article: (False, None, None) for article in group["Article"]}
+        if impactful_news.empty:
+            return verdicts
+
+        # Same one-to-one title matching as the FilterAgent's own extraction
+        relevance = dict(zip(impactful_news["Title"], impactful_news["Relevance"]))
+        assignment = match_titles(group["Title"].astype(str).tolist(), list(relevance))
+        articles = group["Article"].tolist()
+        for i, title in assignment.items():
+            verdicts[articles[i]] = (True, title, relevance[title])
+        return verdicts
+
+    def filter_version(self, chunk_size=15, max_chunks=10) -> str:
+        """Version of the news filtering of a day: the FilterAgent prompts, the prefilter and the chunking."""
+        settings = {
+            "prompt": self.agent.prompt_version(),
+            "prefilter": self.prefilter.settings if self.prefilter is not None else None,
+            "chunk_size": chunk_size,
+            "max_chunks": max_chunks,
+        }
+        return hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:12]
+
+    def uncovered_days(self, filter_dates, chunk_size=15, max_chunks=10, any_version=False) -> list:
+        """
+        Days of the window (YYYY-MM-DD) that still need to be filtered.
 
+        :param filter_dates: List of dates (None for every day of the news file).
+        :param any_version: Accept days filtered with any model or prompt version (or imported from a CSV).
+        """
+        if filter_dates:
+            days = sorted({pd.Timestamp(date).strftime("%Y-%m-%d") for date in flatten_dates(filter_dates)})
+        else:
+            days = sorted(NewsStore.from_path(self.news_path).frame["Date"].dt.strftime("%Y-%m-%d").unique())
+
+        if any_version:
+            covered = self.news_store.covered_days(days)
+        else:
+            covered = self.news_store.covered_days(days, self.model_aggregate, self.filter_version(chunk_size, max_chunks))
+        return [day for day in days if day not in covered]
+
+    @traced("aggregate_indicators")
     def aggregate_indicators(self):
         """
         Aggregates macro indicators based on the initialized parameters.
@@ -150,6 +301,7 @@ class MacroAggregator:
         return combined_indicator_text
 
 
+    @traced("aggregate_all")
     def aggregate_all(self, filter_dates=None, filter_agent=False, max_retries=3, chunk_size=15):
         """
         Combines macro indicators and filtered news into a single aggregated output.
@@ -165,7 +317,9 @@ class MacroAggregator:
         
         # Aggregate news using LLM
         news_chunk, num_news = self.aggregate_news(filter_dates=filter_dates, filter_agent=filter_agent, max_retries=max_retries, chunk_size=chunk_size)
-        news_text = format_prompt(MACROECONOMIC_NEWS_PROMPT,{"current_date": self.current_date, "news_chunk": news_chunk[0]})
+        # A window covered without any relevant news (or a failed load) has no chunk
+        news_text = format_prompt(MACROECONOMIC_NEWS_PROMPT,{"current_date": self.current_date,
+                                                             "news_chunk": news_chunk[0] if len(news_chunk) else NO_RELEVANT_NEWS})
 
         # Combine both aggregations
         aggregated_output = f"Macro Indicators:\n{indicator_text}\n\n{news_text}"
@@ -175,37 +329,24 @@ class MacroAggregator:
         return aggregated_output
 
 
-    def save_news_chunks(self, output_path, new_df):
+    @traced("save_news")
+    def save_news(self, new_df):
         """
-        Saves the filtered news to the specified output_path. If a file already exists, it merges new entries,
-        removes duplicates, and updates the file. Handles potential format mismatches during merging.
+        Upserts the filtered news into the news store, in a single transaction keyed by
+        (Date, Source, Title), so concurrent workers never overwrite each other's rows.
 
-        :param output_path: Path to the output CSV file.
         :param new_df: DataFrame containing the newly filtered news.
         """
-        if os.path.exists(output_path):
-            try:
-                existing_df = pd.read_csv(output_path)
-                self.log.info(f"Loaded existing news data from {output_path}.")
-            except Exception as e:
-                self.log.error(f"Error loading existing CSV: {e}")
-                existing_df = pd.DataFrame()
-        else:
-            existing_df = pd.DataFrame()
+        if new_df.empty:
+            self.log.warning("No filtered news to save.")
+            return
 
-        try:
-            # Attempt to merge new and existing data, remove duplicates
-            combined_df = pd.concat([existing_df, new_df], ignore_index=True).drop_duplicates()
-        except Exception as e:
-            self.log.error(f"Error merging new and existing news data: {e}")
-            self.log.warning("Saving only the new filtered news instead.")
-            combined_df = new_df  # Fall back to saving only the new data
+        count = self.news_store.upsert(new_df)
+        self.log.info(f"Saved {count} filtered news to {self.news_store.db_path}.")
 
-        if not combined_df.empty:
-            combined_df.to_csv(output_path, index=False)
-            self.log.info(f"Updated filtered news saved to {output_path}.")
-        else:
-            self.log.warning("No filtered news to save.")
+    def export_news(self):
+        """Writes the news store to output_path (CSV), once the backtest has finished."""
+        self.news_store.export_csv(self.output_path)
 
 
 log = logger(name="FileChecker", log_file=f"Logs/backtest.log")
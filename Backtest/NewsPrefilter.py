@@ -0,0 +1,141 @@
+import re
+import numpy as np
+import pandas as pd
+
+from Utilities.Logger import logger
+
+
+PREFILTER_MODELS = ("bm25", "tfidf")
+
+# Terms that signal relevance for rates and bond markets (the asset's own words are added to them)
+DEFAULT_VOCABULARY = {
+    "treasury": 2.0, "treasuries": 2.0, "bond": 2.0, "bonds": 2.0, "yield": 2.0, "yields": 2.0,
+    "fed": 2.0, "fomc": 2.0, "powell": 1.5, "rate": 1.5, "rates": 1.5, "hike": 1.5, "hikes": 1.5,
+    "cut": 1.5, "cuts": 1.5, "inflation": 2.0, "cpi": 2.0, "pce": 1.5, "deflation": 1.0,
+    "payrolls": 1.5, "jobs": 1.0, "unemployment": 1.5, "labor": 1.0, "wages": 1.0,
+    "gdp": 1.5, "recession": 1.5, "growth": 1.0, "curve": 1.0, "duration": 1.0, "debt": 1.0,
+    "deficit": 1.0, "auction": 1.5, "issuance": 1.0, "qt": 1.0, "balance": 0.5, "sheet": 0.5,
+    "central": 0.5, "bank": 0.5, "monetary": 1.0, "policy": 0.5, "tightening": 1.0, "easing": 1.0,
+    "dollar": 0.5, "ecb": 1.0, "boj": 1.0,
+}
+
+_TOKEN_PATTERN = r"[a-z0-9]+"
+_STOPWORDS = {"us", "the", "of", "and", "etf", "a", "an", "in", "on", "for", "to", "year"}
+
+
+def tokenize(text: str) -> list:
+    """Lower-cased alphanumeric tokens of a text."""
+    return re.findall(_TOKEN_PATTERN, str(text).lower())
+
+
+class NewsPrefilter:
+
+    def __init__(self, model: str = "bm25", top_k: int = 60, asset: str = "", vocabulary=None,
+                 title_weight: float = 2.0, k1: float = 1.5, b: float = 0.75):
+        """
+        Local lexical relevance ranking of the news ahead of the FilterAgent.
+
+        The day's news (Title and Summary) are scored against an asset vocabulary with BM25 or
+        TF-IDF cosine similarity, computed column-wise over a sparse (document, term) count table,
+        and only the top-K candidates are sent to the LLM. The ranking is deterministic: ties are
+        broken by date, then title.
+
+        :param model: "bm25" or "tfidf".
+        :param top_k: Number of news passed on to the FilterAgent.
+        :param asset: Asset name; its words are added to the vocabulary.
+        :param vocabulary: Query terms, as a list or a {term: weight} dict (default: rates and bond terms).
+        :param title_weight: Times a title counts relative to the summary.
+        :param k1: BM25 term frequency saturation.
+        :param b: BM25 document length normalisation.
+        """
+        if model not in PREFILTER_MODELS:
+            raise ValueError(f"Unknown prefilter model '{model}', expected one of {PREFILTER_MODELS}")
+
+        self.model = model
+        self.top_k = int(top_k)
+        self.title_weight = title_weight
+        self.k1 = k1
+        self.b = b
+
+        vocabulary = DEFAULT_VOCABULARY if vocabulary is None else vocabulary
+        if not isinstance(vocabulary, dict):
+            vocabulary = {term: 1.0 for term in vocabulary}
+
+        # Multi-word entries ("interest rate") contribute each of their words
+        self.vocabulary = {}
+        for term, weight in vocabulary.items():
+            for token in tokenize(term):
+                self.vocabulary[token] = max(self.vocabulary.get(token, 0.0), float(weight))
+        for token in tokenize(asset):
+            if token not in _STOPWORDS:
+                self.vocabulary.setdefault(token, 1.0)
+
+        self.log = logger(name="NewsPrefilter", log_file="Logs/backtest.log")
+
+    @property
+    def settings(self) -> dict:
+        """Settings that determine the selection (recorded in the prompt corpus manifest)."""
+        return {"model": self.model, "top_k": self.top_k, "title_weight": self.title_weight,
+                "k1": self.k1, "b": self.b, "vocabulary": dict(sorted(self.vocabulary.items()))}
+
+    def _term_counts(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Long (doc, term, count) table of the weighted title and summary tokens."""
+        frames = []
+        for column, weight in (("Title", self.title_weight), ("Summary", 1.0)):
+            tokens = df[column].fillna("").astype(str).str.lower().str.findall(_TOKEN_PATTERN)
+            exploded = tokens.explode().dropna()
+            frames.append(pd.DataFrame({"doc": exploded.index.to_numpy(), "term": exploded.to_numpy(), "count": weight}))
+        terms = pd.concat(frames, ignore_index=True)
+        return terms.groupby(["doc", "term"], sort=False, as_index=False)["count"].sum()
+
+    def score(self, df: pd.DataFrame) -> np.ndarray:
+        """Relevance score of every row of the news DataFrame."""
+        num_docs = len(df)
+        if num_docs == 0:
+            return np.zeros(0)
+
+        df = df.reset_index(drop=True)
+        counts = self._term_counts(df)
+        doc_length = counts.groupby("doc")["count"].sum().reindex(range(num_docs), fill_value=0.0).to_numpy()
+        doc_frequency = counts.groupby("term")["doc"].nunique()
+
+        query = counts[counts["term"].isin(self.vocabulary.keys())]
+        if query.empty:
+            return np.zeros(num_docs)
+        query_weight = query["term"].map(self.vocabulary).to_numpy()
+        query_df = query["term"].map(doc_frequency).to_numpy()
+        docs = query["doc"].to_numpy()
+        tf = query["count"].to_numpy()
+
+        if self.model == "bm25":
+            idf = np.log(1.0 + (num_docs - query_df + 0.5) / (query_df + 0.5))
+            average_length = max(doc_length.mean(), 1e-9)
+            norm = self.k1 * (1.0 - self.b + self.b * doc_length[docs] / average_length)
+            contributions = query_weight * idf * tf * (self.k1 + 1.0) / (tf + norm)
+        else:
+            # Cosine of the log-scaled TF-IDF document vector with the weighted query vector
+            all_idf = np.log((1.0 + num_docs) / (1.0 + doc_frequency)) + 1.0
+            doc_weights = (1.0 + np.log(counts["count"].to_numpy())) * counts["term"].map(all_idf).to_numpy()
+            doc_norm = np.sqrt(np.bincount(counts["doc"].to_numpy(), weights=doc_weights ** 2, minlength=num_docs))
+            query_norm = np.sqrt(sum(weight ** 2 for weight in self.vocabulary.values()))
+            contributions = (1.0 + np.log(tf)) * query["term"].map(all_idf).to_numpy() * query_weight
+            contributions = contributions / (np.maximum(doc_norm[docs], 1e-9) * query_norm)
+
+        return np.bincount(docs, weights=contributions, minlength=num_docs)
+
+    def select(self, df: pd.DataFrame, top_k: int = None) -> pd.DataFrame:
+        """
+        Top-K news of the DataFrame by relevance, most relevant first (a Score column is added).
+
+        :param df: News with Date, Title and Summary columns.
+        :param top_k: Number of news to keep (default: the configured top_k).
+        """
+        top_k = self.top_k if top_k is None else int(top_k)
+        ranked = df.assign(Score=self.score(df))
+        ranked = ranked.sort_values(["Score", "Date", "Title"], ascending=[False, True, True], kind="mergesort")
+        selected = ranked.head(top_k)
+
+        if len(df) > len(selected):
+            self.log.info(f"Prefilter ({self.model}) kept {len(selected)} of {len(df)} news "
+                          f"(score cut-off {selected['Score'].iloc[-1] if len(selected) else 0:.3f})")
+        return selected
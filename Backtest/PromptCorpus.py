@@ -0,0 +1,184 @@
+import os
+import gzip
+import json
+import time
+import multiprocessing
+import pandas as pd
+from datetime import timedelta
+from pathlib import Path
+
+from Utilities.Logger import logger
+
+
+def aggregate_input_prompt(aggregator, date, lookback_period, filter_agent, chunk_size, log=None):
+    """
+    Renders the aggregated input prompt (macro indicators and lookback news) for a single date.
+
+    :param aggregator: MacroAggregator used to build the prompt.
+    :param date: Backtest date.
+    :param lookback_period: Number of lookback days for macro news.
+    :param filter_agent: Whether to use the FilterAgent for news filtering.
+    :param chunk_size: Number of news items in each FilterAgent chunk.
+    :return: The aggregated input prompt.
+    """
+    log = log or logger(name="PromptCorpus", log_file="Logs/backtest.log")
+
+    # Measure aggregation time
+    log.info(f"Aggregating data for {date.strftime('%Y-%m-%d')}...")
+    aggregation_start_time = time.time()
+    start_date = date - timedelta(days=lookback_period)
+    filter_dates = [start_date + timedelta(days=i) for i in range(lookback_period + 1)]
+
+    aggregator.set_current_date(current_date=date)  # To filter only the current date
+    input_prompt = aggregator.aggregate_all(
+        filter_dates=[filter_dates],
+        filter_agent=filter_agent,
+        chunk_size=chunk_size
+    )
+
+    aggregation_elapsed_time = time.time() - aggregation_start_time
+    log.info(f"Finished aggregating data for {date.strftime('%Y-%m-%d')} (Took {aggregation_elapsed_time:.2f} seconds)")
+
+    return input_prompt
+
+
+class PromptCorpus:
+
+    def __init__(self, corpus_path: str):
+        """
+        Compressed, date-keyed corpus of materialised input prompts.
+
+        Each date is stored as its own gzip file (YYYY-MM-DD.txt.gz), so the prepare stage can be run
+        in parallel without locking and the backtest can read a single date without touching the rest.
+        A manifest records the aggregation settings the corpus was rendered with.
+
+        :param corpus_path: Directory of the prompt corpus.
+        """
+        self.corpus_path = Path(corpus_path)
+        self.manifest_path = self.corpus_path / "manifest.json"
+        self.log = logger(name="PromptCorpus", log_file="Logs/backtest.log")
+
+    def _date_path(self, date):
+        return self.corpus_path / f"{pd.Timestamp(date).strftime('%Y-%m-%d')}.txt.gz"
+
+    def has(self, date) -> bool:
+        return self._date_path(date).exists()
+
+    def load(self, date):
+        """Returns the materialised prompt for the given date, or None if it has not been prepared."""
+        try:
+            with gzip.open(self._date_path(date), "rt", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def save(self, date, input_prompt: str):
+        """Atomically writes the prompt for the given date."""
+        os.makedirs(self.corpus_path, exist_ok=True)
+        date_path = self._date_path(date)
+        tmp_path = date_path.with_name(f"{date_path.name}.{os.getpid()}.tmp")
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            f.write(input_prompt)
+        os.replace(tmp_path, date_path)
+
+    def load_manifest(self) -> dict:
+        if not self.manifest_path.exists():
+            return {}
+        with open(self.manifest_path, "r") as f:
+            return json.load(f)
+
+    def check_manifest(self, settings: dict) -> bool:
+        """
+        Whether the corpus was rendered with the given aggregation settings (always True for a corpus
+        without prepared dates). Settings missing on either side count as different.
+        """
+        manifest = self.load_manifest()
+        if not manifest.get("dates"):
+            return True
+        manifest_settings = manifest.get("settings", {})
+        settings = _json_settings(settings)
+        mismatched = {key: (manifest_settings.get(key), settings.get(key)) for key in sorted(set(manifest_settings) | set(settings))
+                      if manifest_settings.get(key) != settings.get(key)}
+        if mismatched:
+            self.log.warning(f"Prompt corpus {self.corpus_path} was prepared with different settings (corpus, config): {mismatched}")
+        return not mismatched
+
+    def prepare(self, aggregator, date_range, lookback_period: int, filter_agent: bool, chunk_size: int,
+                num_processes: int = 1, settings: dict = None, overwrite: bool = False):
+        """
+        Renders the aggregated input prompts for a whole date range into the corpus.
+
+        :param aggregator: MacroAggregator used to build the prompts.
+        :param date_range: Dates to prepare.
+        :param num_processes: Number of parallel worker processes.
+        :param settings: Aggregation settings recorded in the manifest.
+        :param overwrite: Re-render dates that already exist in the corpus (required when the settings changed).
+        :return: Dictionary of prepare stage statistics.
+        :raises ValueError: If the corpus was prepared with other settings and overwrite is False.
+        """
+        settings = _json_settings(settings)
+        settings_changed = not self.check_manifest(settings)
+        if settings_changed and not overwrite:
+            raise ValueError(f"Prompt corpus {self.corpus_path} was prepared with different settings; "
+                             f"prepare it again with overwrite (--overwrite) to re-render every date")
+
+        pending = [date for date in date_range if overwrite or not self.has(date)]
+        self.log.info(f"Preparing {len(pending)} prompts ({len(date_range) - len(pending)} already in corpus) with {num_processes} processes")
+
+        start_time = time.time()
+        tasks = [(date, lookback_period, filter_agent, chunk_size) for date in pending]
+        if num_processes == 1:
+            _init_prepare_worker(aggregator, self.corpus_path)
+            elapsed = [_prepare_single_date(task) for task in tasks]
+        else:
+            with multiprocessing.Pool(processes=num_processes, initializer=_init_prepare_worker,
+                                      initargs=(aggregator, self.corpus_path)) as pool:
+                elapsed = list(pool.imap_unordered(_prepare_single_date, tasks))
+
+        aggregator.export_news()
+
+        total_time = time.time() - start_time
+        stats = {
+            "num_prepared": len(pending),
+            "total_seconds": round(total_time, 3),
+            "dates_per_second": round(len(pending) / total_time, 3) if total_time > 0 else None,
+            "mean_seconds_per_date": round(sum(elapsed) / len(elapsed), 3) if elapsed else None,
+        }
+
+        manifest = self.load_manifest()
+        prepared = {pd.Timestamp(date).strftime("%Y-%m-%d") for date in pending}
+        if settings_changed:
+            # Prompts of other dates were rendered with the old settings: the manifest only certifies the new ones
+            for stale in set(manifest.get("dates", [])) - prepared:
+                self._date_path(stale).unlink(missing_ok=True)
+            self.log.warning(f"Prompt corpus settings changed: re-rendered {len(prepared)} dates, removed the other prompts")
+            manifest["dates"] = []
+        manifest["settings"] = settings
+        manifest["dates"] = sorted(set(manifest.get("dates", [])) | prepared)
+        manifest["last_prepare"] = stats
+        os.makedirs(self.corpus_path, exist_ok=True)
+        with open(self.manifest_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+
+        self.log.info(f"Prepared {stats['num_prepared']} prompts in {stats['total_seconds']:.2f} seconds ({stats['dates_per_second']} dates/sec)")
+        return stats
+
+
+def _json_settings(settings: dict) -> dict:
+    """Settings in their JSON form, as stored in the manifest (tuples become lists, paths strings)."""
+    return json.loads(json.dumps(settings or {}, sort_keys=True, default=str))
+
+
+# Per-process state of the prepare stage workers (the aggregator is sent once per worker, not per date)
+_prepare_state = {}
+
+def _init_prepare_worker(aggregator, corpus_path):
+    _prepare_state["aggregator"] = aggregator
+    _prepare_state["corpus"] = PromptCorpus(corpus_path)
+
+def _prepare_single_date(task):
+    date, lookback_period, filter_agent, chunk_size = task
+    start_time = time.time()
+    input_prompt = aggregate_input_prompt(_prepare_state["aggregator"], date, lookback_period, filter_agent, chunk_size)
+    _prepare_state["corpus"].save(date, input_prompt)
+    return time.time() - start_time
@@ -0,0 +1,164 @@
+import time
+import random
+import threading
+import multiprocessing
+from collections import deque
+from datetime import timedelta
+
+from Utilities.Logger import logger
+
+
+DATE_ORDERINGS = ("chronological", "newest_first", "random")
+
+
+def order_dates(date_range, ordering: str = "chronological", seed: int = None):
+    """
+    Orders the dates in which they are handed out to the workers.
+
+    :param date_range: Dates to backtest.
+    :param ordering: "chronological", "newest_first" or "random".
+    :param seed: Seed of the random ordering.
+    :return: List of dates.
+    """
+    if ordering not in DATE_ORDERINGS:
+        raise ValueError(f"Unknown date ordering '{ordering}', expected one of {DATE_ORDERINGS}")
+
+    dates = sorted(date_range)
+    if ordering == "newest_first":
+        dates.reverse()
+    elif ordering == "random":
+        random.Random(seed).shuffle(dates)
+    return dates
+
+
+class ProgressTracker:
+
+    def __init__(self, total: int, window: int = 20, log=None):
+        """
+        Progress and ETA of a backtest, from the rolling completion rate and per-date latency of
+        the last `window` dates.
+
+        :param total: Number of dates to run.
+        :param window: Number of recent dates the rates are computed over.
+        """
+        self.total = total
+        self.completed = 0
+        self.start_time = time.time()
+        self.completion_times = deque([self.start_time], maxlen=window + 1)
+        self.latencies = deque(maxlen=window)
+        self.log = log or logger(name="Scheduler", log_file="Logs/backtest.log")
+
+    def update(self, date, elapsed: float = None):
+        """Records a finished date and logs the progress line."""
+        now = time.time()
+        self.completed += 1
+        self.completion_times.append(now)
+        if elapsed is not None:
+            self.latencies.append(elapsed)
+
+        # Rolling throughput covers parallel workers; per-date latency is what a single date costs
+        window_seconds = self.completion_times[-1] - self.completion_times[0]
+        dates_per_second = (len(self.completion_times) - 1) / window_seconds if window_seconds > 0 else None
+        remaining = self.total - self.completed
+        eta = str(timedelta(seconds=round(remaining / dates_per_second))) if dates_per_second else "unknown"
+        latency = f"{sum(self.latencies) / len(self.latencies):.1f}s/date" if self.latencies else "n/a"
+        rate = f"{dates_per_second * 60:.2f} dates/min" if dates_per_second else "n/a"
+
+        self.log.info(f"Progress: {self.completed}/{self.total} ({100 * self.completed / max(self.total, 1):.1f}%) "
+                      f"| finished {date.strftime('%Y-%m-%d')} | {rate} | rolling latency {latency} | ETA {eta}")
+
+
+class DateScheduler:
+
+    def __init__(self, num_processes: int, ordering: str = "chronological", max_pending: int = None, seed: int = None,
+                 budget=None):
+        """
+        Hands backtest dates out to a worker pool one at a time and streams back each result as
+        soon as its date finishes (no up-front chunking, so one slow date never holds up others).
+
+        :param num_processes: Number of worker processes (1 runs the dates inline).
+        :param ordering: Order in which dates are handed out ("chronological", "newest_first" or "random").
+        :param max_pending: Maximum number of dates handed out but not finished (default: twice the workers).
+        :param seed: Seed of the random ordering.
+        :param budget: Optional UsageBudget; no new dates are handed out once it would be exceeded.
+        """
+        self.num_processes = num_processes
+        self.ordering = ordering
+        self.max_pending = max_pending or 2 * num_processes
+        self.seed = seed
+        self.budget = budget
+        self.log = logger(name="Scheduler", log_file="Logs/backtest.log")
+
+    def run(self, task, date_range, initializer=None, initargs=()):
+        """
+        Runs `task(date)` for every date and yields (date, result) in completion order.
+
+        :param task: Picklable callable taking a date and returning its result.
+        :param date_range: Dates to run.
+        :param initializer: Optional worker initializer (called once per worker process).
+        :param initargs: Arguments of the initializer.
+        """
+        dates = order_dates(date_range, self.ordering, self.seed)
+        tracker = ProgressTracker(total=len(dates), log=self.log)
+        self.log.info(f"Scheduling {len(dates)} dates ({self.ordering}) on {self.num_processes} processes")
+
+        if self.num_processes == 1:
+            if initializer is not None:
+                initializer(*initargs)
+            for date in dates:
+                if self.budget is not None and not self.budget.allows(in_flight=0, completed=tracker.completed):
+                    return
+                date, result, elapsed = _run_task((task, date))
+                tracker.update(date, elapsed)
+                yield date, result
+            return
+
+        # The feeder blocks once max_pending dates are out, so dates are handed out as workers free up
+        pending = threading.BoundedSemaphore(self.max_pending)
+        stopped = threading.Event()
+
+        finished = threading.Event()
+        handed_out = 0
+
+        def feeder():
+            nonlocal handed_out
+            for date in dates:
+                pending.acquire()
+                if stopped.is_set():
+                    return
+                if self.budget is not None:
+                    # Hold further dates until the first one has finished and gives a per-date cost
+                    while not stopped.is_set() and self.budget.needs_estimate(handed_out - tracker.completed, tracker.completed):
+                        finished.wait(timeout=1.0)
+                    if stopped.is_set() or not self.budget.allows(handed_out - tracker.completed, tracker.completed):
+                        return
+                handed_out += 1
+                yield task, date
+
+        with multiprocessing.Pool(processes=self.num_processes, initializer=initializer, initargs=initargs) as pool:
+            try:
+                for date, result, elapsed in pool.imap_unordered(_run_task, feeder(), chunksize=1):
+                    pending.release()
+                    tracker.update(date, elapsed)
+                    finished.set()
+                    yield date, result
+            finally:
+                # Unblock the feeder if the run is interrupted, so the pool can shut down
+                stopped.set()
+                finished.set()
+                for _ in range(self.max_pending):
+                    try:
+                        pending.release()
+                    except ValueError:
+                        break
+
+            # Shut the workers down cleanly so their chat history writers flush
+            pool.close()
+            pool.join()
+
+
+def _run_task(task_and_date):
+    task, date = task_and_date
+    start_time = time.time()
+    result = task(date)
+    return date, result, time.time() - start_time
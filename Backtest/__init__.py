@@ -1,4 +1,10 @@
+from .NewsPrefilter import NewsPrefilter
+from .AggregatedNewsStore import AggregatedNewsStore
 from .MacroAggregate import MacroAggregator, check_file_paths
+from .PromptCorpus import PromptCorpus
+from .AsyncExecution import backtest_async
+from .Checkpoint import CheckpointStore
+from .Scheduler import DateScheduler
 from .BacktestStrategies import NewsDrivenStrategy, DebateDrivenStrategy
 from .BondBacktest import BondBacktest
 from .ETFBacktest import ETFBacktest
@@ -6,6 +12,12 @@ from .ETFBacktest import ETFBacktest
 __all__ = [
     "MacroAggregator",
     "check_file_paths",
+    "NewsPrefilter",
+    "AggregatedNewsStore",
+    "PromptCorpus",
+    "backtest_async",
+    "CheckpointStore",
+    "DateScheduler",
     "NewsDrivenStrategy",
     "DebateDrivenStrategy",
     "BondBacktest",
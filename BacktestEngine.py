@@ -7,10 +7,13 @@ from dataclasses import dataclass, field
 from Backtest import MacroAggregator, check_file_paths
 from Backtest import NewsDrivenStrategy, DebateDrivenStrategy
 from LLMAgent.InstructionPrompt import *
+from LLMAgent.ResponseCache import ResponseCache
+from LLMAgent.Transport import Transport
+from LLMAgent.RateLimiter import RateLimiter
 from DataPipeline import write_mapping
 from Utilities import BacktestConfigurationLoader, filter_valid_kwargs
 
-def main(multi_agent: bool, config_path: str):
+def main(multi_agent: bool, config_path: str, prepare: bool = False, resume: bool = False, overwrite: bool = False):
 
     ##################################### Load Backtest Configuration #####################################
     backtest_config_loader = BacktestConfigurationLoader(config_path=config_path)
@@ -28,12 +31,25 @@ def main(multi_agent: bool, config_path: str):
 
     if not backtest_config_loader.multi_agent:
       strategy_kwargs = filter_valid_kwargs(NewsDrivenStrategy, backtest_config)
-      news_driven_strategy = NewsDrivenStrategy(aggregator=aggregator, **strategy_kwargs)
-      backtest_results = news_driven_strategy.backtest()
+      strategy = NewsDrivenStrategy(aggregator=aggregator, **strategy_kwargs)
     else:
       strategy_kwargs = filter_valid_kwargs(DebateDrivenStrategy, backtest_config)
-      debate_driven_strategy = DebateDrivenStrategy(aggregator=aggregator, **strategy_kwargs)
-      backtest_results = debate_driven_strategy.backtest()
+      strategy = DebateDrivenStrategy(aggregator=aggregator, **strategy_kwargs)
+
+    if prepare:
+      # Materialise the input prompts only (no trading LLM calls)
+      strategy.prepare_prompts(overwrite=overwrite)
+    else:
+      backtest_results = strategy.backtest(resume=resume)
+
+    response_cache = ResponseCache.from_config(getattr(backtest_config_loader, "llm_client", None))
+    if response_cache is not None:
+      strategy.log.info(f"LLM response cache statistics: {response_cache.stats()}")
+    transport = Transport.from_config(getattr(backtest_config_loader, "llm_client", None))
+    strategy.log.info(f"LLM transport statistics (main process): {transport.stats()}")
+    rate_limiter = RateLimiter.from_config(getattr(backtest_config_loader, "llm_client", None))
+    if rate_limiter is not None:
+      strategy.log.info(f"LLM rate limiter state: {rate_limiter.stats()}")
     ##################################### Strategy Backtest #####################################
 
 
@@ -41,9 +57,12 @@ if __name__ == "__main__":
   parser = argparse.ArgumentParser(description="Run Explainable Macro Strategy Backtest")
   parser.add_argument("-m", "--multi-agent", action="store_true", default=False, help="Run Multi-Agent Backtest Strategy")
   parser.add_argument("-c", "--config", type=str, required=True, help="Path to the configuration file (YAML)")
+  parser.add_argument("-p", "--prepare", action="store_true", default=False, help="Only render the input prompts into the prompt corpus")
+  parser.add_argument("-o", "--overwrite", action="store_true", default=False, help="With --prepare, re-render prompts already in the corpus")
+  parser.add_argument("-r", "--resume", action="store_true", default=False, help="Skip dates already completed in the results file or checkpoints")
   args = parser.parse_args()
 
-  main(multi_agent=args.multi_agent, config_path=args.config)
+  main(multi_agent=args.multi_agent, config_path=args.config, prepare=args.prepare, resume=args.resume, overwrite=args.overwrite)
 
 
 
@@ -0,0 +1,277 @@
+import os
+import json
+import time
+import queue
+import yaml
+import random
+import shutil
+import socket
+import argparse
+import resource
+import subprocess
+import multiprocessing
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from datetime import datetime, timezone
+
+from Backtest import MacroAggregator, NewsDrivenStrategy, DebateDrivenStrategy
+from DataPipeline import write_mapping
+from Utilities import filter_valid_kwargs, logger
+from Utilities.MockLLMServer import MockLLMServer
+from Utilities.Tracing import summarise, latest_trace
+from LLMAgent.UsageMeter import read_ledger
+
+
+# Stages reported for every scenario (spans of the run's trace), in pipeline order
+STAGES = ("date", "aggregation", "filter_news", "decision", "constructive_speech", "cross_examination",
+          "reflection", "llm_call", "parse", "save")
+
+
+def stage_summary(trace_path) -> dict:
+    """Number of spans and p50/p95 latency (seconds) of each stage of a trace."""
+    summary = summarise(trace_path)
+    return {stage: {"calls": int(summary.loc[stage, "count"]),
+                    "p50_seconds": float(summary.loc[stage, "p50_seconds"]),
+                    "p95_seconds": float(summary.loc[stage, "p95_seconds"])}
+            for stage in STAGES if stage in summary.index}
+
+
+def usage_summary(ledger_path, num_dates: int) -> dict:
+    """Tokens and cost per date of a scenario, from its usage ledger."""
+    records, _ = read_ledger(ledger_path)
+    return {
+        "tokens_per_date": round(int(records["total_tokens"].sum()) / max(num_dates, 1), 1),
+        "cached_tokens_share": round(int(records["cached_tokens"].sum()) / max(int(records["prompt_tokens"].sum()), 1), 4),
+        "cost_per_date": round(float(records["cost"].sum()) / max(num_dates, 1), 6),
+    }
+
+
+def make_synthetic_data(data_root: str, start_date: str, num_days: int, news_per_day: int, seed: int = 0) -> Path:
+    """
+    Writes a synthetic news table, macro indicator tables and indicator mapping in the layout of
+    DataPipeline/Data (ProcessedData and MacroIndicators).
+
+    :param data_root: Directory of the synthetic data.
+    :param start_date: First day of news and indicators.
+    :param num_days: Number of days covered.
+    :param news_per_day: Number of news articles per day.
+    :param seed: Seed of the generated values and headlines.
+    :return: Path to the data root.
+    """
+    data_root = Path(data_root)
+    processed_path = data_root / "ProcessedData"
+    indicator_path = data_root / "MacroIndicators"
+    os.makedirs(processed_path, exist_ok=True)
+    os.makedirs(indicator_path, exist_ok=True)
+
+    write_mapping(folder_path=indicator_path)
+    mapping = pd.read_csv(indicator_path / "indicator_mapping.csv")
+    rng = np.random.default_rng(seed)
+    random_state = random.Random(seed)
+
+    # Indicators start a year earlier so every date has its last periods available
+    steps = {"Daily": "1D", "Weekly": "7D", "Monthly": "MS", "Quarterly": "QS"}
+    for frequency, step in steps.items():
+        dates = pd.date_range(pd.Timestamp(start_date) - pd.DateOffset(years=1),
+                              end=pd.Timestamp(start_date) + pd.Timedelta(days=num_days), freq=step)
+        df = pd.DataFrame({"Date": dates.strftime("%Y-%m-%d")})
+        for series in mapping.loc[mapping["Trade Frequency"] == frequency, "Series ID"]:
+            df[series] = rng.normal(100, 10, len(dates)).round(3)
+        df.to_csv(processed_path / f"MacroIndicator{frequency}.csv", index=False)
+
+    words = ("fed treasury yield inflation cpi payrolls stocks rally oil opec china tariffs earnings "
+             "bond auction powell rate hike cut dollar recession housing credit spreads").split()
+    rows = []
+    for day in range(num_days):
+        date = pd.Timestamp(start_date) + pd.Timedelta(days=day)
+        for i in range(news_per_day):
+            timestamp = date + pd.Timedelta(minutes=random_state.randint(0, 24 * 60 - 1))
+            rows.append({
+                "Date": timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+                "Title": f"{' '.join(random_state.choices(words, k=7)).title()} {day}-{i}",
+                "Summary": " ".join(random_state.choices(words, k=40)),
+                "Source": random_state.choice(["Reuters", "CNBC", "Benzinga", "Bloomberg"]),
+                "Topics": "economy_macro",
+            })
+    pd.DataFrame(rows).sort_values("Date").to_csv(processed_path / "MacroNews.csv", index=False)
+    return data_root
+
+
+def scenario_config(scenario: dict, defaults: dict, data_root: Path, data_start: str, run_dir: Path, base_url: str) -> dict:
+    """Flat backtest configuration of a scenario (the defaults, overridden by the scenario)."""
+    config = {**defaults, **scenario}
+    config["llm_client"] = {**defaults.get("llm_client", {}), **scenario.get("llm_client", {})}
+    num_agents = 3 if config["multi_agent"] else 1
+
+    # The first backtest date has a full lookback window of synthetic news
+    start_date = pd.Timestamp(data_start) + pd.Timedelta(days=config["lookback_period"])
+    end_date = start_date + pd.Timedelta(days=config["num_days"] - 1)
+
+    config.update({
+        "dates": [start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")],
+        "news_path": data_root / "ProcessedData" / "MacroNews.csv",
+        "output_path": run_dir / "AggregatedNews.csv",
+        "macro_csv_list": [data_root / "ProcessedData" / f"MacroIndicator{frequency}.csv"
+                           for frequency in ("Daily", "Weekly", "Monthly", "Quarterly")],
+        "mapping_csv": data_root / "MacroIndicators" / "indicator_mapping.csv",
+        "results_path": run_dir / "Results.csv",
+        "chat_history_path": run_dir / "ChatHistory" / "chat_history.json",
+        "checkpoint_path": run_dir / "Checkpoints",
+        "trace_dir": run_dir / "Traces",
+        "llm_client": {**config.get("llm_client", {}), "base_url": base_url, "usage_ledger_path": str(run_dir / "Usage.jsonl")},
+    })
+
+    if config["multi_agent"]:
+        config["model_trading"] = [config["model_trading"]] * num_agents
+        config["trading_system_prompt"] = [config["trading_system_prompt"]] * num_agents
+    return config
+
+
+def run_scenario(config: dict, run_dir: Path, results_queue):
+    """Runs one scenario in its own process, so its peak RSS is measured in isolation."""
+    aggregator = MacroAggregator(**filter_valid_kwargs(MacroAggregator, config))
+    strategy_cls = DebateDrivenStrategy if config["multi_agent"] else NewsDrivenStrategy
+    strategy = strategy_cls(aggregator=aggregator, **filter_valid_kwargs(strategy_cls, config))
+    num_dates = len(strategy.get_date_range())
+
+    start_time = time.perf_counter()
+    strategy.backtest()
+    elapsed = time.perf_counter() - start_time
+
+    # ru_maxrss is in kilobytes on Linux; children are the pool workers
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    peak_worker_rss_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+    results_queue.put({
+        "num_dates": num_dates,
+        "elapsed_seconds": round(elapsed, 3),
+        "dates_per_second": round(num_dates / elapsed, 4) if elapsed > 0 else None,
+        "stages": stage_summary(latest_trace(config["trace_dir"])),
+        **usage_summary(config["llm_client"]["usage_ledger_path"], num_dates),
+        "peak_rss_mb": round(peak_rss_mb, 1),
+        "peak_worker_rss_mb": round(peak_worker_rss_mb, 1),
+    })
+
+
+def git_revision() -> dict:
+    """Commit the benchmark ran on (and whether the tree had uncommitted changes)."""
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    try:
+        sha = subprocess.run(["git", "rev-parse", "HEAD"], cwd=repo_dir, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=repo_dir,
+                                    capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        sha, dirty = "unknown", False
+    return {"git_sha": sha, "git_dirty": dirty}
+
+
+def compare(records: list, baseline_sha: str, output_path: Path, log):
+    """Logs the change of throughput and stage p95 latencies against the latest run of a baseline commit."""
+    if not output_path.exists():
+        log.warning(f"No previous benchmark results in {output_path}")
+        return
+
+    with open(output_path, "r") as f:
+        previous = [json.loads(line) for line in f if line.strip()]
+
+    for record in records:
+        baseline = [r for r in previous if r["git_sha"].startswith(baseline_sha) and r["scenario"] == record["scenario"]]
+        if not baseline:
+            log.warning(f"No run of scenario '{record['scenario']}' at commit {baseline_sha}")
+            continue
+        baseline = baseline[-1]
+
+        def change(new, old):
+            return f"{100 * (new - old) / old:+.1f}%" if new is not None and old else "n/a"
+
+        log.info(f"[{record['scenario']}] dates/sec {baseline['dates_per_second']} -> {record['dates_per_second']} "
+                 f"({change(record['dates_per_second'], baseline['dates_per_second'])})")
+        for stage, stats in record["stages"].items():
+            old = baseline["stages"].get(stage, {}).get("p95_seconds")
+            log.info(f"[{record['scenario']}]   {stage} p95 {old} -> {stats['p95_seconds']}s ({change(stats['p95_seconds'], old)})")
+
+
+def main(config_path: str, scenario_names: list = None, baseline_sha: str = None):
+    with open(config_path, "r") as f:
+        config = yaml.safe_load(f)
+    settings = config["benchmark"]
+    log = logger(name="Benchmark", log_file="Logs/benchmark.log")
+
+    work_dir = Path(settings["work_dir"])
+    output_path = Path(settings["output_path"])
+    data_root = make_synthetic_data(work_dir / "Data", **config["synthetic_data"])
+    revision = git_revision()
+
+    scenarios = [s for s in config["scenarios"] if not scenario_names or s["name"] in scenario_names]
+
+    records = []
+    for scenario in scenarios:
+        run_dir = work_dir / "Runs" / scenario["name"]
+        shutil.rmtree(run_dir, ignore_errors=True)
+        os.makedirs(run_dir)
+
+        # A fresh mock server per scenario, so the call counts are the scenario's own
+        with MockLLMServer(**filter_valid_kwargs(MockLLMServer, {**settings, **scenario})) as server:
+            scenario_kwargs = scenario_config(scenario, config["defaults"], data_root, config["synthetic_data"]["start_date"],
+                                              run_dir, server.base_url)
+            log.info(f"Running scenario '{scenario['name']}'...")
+
+            results_queue = multiprocessing.Queue()
+            process = multiprocessing.Process(target=run_scenario, args=(scenario_kwargs, run_dir, results_queue))
+            process.start()
+            result = None
+            while result is None and (process.is_alive() or not results_queue.empty()):
+                try:
+                    result = results_queue.get(timeout=1.0)
+                except queue.Empty:
+                    pass
+            process.join()
+            server_stats = server.stats()
+
+        if result is None:
+            log.error(f"Scenario '{scenario['name']}' failed (exit code {process.exitcode}), see Logs/backtest.log")
+            continue
+
+        record = {
+            "scenario": scenario["name"],
+            **revision,
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "host": socket.gethostname(),
+            "parameters": {key: scenario_kwargs[key] for key in ("multi_agent", "num_processes", "execution_mode", "max_concurrency",
+                                                                 "max_rounds", "chunk_size", "filter_concurrency", "prefilter_model", "prefilter_top_k", "lookback_period", "filter_agent", "dates")},
+            "structured_output": scenario_kwargs["llm_client"].get("structured_output", False),
+            "format_error_rate": server.format_error_rate,
+            **result,
+            "llm_calls": server_stats["requests"],
+            "llm_calls_per_date": round(server_stats["requests"] / max(result["num_dates"], 1), 2),
+            "llm_calls_by_phase": server_stats["phases"],
+            "llm_errors": server_stats["errors_429"] + server_stats["errors_5xx"],
+        }
+        records.append(record)
+        log.info(f"[{record['scenario']}] {record['num_dates']} dates in {record['elapsed_seconds']}s "
+                 f"({record['dates_per_second']} dates/sec, {record['llm_calls_per_date']} LLM calls/date, "
+                 f"{record['tokens_per_date']} tokens/date, ${record['cost_per_date']}/date, "
+                 f"peak RSS {record['peak_rss_mb']} MB, workers {record['peak_worker_rss_mb']} MB)")
+        for stage, stats in record["stages"].items():
+            log.info(f"[{record['scenario']}]   {stage}: {stats['calls']} calls, p50 {stats['p50_seconds']}s, p95 {stats['p95_seconds']}s")
+
+    if baseline_sha:
+        compare(records, baseline_sha, output_path, log)
+
+    os.makedirs(output_path.parent, exist_ok=True)
+    with open(output_path, "a") as f:
+        for record in records:
+            f.write(json.dumps(record, default=str) + "\n")
+    log.info(f"Benchmark results appended to {output_path}")
+    return records
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the backtest pipeline against a local mock LLM server")
+    parser.add_argument("-c", "--config", type=str, default="benchmark_config.yaml", help="Path to the benchmark configuration file (YAML)")
+    parser.add_argument("-s", "--scenario", type=str, nargs="*", default=None, help="Names of the scenarios to run (default: all)")
+    parser.add_argument("--compare", type=str, default=None, help="Git commit (prefix) whose latest results to compare against")
+    args = parser.parse_args()
+
+    main(config_path=args.config, scenario_names=args.scenario, baseline_sha=args.compare)
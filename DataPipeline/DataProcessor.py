@@ -1,7 +1,14 @@
 import os
+import shutil
 import pandas as pd
 import sys
 
+# Optional dependency: only needed to write the partitioned Parquet layout
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from Utilities.Logger import logger
 
@@ -154,3 +161,25 @@ class DataProcessor:
         df.to_csv(output_file_path, index=False)
         self.log.info(f"Processed data saved to {output_file_path}")
 
+    def save_partitioned_data(self, df, dataset_name="processed_data.parquet", partition_column="Date"):
+        """
+        Save the processed data as a Parquet dataset partitioned by calendar day, so readers can
+        memory-map it and select a date window without parsing the full CSV.
+        """
+        if pyarrow is None:
+            self.log.warning(f"pyarrow is not installed, skipping partitioned dataset {dataset_name}")
+            return
+
+        os.makedirs(self.output_folder_path, exist_ok=True)
+        output_path = os.path.join(self.output_folder_path, dataset_name)
+        staging_path = f"{output_path}.tmp"
+        shutil.rmtree(staging_path, ignore_errors=True)
+
+        df = df.dropna(subset=[partition_column]).copy()
+        df["Day"] = df[partition_column].dt.strftime("%Y-%m-%d")
+        df.to_parquet(staging_path, partition_cols=["Day"], index=False)
+
+        # Swap the new dataset in place so readers never see a half-written directory
+        shutil.rmtree(output_path, ignore_errors=True)
+        os.replace(staging_path, output_path)
+        self.log.info(f"Partitioned data saved to {output_path}")
@@ -5,20 +5,32 @@ import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from Utilities.Logger import logger
 from DataPipeline.DataProcessor import DataProcessor
+from DataPipeline.NearDuplicate import NearDuplicateCollapser
 
 class NewsDataProcessor(DataProcessor):
-    def __init__(self, folder_path, output_folder_path, log_file):
-        """Initialize the FiscalDataProcessor with specific column configurations."""
+    def __init__(self, folder_path, output_folder_path, log_file, near_duplicate_threshold=0.8, near_duplicate_max_hours=48):
+        """
+        Initialize the FiscalDataProcessor with specific column configurations.
+
+        :param near_duplicate_threshold: Jaccard similarity above which articles count as near-duplicates (None to keep them).
+        :param near_duplicate_max_hours: Maximum time between two near-duplicates.
+        """
         super().__init__(
             folder_path=folder_path,
             output_folder_path=output_folder_path,
             log_file=log_file,
             date_column="time_published",
             date_format="%Y%m%dT%H%M%S",
-            columns_to_keep=["time_published", "title", "summary", "source", "topics"],
+            columns_to_keep=["time_published", "title", "summary", "source", "topics", "duplicates"],
             rename_columns={"time_published": "Date"}
         )
 
+        # Syndicated wire stories with small wording changes are collapsed into one article
+        self.near_duplicates = NearDuplicateCollapser(
+            threshold=near_duplicate_threshold, max_time_gap_hours=near_duplicate_max_hours,
+            date_column=self.date_column, log=self.log,
+        ) if near_duplicate_threshold is not None else None
+
         # self.prefixes = ["fiscal", "monetary", "macro", "financial_markets", "finance"]
         self.prefixes = ["fiscal", "monetary", "macro"]
         self.output_file = "MacroNews"
@@ -32,12 +44,20 @@ class NewsDataProcessor(DataProcessor):
         df = super().read_and_concatenate_csvs(csv_files)
         df = super().remove_duplicates(df, macro_news=True)
         df = super().handle_missing_dates(df)
+        df = self.collapse_near_duplicates(df)
         df = super().process_columns(df)
         super().save_processed_data(df, filename=f"{self.output_file}.csv")
+        super().save_partitioned_data(df, dataset_name=f"{self.output_file}.parquet", partition_column="Date")
         super().find_missing_date_ranges(df)
         
         return df
 
+    def collapse_near_duplicates(self, df):
+        """Keeps one representative of every cluster of near-identical articles, with its duplicate count."""
+        if self.near_duplicates is None:
+            return df.assign(duplicates=0)
+        return self.near_duplicates.collapse(df)
+
 class IndicatorDataProcessor(DataProcessor):
     def __init__(self, frequency, folder_path, output_folder_path, log_file):
 
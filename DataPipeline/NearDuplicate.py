@@ -0,0 +1,180 @@
+import numpy as np
+import pandas as pd
+
+from Utilities.Logger import logger
+
+
+# Mersenne-like prime above 2**32: (a * x + b) of 32-bit values never overflows uint64 before the modulo
+_PRIME = np.uint64(4294967311)
+_MAX_HASH = np.uint64(4294967311)
+
+
+class NearDuplicateCollapser:
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 128, shingle_size: int = 3,
+                 max_time_gap_hours: float = 48, text_columns=("title", "summary"), date_column: str = "time_published",
+                 seed: int = 1, batch_size: int = 200_000, log=None):
+        """
+        Collapses near-duplicate news (syndicated wire stories with small wording changes) into one
+        representative per cluster.
+
+        Each article is reduced to a MinHash signature of its word shingles; locality-sensitive
+        hashing over bands of the signatures proposes candidate pairs in roughly linear time, and
+        candidates are only merged if their estimated Jaccard similarity reaches the threshold and
+        they were published within the time gap. The earliest article of a cluster is kept, with
+        the number of collapsed copies in a "duplicates" column.
+
+        :param threshold: Minimum estimated Jaccard similarity of the shingle sets of two duplicates.
+        :param num_perm: Number of MinHash permutations (signature length).
+        :param shingle_size: Number of consecutive words per shingle.
+        :param max_time_gap_hours: Maximum time between two duplicates (None for no limit).
+        :param text_columns: Columns whose text is compared.
+        :param date_column: Publication time column (parsed datetimes).
+        :param seed: Seed of the hash permutations (the result is deterministic for a given seed).
+        :param batch_size: Number of shingles hashed at once (bounds memory use).
+        """
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.max_time_gap = pd.Timedelta(hours=max_time_gap_hours) if max_time_gap_hours is not None else None
+        self.text_columns = list(text_columns)
+        self.date_column = date_column
+        self.batch_size = batch_size
+        self.bands, self.rows = optimal_bands(threshold, num_perm)
+
+        random_state = np.random.RandomState(seed)
+        self._a = random_state.randint(1, 2**32, size=num_perm, dtype=np.uint64)
+        self._b = random_state.randint(0, 2**32, size=num_perm, dtype=np.uint64)
+        self.log = log or logger(name="NearDuplicate", log_file="Logs/news_data_processor.log")
+
+    def shingles(self, df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+        """
+        32-bit hashes of the word shingles of every article.
+
+        :return: Shingle hashes and the article index of each hash (sorted by article).
+        """
+        text = df[self.text_columns[0]].fillna("").astype(str)
+        for column in self.text_columns[1:]:
+            text = text + " " + df[column].fillna("").astype(str)
+        tokens = text.str.lower().str.findall(r"[a-z0-9]+").explode().dropna()
+        docs = tokens.index.to_numpy()
+        ids = pd.factorize(tokens.to_numpy())[0].astype(np.uint64)
+
+        # Combine k consecutive token ids of the same article into one value, then mix it down to 32 bits
+        k = self.shingle_size
+        if len(ids) >= k:
+            valid = docs[:len(ids) - k + 1] == docs[k - 1:]
+            values = np.zeros(len(ids) - k + 1, dtype=np.uint64)
+            for offset in range(k):
+                values = values * np.uint64(1_000_003) + ids[offset:len(ids) - k + 1 + offset]
+            shingle_docs, shingle_values = docs[:len(ids) - k + 1][valid], values[valid]
+        else:
+            shingle_docs, shingle_values = docs[:0], ids[:0]
+
+        # Articles shorter than a shingle are represented by their words
+        short = np.setdiff1d(np.unique(docs), np.unique(shingle_docs))
+        if len(short):
+            in_short = np.isin(docs, short)
+            shingle_docs = np.concatenate([shingle_docs, docs[in_short]])
+            shingle_values = np.concatenate([shingle_values, ids[in_short]])
+
+        with np.errstate(over="ignore"):
+            hashes = (shingle_values * np.uint64(0x9E3779B97F4A7C15)) >> np.uint64(32)
+        order = np.argsort(shingle_docs, kind="stable")
+        return hashes[order], shingle_docs[order]
+
+    def signatures(self, num_docs: int, hashes: np.ndarray, docs: np.ndarray) -> np.ndarray:
+        """MinHash signatures (num_docs x num_perm); articles without text keep the maximum value."""
+        signatures = np.full((num_docs, self.num_perm), _MAX_HASH, dtype=np.uint64)
+        for start in range(0, len(hashes), self.batch_size):
+            batch_hashes, batch_docs = hashes[start:start + self.batch_size], docs[start:start + self.batch_size]
+            permuted = (batch_hashes[:, None] * self._a[None, :] + self._b[None, :]) % _PRIME
+            boundaries = np.flatnonzero(np.r_[True, batch_docs[1:] != batch_docs[:-1]])
+            minima = np.minimum.reduceat(permuted, boundaries, axis=0)
+            batch_doc_ids = batch_docs[boundaries]
+            signatures[batch_doc_ids] = np.minimum(signatures[batch_doc_ids], minima)
+        return signatures
+
+    def clusters(self, df: pd.DataFrame) -> np.ndarray:
+        """Cluster label (index of the cluster's first article) of every row of the DataFrame."""
+        df = df.reset_index(drop=True)
+        num_docs = len(df)
+        hashes, docs = self.shingles(df)
+        signatures = self.signatures(num_docs, hashes, docs)
+        has_text = np.zeros(num_docs, dtype=bool)
+        has_text[docs] = True
+        times = pd.to_datetime(df[self.date_column]).to_numpy() if self.date_column in df.columns else None
+
+        parent = np.arange(num_docs)
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        # Without any text there is nothing to compare: every article is its own cluster
+        text_docs = np.flatnonzero(has_text)
+        if len(text_docs) == 0:
+            return np.arange(num_docs)
+
+        # Articles sharing all rows of a band are candidates; each is checked against the first one of its bucket
+        candidates = set()
+        for band in range(self.bands):
+            band_rows = np.ascontiguousarray(signatures[text_docs, band * self.rows:(band + 1) * self.rows])
+            _, buckets = np.unique(band_rows.view(np.dtype((np.void, band_rows.dtype.itemsize * self.rows))).ravel(), return_inverse=True)
+            order = np.argsort(buckets, kind="stable")
+            sorted_buckets = buckets[order]
+            heads = np.r_[True, sorted_buckets[1:] != sorted_buckets[:-1]]
+            head_of = text_docs[order][np.maximum.accumulate(np.where(heads, np.arange(len(order)), 0))]
+            members = text_docs[order]
+            pairs = ~heads
+            candidates.update(zip(head_of[pairs].tolist(), members[pairs].tolist()))
+
+        # Verify all candidates at once: estimated Jaccard similarity and publication time gap
+        pairs = np.array(sorted(candidates), dtype=np.int64).reshape(-1, 2)
+        accepted = (signatures[pairs[:, 0]] == signatures[pairs[:, 1]]).mean(axis=1) >= self.threshold
+        if self.max_time_gap is not None and times is not None:
+            accepted &= np.abs(times[pairs[:, 0]] - times[pairs[:, 1]]) <= self.max_time_gap.to_timedelta64()
+
+        merged = 0
+        for i, j in pairs[accepted].tolist():
+            root_i, root_j = find(i), find(j)
+            if root_i != root_j:
+                parent[max(root_i, root_j)] = min(root_i, root_j)
+                merged += 1
+
+        self.log.info(f"MinHash/LSH ({self.bands} bands x {self.rows} rows): {len(candidates)} candidate pairs, {merged} merges")
+        return np.array([find(i) for i in range(num_docs)])
+
+    def collapse(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Keeps the earliest article of every near-duplicate cluster.
+
+        :param df: News DataFrame with the text and date columns.
+        :return: DataFrame of the representatives, with a "duplicates" column (number of collapsed copies).
+        """
+        if df.empty:
+            return df.assign(duplicates=0)
+
+        initial_count = len(df)
+        df = df.sort_values(self.date_column, kind="stable").reset_index(drop=True)
+        labels = self.clusters(df)
+
+        cluster_sizes = pd.Series(labels).value_counts()
+        representatives = df[labels == np.arange(len(df))].copy()
+        representatives["duplicates"] = cluster_sizes.reindex(representatives.index).fillna(1).astype(int).to_numpy() - 1
+        representatives = representatives.reset_index(drop=True)
+
+        self.log.info(f"Near-duplicate collapsing: {initial_count} -> {len(representatives)} articles "
+                      f"({initial_count - len(representatives)} near-duplicates removed)")
+        return representatives
+
+
+def optimal_bands(threshold: float, num_perm: int) -> tuple[int, int]:
+    """
+    LSH bands and rows per band for a similarity threshold: the (b, r) with b * r <= num_perm whose
+    S-curve midpoint (1/b)^(1/r) is closest to the threshold, preferring more bands (higher recall).
+    """
+    options = [(bands, num_perm // bands) for bands in range(1, num_perm + 1) if num_perm // bands >= 1]
+    return min(options, key=lambda option: (abs((1 / option[0]) ** (1 / option[1]) - threshold), -option[0]))
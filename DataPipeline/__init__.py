@@ -2,6 +2,7 @@ from .CensusScraper import CensusDataScraper
 from .FredScraper import FredDataScraper
 from .AlphaVantageScraper import AlphaVantageScraper
 from .MacroProcessor import NewsDataProcessor, IndicatorDataProcessor
+from .NearDuplicate import NearDuplicateCollapser
 from .Config import SplitTime as splittime
 from .Data.MacroIndicators.IndicatorMapping import write_mapping
 
@@ -11,6 +12,7 @@ __all__ = [
     "AlphaVantageScraper",
     "NewsDataProcessor",
     "IndicatorDataProcessor",
+    "NearDuplicateCollapser",
     "splittime",
     "write_mapping",
 ]
\ No newline at end of file
@@ -1,12 +1,20 @@
 import ollama
 import subprocess
+import copy
 import time
+import asyncio
 import pandas as pd
 import requests
 import json
 import sys
 import os
 
+# Optional dependency: only needed for the asyncio execution mode
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
 from procoder.functional import format_prompt
 from procoder.prompt import NamedBlock, Collection
 
@@ -15,11 +23,21 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from Utilities.Logger import logger
 from LLMAgent.InstructionPrompt import *
+from LLMAgent.ResponseCache import ResponseCache
+from LLMAgent.Transport import Transport
+from LLMAgent.RateLimiter import RateLimiter
+from LLMAgent.Tokens import estimate_prompt_tokens, estimate_message_tokens
+from LLMAgent.ContextWindow import ContextWindow
+from LLMAgent.ChatHistoryWriter import ChatHistoryWriter
+from LLMAgent.UsageMeter import UsageMeter
+from LLMAgent.StructuredOutput import OutputSchema
+from Utilities.Tracing import span, traced
 
 class BaseAgent:
     def __init__(self, name: str, logger_name: str = "base_agent", 
                        model: str = "deepseek-r1:1.5b", system_prompt: str = "",
-                       has_system_prompt: bool = False, chat_history_path="Results/chat_history.json"):
+                       has_system_prompt: bool = False, chat_history_path="Results/chat_history.json",
+                       llm_client: dict = None):
         """
         Base class for an LLM-based agent.
 
@@ -27,15 +45,39 @@ class BaseAgent:
         :param logger_name: Name of the logger (default: "Agent").
         :param model: The LLM model to use (default: "deepseek-r1:1.5b").
         :param system_prompt: The system prompt to initialize the agent with.
+        :param llm_client: LLM client settings (llm_client section of the configuration file).
         """
         self.name = name
         self.model = model
         self.system_prompt = system_prompt
         self.has_system_prompt = has_system_prompt
+        self.chat_history_path = chat_history_path
+        self.llm_client = llm_client or {}
         self.chat_history = []
+        self.token_counts = []
         self.log = logger(name=logger_name, log_file=f"Logs/{logger_name}.log")
 
-        self.url = "https://api.deepseek.com/v1/chat/completions"
+        # Content-addressed response cache shared by all agents and worker processes (None if disabled)
+        self.response_cache = ResponseCache.from_config(self.llm_client)
+
+        # Pooled HTTP transport with timeouts and retries shared by all agents of the process
+        self.transport = Transport.from_config(self.llm_client)
+
+        # Requests/tokens per minute and adaptive concurrency shared by all worker processes (None if disabled)
+        self.rate_limiter = RateLimiter.from_config(self.llm_client)
+
+        # Token budget of the messages sent with each request
+        self.context_window = ContextWindow.from_config(self.llm_client)
+
+        # Per-call token and cost ledger shared by all worker processes (None if disabled)
+        self.usage_meter = UsageMeter.from_config(self.llm_client)
+
+        # JSON responses validated against per-phase schemas, with follow-ups for missing fields only
+        self.structured_output = self.llm_client.get("structured_output", False)
+        self.structured_max_reasks = self.llm_client.get("structured_max_reasks", 1)
+
+        # DeepSeek API, or any compatible endpoint such as the local mock server (Utilities/MockLLMServer.py)
+        self.url = f"{self.llm_client.get('base_url', 'https://api.deepseek.com/v1').rstrip('/')}/chat/completions"
         self.headers = {
             "Authorization": f"Bearer {os.environ.get('DEEPSEEK_API_KEY')}",
             "Content-Type": "application/json",
@@ -46,20 +88,132 @@ class BaseAgent:
 
         self.log.info(f"Initialized LLMAgent '{self.name}' with model {self.model}")
 
-    def response_chat(self, input_prompt: str) -> tuple[str, str]:
+    @traced("llm_request")
+    def response_chat(self, input_prompt: str, stop_when=None) -> tuple[str, str]:
         """
         Handles chat interaction with the DeepSeek API, returning the raw response.
 
         :param input_prompt: The user's input prompt.
-        :param has_system_prompt: Whether the model supports system prompts.
+        :param stop_when: Optional predicate on the partial response; in streaming mode with
+                          stream_early_exit enabled, the stream is closed once it returns True.
+        :return: A tuple containing the raw response and a status message.
+        """
+        payload = self._prepare_payload(input_prompt)
+
+        self.log.info(f"Sending request to {self.name}...")
+
+        # self._debug_messages(payload["messages"])
+
+        try:
+            if self.response_cache is not None:
+                response_json, status, cache_hit = self.response_cache.get_or_compute(
+                    payload, lambda: self._request_completion(payload, stop_when)
+                )
+                if cache_hit:
+                    self.log.info(f"Response cache hit for {self.name}")
+            else:
+                response_json, status = self._request_completion(payload, stop_when)
+
+            return self._handle_response(response_json, status)
+
+        except requests.exceptions.RequestException as e:
+            self.log.error(f"Request error: {e}")
+            return "", "Network error or API unreachable."
+
+        except Exception as e:
+            self.log.error(f"Unexpected error during LLM response processing: {e}")
+            return "", "An unexpected error occurred."
+
+    @traced("llm_request")
+    async def aresponse_chat(self, input_prompt: str, stop_when=None) -> tuple[str, str]:
+        """
+        Asynchronous variant of response_chat for the asyncio execution mode. Many requests can be
+        in flight on a single event loop, sharing one pooled HTTP session.
+
+        :param input_prompt: The user's input prompt.
         :return: A tuple containing the raw response and a status message.
         """
+        if aiohttp is None:
+            raise ImportError("aiohttp is required for the asyncio execution mode (pip install aiohttp)")
+
+        payload = self._prepare_payload(input_prompt)
+
+        self.log.info(f"Sending async request to {self.name}...")
+
+        try:
+            if self.response_cache is not None:
+                response_json, status, cache_hit = await self.response_cache.aget_or_compute(
+                    payload, lambda: self._arequest_completion(payload, stop_when)
+                )
+                if cache_hit:
+                    self.log.info(f"Response cache hit for {self.name}")
+            else:
+                response_json, status = await self._arequest_completion(payload, stop_when)
+
+            return self._handle_response(response_json, status)
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.log.error(f"Request error: {e}")
+            return "", "Network error or API unreachable."
+
+        except Exception as e:
+            self.log.error(f"Unexpected error during LLM response processing: {e}")
+            return "", "An unexpected error occurred."
+
+    def structured_chat(self, input_prompt: str, schema: OutputSchema, stop_when=None) -> tuple[dict, str]:
+        """
+        Requests a JSON response and validates it against the schema. Near misses are repaired
+        locally; fields still missing or invalid are asked for in short follow-ups in the same
+        conversation (up to structured_max_reasks), instead of resending the whole prompt.
+
+        :param input_prompt: The user's input prompt, ending with the schema's output instructions.
+        :param schema: Expected JSON object.
+        :param stop_when: Optional early-exit predicate on the partial streamed response.
+        :return: A tuple containing the valid fields and a status message.
+        """
+        raw_response, status = self.response_chat(input_prompt=input_prompt, stop_when=stop_when)
+        if status != "Success":
+            return {}, status
+
+        data, missing = schema.parse(raw_response)
+        for attempt in range(1, self.structured_max_reasks + 1):
+            if not missing:
+                break
+            self.log.warning(f"{self.name} {schema.name} response is missing {missing}, asking for them (Attempt {attempt}/{self.structured_max_reasks})")
+            raw_response, status = self.response_chat(input_prompt=schema.reask_prompt(missing))
+            if status != "Success":
+                break
+            fields, missing = schema.parse(raw_response, keys=missing)
+            data.update(fields)
+
+        return data, "Success"
+
+    async def astructured_chat(self, input_prompt: str, schema: OutputSchema, stop_when=None) -> tuple[dict, str]:
+        """Asynchronous variant of structured_chat."""
+        raw_response, status = await self.aresponse_chat(input_prompt=input_prompt, stop_when=stop_when)
+        if status != "Success":
+            return {}, status
+
+        data, missing = schema.parse(raw_response)
+        for attempt in range(1, self.structured_max_reasks + 1):
+            if not missing:
+                break
+            self.log.warning(f"{self.name} {schema.name} response is missing {missing}, asking for them (Attempt {attempt}/{self.structured_max_reasks})")
+            raw_response, status = await self.aresponse_chat(input_prompt=schema.reask_prompt(missing))
+            if status != "Success":
+                break
+            fields, missing = schema.parse(raw_response, keys=missing)
+            data.update(fields)
+
+        return data, "Success"
+
+    def _prepare_payload(self, input_prompt: str) -> dict:
+        """Appends the user prompt to the chat history and builds the DeepSeek request payload."""
         # Prepares the chat history
         self._append_chat_history(role="user",content=input_prompt)
-        chat_history = self.chat_history
 
-        # Prepare messages in DeepSeek format
-        messages = chat_history
+        # Prepare messages in DeepSeek format (a snapshot within the context budget, later turns must not leak into the payload)
+        messages = self.context_window.fit(self.chat_history, self.token_counts)
         payload = {
             "model": self.model,
             "messages": messages,
@@ -67,56 +221,131 @@ class BaseAgent:
             "use_web_search": False, # Prevents data leakage
         }
 
-        self.log.info(f"Sending request to {self.name}...")
+        # JSON mode: the API only returns valid JSON objects (the prompt must ask for json)
+        if self.structured_output:
+            payload["response_format"] = {"type": "json_object"}
 
-        # self._debug_messages(messages)
+        # Server-sent events: tokens are consumed as they are generated
+        if self.llm_client.get("stream", False):
+            payload["stream"] = True
+            payload["stream_options"] = {"include_usage": True}
 
-        try:
-            response = requests.post(self.url, headers=self.headers, json=payload)
+        return payload
 
-            if response.status_code != 200:
-                self.log.error(f"API Error {response.status_code}: {response.text}")
-                return "", f"API Error {response.status_code}"
+    def _handle_response(self, response_json: dict, status: str) -> tuple[str, str]:
+        """Extracts the response content and stores it in the chat history."""
+        if status != "Success":
+            return "", status
 
-            response_json = response.json()
+        response_content = response_json["choices"][0]["message"]["content"]
 
-            if "choices" not in response_json or not response_json["choices"]:
-                self.log.error("Invalid response format from DeepSeek API.")
-                return "", "Invalid response format."
+        # Store assistant's response
+        self._append_chat_history(role="assistant",content=response_content)
 
-            response_content = response_json["choices"][0]["message"]["content"]
+        return response_content, "Success"
 
-            # Store assistant's response
-            self._append_chat_history(role="assistant",content=response_content)
+    def _request_completion(self, payload: dict, stop_when=None) -> tuple[dict, str]:
+        """
+        Sends the chat completion request to the DeepSeek API.
 
-            return response_content, "Success"
+        :param payload: The request payload.
+        :param stop_when: Optional early-exit predicate on the partial streamed response.
+        :return: A tuple containing the response JSON (None on failure) and a status message.
+        """
+        with span("llm_call", agent=self.name, model=self.model) as call_span:
+            response_json, status = self.transport.post(self.url, self.headers, payload, label=self.name,
+                                                        limiter=self.rate_limiter, tokens=self._estimate_tokens(payload),
+                                                        stop_when=self._early_exit(stop_when))
+            if call_span is not None:
+                call_span.tag(status=status)
 
-        except requests.exceptions.RequestException as e:
-            self.log.error(f"Request error: {e}")
-            return "", "Network error or API unreachable."
+        if status != "Success":
+            return None, status
 
-        except Exception as e:
-            self.log.error(f"Unexpected error during LLM response processing: {e}")
-            return "", "An unexpected error occurred."
+        if "choices" not in response_json or not response_json["choices"]:
+            self.log.error("Invalid response format from DeepSeek API.")
+            return None, "Invalid response format."
+
+        if self.usage_meter is not None:
+            self.usage_meter.record(self.name, self.model, response_json, payload.get("messages"))
+
+        return response_json, "Success"
+
+    async def _arequest_completion(self, payload: dict, stop_when=None) -> tuple[dict, str]:
+        """
+        Sends the chat completion request to the DeepSeek API on the running event loop.
+
+        :param payload: The request payload.
+        :return: A tuple containing the response JSON (None on failure) and a status message.
+        """
+        with span("llm_call", agent=self.name, model=self.model) as call_span:
+            response_json, status = await self.transport.apost(self.url, self.headers, payload, label=self.name,
+                                                               limiter=self.rate_limiter, tokens=self._estimate_tokens(payload),
+                                                               stop_when=self._early_exit(stop_when))
+            if call_span is not None:
+                call_span.tag(status=status)
+
+        if status != "Success":
+            return None, status
+
+        if "choices" not in response_json or not response_json["choices"]:
+            self.log.error("Invalid response format from DeepSeek API.")
+            return None, "Invalid response format."
+
+        if self.usage_meter is not None:
+            self.usage_meter.record(self.name, self.model, response_json, payload.get("messages"))
+
+        return response_json, "Success"
+
+    def _early_exit(self, stop_when):
+        """The early-exit predicate if the configuration allows stopping streams early."""
+        return stop_when if self.llm_client.get("stream_early_exit", False) else None
+
+    def _estimate_tokens(self, payload: dict) -> int:
+        """Tokens reserved in the rate limiter: estimated prompt plus the expected completion length."""
+        return estimate_prompt_tokens(payload["messages"]) + self.llm_client.get("expected_completion_tokens", 1024)
 
     # Appends a message to the chat history.
     def _append_chat_history(self, role: str, content: str) -> None:
-        self.chat_history.append({"role": role, "content": content})
+        message = {"role": role, "content": content}
+        self.chat_history.append(message)
+        self.token_counts.append(estimate_message_tokens(message))
 
-    # Appends this agent's chat history to its file without overwriting existing data.
-    def save_chat_history(self, date: str):
+    def reset_session(self) -> None:
+        """Starts a new conversation that only holds the system prompt (e.g., for a new backtest date)."""
+        self.chat_history = []
+        self.token_counts = []
+        self._append_chat_history("system" if self.has_system_prompt else "user", self.system_prompt)
+
+    def new_session(self):
+        """
+        Copy of the agent with its own fresh conversation, for concurrent requests. The copy shares
+        the transport, response cache, rate limiter and usage meter of the agent.
+        """
+        session = copy.copy(self)
+        session.reset_session()
+        return session
 
-        # Create a new directory based on the date
+    # Hands this agent's chat history of the date to the chat history writer of the process.
+    @traced("save_chat_history")
+    def save_chat_history(self, date: str):
         date = date.strftime("%Y-%m-%d")
+
+        # Append-only sharded JSONL (written in the background, merged at the end of the backtest)
+        writer = ChatHistoryWriter.from_config(self.chat_history_path, self.llm_client)
+        if writer is not None:
+            writer.write(date=date, agent=self.name, messages=self.chat_history)
+            return
+
+        # Legacy format: one JSON file per date directory
         base_filename = os.path.basename(self.chat_history_path)
         directory_path = os.path.dirname(self.chat_history_path)
-        new_directory_path = os.path.join(directory_path, date) 
-        self.chat_history_path = os.path.join(new_directory_path, base_filename)
-        os.makedirs(os.path.dirname(self.chat_history_path), exist_ok=True)
+        date_history_path = os.path.join(directory_path, date, base_filename)
+        os.makedirs(os.path.dirname(date_history_path), exist_ok=True)
 
         # Load existing chat history file or create an empty structure
-        if os.path.exists(self.chat_history_path):
-            with open(self.chat_history_path, "r") as f:
+        if os.path.exists(date_history_path):
+            with open(date_history_path, "r") as f:
                 existing_history = json.load(f)
         else:
             existing_history = {}
@@ -127,7 +356,7 @@ class BaseAgent:
         else:
             existing_history[date] = {self.name: self.chat_history}
 
-        with open(self.chat_history_path, "w") as f:
+        with open(date_history_path, "w") as f:
             json.dump(existing_history, f, indent=2)
 
     # Prints out the key and the first few characters of each message for debugging purposes
@@ -146,4 +375,5 @@ class BaseAgent:
         self.log.info("Starting Ollama server...")
         subprocess.Popen(["ollama", "serve"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
         time.sleep(2)  # Give some time for the server to start
-        self.log.info("Ollama server started successfully.")
\ No newline at end of file
+        self.log.info("Ollama server started successfully.")
+
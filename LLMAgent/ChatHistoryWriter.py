@@ -0,0 +1,183 @@
+import os
+import gzip
+import json
+import time
+import queue
+import socket
+import threading
+from pathlib import Path
+from multiprocessing import util
+
+from Utilities.Logger import logger
+
+
+class ChatHistoryWriter:
+    """
+    Append-only, sharded chat history writer.
+
+    Agents hand their conversation of a date to the writer of their process, which appends compact
+    JSONL records (date, agent, turn, role, content) to its own shard file from a background thread,
+    in batches. No two processes write to the same file, so parallel workers never race, and disk
+    I/O stays off the LLM critical path. At the end of the backtest the shards are merged into a
+    single JSONL file next to the configured chat history path.
+    """
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, chat_history_path: str, compress: bool = False, batch_size: int = 256, flush_interval: float = 1.0):
+        """
+        :param chat_history_path: Configured chat history path (shards are written to a "shards" directory next to it).
+        :param compress: Whether to gzip the shards and the merged file.
+        :param batch_size: Maximum number of conversations written per batch.
+        :param flush_interval: Maximum seconds a conversation waits in the queue.
+        """
+        self.chat_history_path = Path(chat_history_path)
+        self.compress = compress
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.shard_dir = shard_directory(chat_history_path)
+        self.shard_path = self.shard_dir / f"{socket.gethostname()}-{os.getpid()}.jsonl{'.gz' if compress else ''}"
+
+        self.log = logger(name="ChatHistoryWriter", log_file="Logs/backtest.log")
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="ChatHistoryWriter", daemon=True)
+        self._thread.start()
+
+        # Pool workers skip atexit handlers but run multiprocessing finalizers on a clean shutdown (pool.close/join)
+        util.Finalize(self, self.close, exitpriority=10)
+
+    @classmethod
+    def shared(cls, chat_history_path: str, compress: bool = False):
+        """Returns the writer of the current process for the given chat history path."""
+        key = (os.getpid(), os.path.abspath(chat_history_path), compress)
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(chat_history_path, compress=compress)
+            return cls._instances[key]
+
+    @classmethod
+    def from_config(cls, chat_history_path: str, llm_client: dict):
+        """Builds the shared writer from the llm_client configuration section (None for the legacy JSON files)."""
+        llm_client = llm_client or {}
+        if llm_client.get("chat_history_format", "jsonl") != "jsonl":
+            return None
+        return cls.shared(chat_history_path, compress=llm_client.get("chat_history_compress", False))
+
+    def __reduce__(self):
+        # Threads and files are per process: re-attach to the worker's own writer
+        return (ChatHistoryWriter.shared, (str(self.chat_history_path), self.compress))
+
+    def write(self, date: str, agent: str, messages: list):
+        """Queues the conversation of an agent on a date (returns immediately)."""
+        saved = time.time()
+        records = [{"date": date, "agent": agent, "turn": turn, "role": message["role"], "content": message["content"], "saved": saved}
+                   for turn, message in enumerate(messages)]
+        self._queue.put(records)
+
+    def flush(self):
+        """Blocks until all queued conversations are written."""
+        self._queue.join()
+
+    def close(self):
+        """Writes the remaining conversations and stops the background thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size and batch[-1] is not None:
+                try:
+                    batch.append(self._queue.get(timeout=self.flush_interval))
+                except queue.Empty:
+                    break
+
+            try:
+                # One append (one complete gzip member) per batch, so a shard is always readable
+                lines = "".join(json.dumps(record, ensure_ascii=False) + "\n" for records in batch if records for record in records)
+                if lines:
+                    os.makedirs(self.shard_dir, exist_ok=True)
+                    opener = gzip.open if self.compress else open
+                    with opener(self.shard_path, "at", encoding="utf-8") as f:
+                        f.write(lines)
+            except Exception as e:
+                # A failed batch is lost, but the thread keeps serving later conversations, flush and close
+                self.log.error(f"Failed to write {sum(records is not None for records in batch)} conversations to {self.shard_path}: {e!r}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if batch[-1] is None:
+                return
+
+
+def shard_directory(chat_history_path) -> Path:
+    chat_history_path = Path(chat_history_path)
+    return chat_history_path.parent / "shards"
+
+
+def merged_path(chat_history_path, compress: bool = False) -> Path:
+    chat_history_path = Path(chat_history_path)
+    return chat_history_path.with_name(f"{chat_history_path.stem}.jsonl{'.gz' if compress else ''}")
+
+
+def read_jsonl(path):
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def merge_chat_history(chat_history_path: str, compress: bool = False) -> Path:
+    """
+    Merges the shards of all processes into a single JSONL file sorted by date, agent and turn.
+
+    The conversations of a (date, agent) pair from the latest save replace earlier ones, including
+    those already in the merged file from previous runs. Merged shards are deleted.
+
+    :param chat_history_path: Configured chat history path.
+    :param compress: Whether the merged file is gzipped.
+    :return: Path to the merged file.
+    """
+    log = logger(name="ChatHistoryWriter", log_file="Logs/backtest.log")
+
+    # Writers of this process must have written everything before merging
+    with ChatHistoryWriter._instances_lock:
+        writers = [writer for (pid, _, _), writer in ChatHistoryWriter._instances.items() if pid == os.getpid()]
+    for writer in writers:
+        writer.flush()
+
+    output_path = merged_path(chat_history_path, compress)
+    shard_paths = sorted(shard_directory(chat_history_path).glob("*.jsonl*"))
+    if not shard_paths:
+        return output_path
+
+    conversations = {}
+    sources = ([output_path] if output_path.exists() else []) + shard_paths
+    for path in sources:
+        for record in read_jsonl(path):
+            key = (record["date"], record["agent"])
+            current = conversations.get(key)
+            if current is None or record["saved"] > current[0]["saved"]:
+                conversations[key] = [record]
+            elif record["saved"] == current[0]["saved"]:
+                current.append(record)
+
+    records = sorted((record for conversation in conversations.values() for record in conversation),
+                     key=lambda record: (record["date"], record["agent"], record["turn"]))
+
+    tmp_path = output_path.with_name(f"{output_path.name}.{os.getpid()}.tmp")
+    opener = gzip.open if compress else open
+    with opener(tmp_path, "wt", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, output_path)
+
+    for path in shard_paths:
+        path.unlink()
+
+    log.info(f"Merged {len(shard_paths)} chat history shards ({len(conversations)} conversations) into {output_path}")
+    return output_path
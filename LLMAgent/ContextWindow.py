@@ -0,0 +1,98 @@
+import re
+
+from Utilities.Logger import logger
+
+
+class ContextWindow:
+    """
+    Token budget of the messages sent with each chat completion request.
+
+    The agent keeps its full chat history (it is saved for explainability); before each request
+    the window selects the messages that fit into `max_tokens`. The system prompt, the first
+    `pinned_turns` user/assistant turns (the aggregated prompt of the date and the initial answer)
+    and the new user message are always kept. Older turns in between are removed oldest first,
+    either dropped or, with the "summarise" strategy, condensed locally (no LLM call) into a short
+    note of the agreements and predictions given in them.
+    """
+
+    STRATEGIES = ("drop", "summarise")
+
+    def __init__(self, max_tokens: int = None, strategy: str = "drop", pinned_turns: int = 1):
+        """
+        :param max_tokens: Approximate token budget per request (None for no limit).
+        :param strategy: "drop" or "summarise" the older turns that do not fit.
+        :param pinned_turns: Number of leading user/assistant turns that are never removed.
+        """
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown context strategy '{strategy}', expected one of {self.STRATEGIES}")
+
+        self.max_tokens = max_tokens
+        self.strategy = strategy
+        self.pinned_turns = pinned_turns
+        self.log = logger(name="ContextWindow", log_file="Logs/backtest.log")
+
+    @classmethod
+    def from_config(cls, llm_client: dict):
+        """Builds the context window from the llm_client configuration section."""
+        llm_client = llm_client or {}
+        return cls(
+            max_tokens=llm_client.get("context_max_tokens"),
+            strategy=llm_client.get("context_strategy", "drop"),
+            pinned_turns=llm_client.get("context_pinned_turns", 1),
+        )
+
+    def fit(self, messages: list, token_counts: list) -> list:
+        """
+        Selects the messages of a request within the token budget.
+
+        :param messages: Full chat history, ending with the new user message.
+        :param token_counts: Approximate token count of each message.
+        :return: The messages to send.
+        """
+        total_tokens = sum(token_counts)
+        if self.max_tokens is None or total_tokens <= self.max_tokens:
+            return list(messages)
+
+        # Turns are a user message and the replies that follow it
+        turn_starts = [i for i, message in enumerate(messages) if i > 0 and message["role"] == "user"]
+        if len(turn_starts) <= self.pinned_turns + 1:
+            self.log.warning(f"Request of ~{total_tokens} tokens exceeds the context budget of {self.max_tokens} tokens but has no removable turns")
+            return list(messages)
+
+        first_removable = turn_starts[self.pinned_turns]
+
+        # Remove whole turns, oldest first, until the request fits
+        cut = first_removable
+        for start in turn_starts[self.pinned_turns + 1:]:
+            if total_tokens <= self.max_tokens:
+                break
+            total_tokens -= sum(token_counts[cut:start])
+            cut = start
+
+        removed = messages[first_removable:cut]
+        kept = messages[:first_removable] + messages[cut:]
+        if total_tokens > self.max_tokens:
+            self.log.warning(f"Request still holds ~{total_tokens} tokens after removing all older turns (budget {self.max_tokens})")
+
+        if self.strategy == "summarise" and removed:
+            # Prepend the note to the first kept turn (a copy, the chat history is left untouched)
+            kept[first_removable] = {**kept[first_removable], "content": f"{self.summarise(removed)}\n\n{kept[first_removable]['content']}"}
+
+        self.log.info(f"Context window: removed {len(removed)} of {len(messages)} messages ({self.strategy}), ~{total_tokens} tokens sent")
+        return kept
+
+    @staticmethod
+    def summarise(messages: list) -> str:
+        """Condenses removed turns into the agreements and predictions the agent gave in them."""
+        lines = []
+        for message in messages:
+            if message["role"] != "assistant":
+                continue
+            fields = [f"{field}: {match.group(1).strip()}" for field in ("Agreement", "Prediction")
+                      for match in [re.search(rf"{field}:\s*([^\n*]+)", message["content"], re.IGNORECASE)] if match]
+            if fields:
+                lines.append(f"- Turn {len(lines) + 1}: " + ", ".join(fields))
+
+        num_turns = sum(message["role"] == "user" for message in messages)
+        summary = f"[Summary of {num_turns} earlier turns omitted for length]"
+        return "\n".join([summary] + lines)
@@ -2,9 +2,13 @@ import textwrap
 from procoder.functional import format_prompt
 from procoder.prompt import NamedBlock, NamedVariable, Collection
 from Utilities.Logger import logger
+from Utilities.NewsStore import NewsStore
+from Utilities.IndicatorSnapshot import IndicatorSnapshot
+from Utilities.Tracing import traced
 
 import ast
 from itertools import chain
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
@@ -193,6 +197,13 @@ EXAMPLE_FINAL_REFLECTION_PROMPT = NamedBlock(
 )
 
 
+# Prediction options the agents may output
+PREDICTION_OPTIONS = (
+    "Strongly Bullish", "Bullish", "Slightly Bullish", "Flat", "Fluctuating",
+    "Slightly Bearish", "Bearish", "Strongly Bearish",
+)
+
+
 # Mapping market sentiment to trading decision
 def sentiment_to_decision(prediction):
     sentiment_map = {
@@ -213,19 +224,13 @@ def sentiment_to_decision(prediction):
 
 
 
+@traced("format_macro_news")
 def format_macro_news(csv_file, filter_dates=None, chunk_size=10):
-    # Read CSV file
-    df = pd.read_csv(csv_file)
-    df = df.drop_duplicates()
-
-    # Convert 'Date' column to datetime format
-    df['Date'] = pd.to_datetime(df['Date'])
-
-    # Filter by dates if filter_dates is provided
-    if filter_dates:
-        filter_dates = flatten_list(filter_dates)
-        filter_dates = [pd.to_datetime(date).date() for date in filter_dates]
-        df = df[df['Date'].dt.date.isin(filter_dates)]
+    # Date-indexed view of the CSV file, parsed once per process
+    store = NewsStore.from_path(csv_file)
+
+    # Filter by dates if filter_dates is provided (sorted-index range lookup)
+    df = store.window(filter_dates)
     
     # Log the number of news selected
     num_news = len(df)
@@ -234,91 +239,41 @@ def format_macro_news(csv_file, filter_dates=None, chunk_size=10):
     else:
         prompt_logger.warning("No news entries selected after applying filters.")
     
-    # Process each row to extract relevant fields
-    df.sort_values(by='Date', ascending=True, inplace=True)
-    
-    news_chunks = []
-    chunk = []
-    
-    for _, row in df.iterrows():
-        date = row['Date'].strftime('%Y-%m-%d %H:%M:%S')
-        title = row['Title']
-        summary = row['Summary']
-        source = row['Source']
-        
-        # Format each news entry
-        entry = f"Date: **{date}**\nTitle: *{title}* (Source: {source})\nSummary: {summary}\n"
-        chunk.append(entry)
-        
-        # Append chunk if it reaches chunk_size
-        if len(chunk) == chunk_size:
-            news_chunks.append('\n\n'.join(chunk))
-            chunk = []
-    
-    # Append any remaining news entries as the last chunk
-    if chunk:
-        news_chunks.append('\n\n'.join(chunk))
-    
+    news_chunks = chunk_news_entries(df, chunk_size=chunk_size)
+
     return news_chunks, num_news
 
 
-def format_macro_indicator(macro_csv, mapping_csv, current_date, last_periods=4):
-    # Load macroeconomic data
-    macro_df = pd.read_csv(macro_csv)
-    mapping_df = pd.read_csv(mapping_csv)
-    
-    # Convert date columns to datetime
-    macro_df['Date'] = pd.to_datetime(macro_df['Date'])
-    current_date = pd.to_datetime(current_date)
+def chunk_news_entries(df, chunk_size=10):
+    """
+    Formats news entries (already sorted by date) and groups them into prompt chunks.
 
-    # Map Series IDs to Renamed Series
-    rename_dict = dict(zip(mapping_df['Series ID'], mapping_df['Renamed Series']))
-    macro_df.rename(columns=rename_dict, inplace=True)
-    
-    # Ensure all columns except 'Date' are treated as strings before filling NaNs
-    for col in macro_df.columns:
-        if col != "Date":
-            macro_df[col] = macro_df[col].astype(str)  # Convert to string to avoid dtype issues
-    macro_df.fillna("N/A", inplace=True)
-
-    # Infer frequency from the filename
-    freq_days = {"Daily": 1, "Weekly": 7, "Monthly": 30, "Quarterly": 90}
-    inferred_freq = next((freq for freq in freq_days if freq in str(macro_csv)), "Unknown")
-    
-    # Apply delay to prevent data leakage
-    delay_dict = dict(zip(mapping_df['Renamed Series'], mapping_df['Delay (Days)']))
-    for col in macro_df.columns:
-        if col in delay_dict:
-            delay_days = delay_dict[col]
-            published_cutoff = current_date - pd.Timedelta(days=delay_days)
-            macro_df.loc[macro_df['Date'] > published_cutoff, col] = "Not Yet Published"
-
-    # Present the latest data up to the current date
-    macro_df = macro_df[macro_df['Date'] < current_date]
-
-    # Compute period difference AFTER filtering for concise LLM prompt
-    if inferred_freq in freq_days:
-        period_days = freq_days[inferred_freq]
-        macro_df['Period Diff'] = (current_date - macro_df['Date']).dt.days // period_days
-        macro_df['Date'] = macro_df['Date'].dt.strftime('%Y-%m-%d') + macro_df['Period Diff'].apply(lambda x: f" (Past {x} {inferred_freq})")
-    else:
-        macro_df['Period Diff'] = "N/A"
+    :param df: DataFrame with Date, Title, Summary and Source columns.
+    :param chunk_size: Number of news entries per chunk (np.inf for a single chunk).
+    :return: List of formatted news chunks.
+    """
+    if df.empty:
+        return []
 
-    # Sort data in ascending order and keep only the last `last_periods` entries
-    macro_df = macro_df.sort_values(by='Date', ascending=True).tail(last_periods)
-    
-    # Determine column widths for alignment
-    col_widths = {col: max(len(str(col)), max(macro_df[col].astype(str).apply(len))) + 2 for col in macro_df.columns}
-    
-    # Construct formatted table
-    header = " | ".join(col.ljust(col_widths[col]) for col in macro_df.columns)
-    separator = "-" * len(header)
-    rows = [" | ".join(str(row[col]).ljust(col_widths[col]) for col in macro_df.columns) for _, row in macro_df.iterrows()]
-    
-    # Final formatted output
-    formatted_output = f"Here are the {inferred_freq} macroeconomic indicators and their values:\n{header}\n{separator}\n" + "\n".join(rows)
+    # Format each news entry
+    entries = (
+        "Date: **" + df['Date'].dt.strftime('%Y-%m-%d %H:%M:%S') + "**\n"
+        + "Title: *" + df['Title'].astype(str) + "* (Source: " + df['Source'].astype(str) + ")\n"
+        + "Summary: " + df['Summary'].astype(str) + "\n"
+    ).tolist()
+
+    # Split into chunks of chunk_size entries
+    step = len(entries) if not np.isfinite(chunk_size) else max(int(chunk_size), 1)
+    return ['\n\n'.join(entries[i:i + step]) for i in range(0, len(entries), step)]
+
+
+@traced("format_macro_indicator")
+def format_macro_indicator(macro_csv, mapping_csv, current_date, last_periods=4):
+    # Point-in-time view of the indicator file, loaded once per process
+    snapshot = IndicatorSnapshot.from_paths(macro_csv, mapping_csv)
 
-    return formatted_output
+    # Latest published values before the current date (delays applied to prevent data leakage)
+    return snapshot.format(current_date, last_periods=last_periods)
 
 
 # General function to flatten any nested list
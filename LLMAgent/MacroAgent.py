@@ -6,8 +6,11 @@ import re
 import sys
 import os
 import textwrap
+import hashlib
+import numpy as np
 from typing import Dict, List
 from rapidfuzz import process, fuzz
+from scipy.optimize import linear_sum_assignment
 from procoder.functional import format_prompt
 from procoder.prompt import NamedBlock, Collection
 
@@ -17,13 +20,35 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from Utilities.Logger import logger
 from LLMAgent.InstructionPrompt import *
 from LLMAgent.BaseAgent import BaseAgent
+from LLMAgent.StructuredOutput import DECISION_SCHEMA, ARGUMENT_SCHEMA, FILTER_SCHEMA
+from Utilities.Tracing import traced
+from LLMAgent.UsageMeter import metered
+
+# [Title]/[Relevance] pairs of a FilterAgent response (**[Title]**, [Title]:, **Title** ...)
+TITLE_RELEVANCE_PATTERN = re.compile(
+    r"(?:\*\*\[?Title\]?\*\*|\[?Title\]?:?)\s*\**(.*?)\**\s*\n?"
+    r"(?:\*\*\[?Relevance\]?\*\*|\[?Relevance\]?:?|Relevance:)\s*\**(.*?)\**\s*(?:\n|---)",
+    re.DOTALL
+)
+
+# News entries as rendered by chunk_news_entries (the summary runs until the next "Date" or the end of the text)
+NEWS_ENTRY_PATTERN = re.compile(
+    r"Date: \*\*(.*?)\*\*\n"
+    r"Title: \*(.*?)\* \(Source: (.*?)\)\n"
+    r"Summary: (.*?)(?=\nDate: |\Z)",
+    re.DOTALL
+)
+
+# Minimum token_sort_ratio of a news title and a title returned by the LLM
+TITLE_MATCH_THRESHOLD = 70
 
 class TradingAgent(BaseAgent):
     def __init__(self, asset: str, ticker: str, name: str = "TradingAgent", 
                  logger_name: str ="TradingAgent", model: str = "deepseek-r1:1.5b", 
                  style: str = "risk_neutral", risk_tolerance: str = "medium",
                  has_system_prompt: bool = False,
-                 chat_history_path: str = "Results/chat_history.json"):
+                 chat_history_path: str = "Results/chat_history.json",
+                 llm_client: dict = None):
         """
         Subclass of LLMAgent for trading-specific functionality.
 
@@ -33,6 +58,7 @@ class TradingAgent(BaseAgent):
         :param model: The LLM model to use (default: "deepseek-r1:1.5b").
         :param style: The trading style (e.g., "mood").
         :param risk_tolerance: The risk tolerance level (e.g., "medium").
+        :param llm_client: LLM client settings (llm_client section of the configuration file).
         """
         self.asset = asset
         self.ticker = ticker
@@ -65,7 +91,8 @@ class TradingAgent(BaseAgent):
                          model=model, 
                          system_prompt=system_prompt, 
                          has_system_prompt=self.has_system_prompt,
-                         chat_history_path=self.chat_history_path)
+                         chat_history_path=self.chat_history_path,
+                         llm_client=llm_client)
 
         self.log.info(f"Initialized TradingAgent for {self.asset} ({self.ticker}) with model {self.model}")
 
@@ -77,22 +104,67 @@ class TradingAgent(BaseAgent):
         :param input_prompt: The user's input prompt.
         :return: A tuple containing the prediction and explanation.
         """
+        if self.structured_output:
+            fields, status = self.structured_chat(self._decision_prompt(input_prompt), DECISION_SCHEMA)
+            return self._parse_decision_fields(fields, status)
+
         # Get raw response from the base class
-        input_prompt = f"{input_prompt}\n\n{self.example_prompt}"
-        raw_response, status = self.response_chat(input_prompt=input_prompt)
+        raw_response, status = self.response_chat(input_prompt=self._decision_prompt(input_prompt))
+        return self._parse_decision(raw_response, status)
 
-        if status != "Success":
-            return "Error", status
+    async def aget_trading_decision(self, input_prompt: str) -> tuple[str, str]:
+        """Asynchronous variant of get_trading_decision."""
+        if self.structured_output:
+            fields, status = await self.astructured_chat(self._decision_prompt(input_prompt), DECISION_SCHEMA)
+            return self._parse_decision_fields(fields, status)
 
-        # Extract prediction and explanation
-        extracted_response = self.extract_prediction(raw_response)
+        raw_response, status = await self.aresponse_chat(input_prompt=self._decision_prompt(input_prompt))
+        return self._parse_decision(raw_response, status)
 
-        if extracted_response["prediction"] == "Unknown":
-            self.log.warning("LLM returned 'Unknown' as the prediction. Check the response format.")
+    def argue(self, other_opinions):
 
-        return extracted_response["prediction"], extracted_response["explanation"]
+        if self.structured_output:
+            fields, status = self.structured_chat(self._argument_prompt(other_opinions), ARGUMENT_SCHEMA, stop_when=self.argument_complete)
+            return self._parse_argument_fields(fields, status)
 
-    def argue(self, other_opinions):
+        # Get raw response from the base class (the round can move on once the prediction has arrived)
+        raw_response, status = self.response_chat(input_prompt=self._argument_prompt(other_opinions), stop_when=self.argument_complete)
+        return self._parse_argument(raw_response, status)
+
+    async def aargue(self, other_opinions):
+        """Asynchronous variant of argue."""
+        if self.structured_output:
+            fields, status = await self.astructured_chat(self._argument_prompt(other_opinions), ARGUMENT_SCHEMA, stop_when=self.argument_complete)
+            return self._parse_argument_fields(fields, status)
+
+        raw_response, status = await self.aresponse_chat(input_prompt=self._argument_prompt(other_opinions), stop_when=self.argument_complete)
+        return self._parse_argument(raw_response, status)
+    
+    def reflection(self):
+
+        if self.structured_output:
+            fields, status = self.structured_chat(self._reflection_prompt(), DECISION_SCHEMA)
+            return self._parse_decision_fields(fields, status)
+
+        # Get raw response from the base class
+        raw_response, status = self.response_chat(input_prompt=self._reflection_prompt())
+        return self._parse_decision(raw_response, status)
+
+    async def areflection(self):
+        """Asynchronous variant of reflection."""
+        if self.structured_output:
+            fields, status = await self.astructured_chat(self._reflection_prompt(), DECISION_SCHEMA)
+            return self._parse_decision_fields(fields, status)
+
+        raw_response, status = await self.aresponse_chat(input_prompt=self._reflection_prompt())
+        return self._parse_decision(raw_response, status)
+
+    def _decision_prompt(self, input_prompt: str) -> str:
+        if self.structured_output:
+            return f"{input_prompt}\n\n{DECISION_SCHEMA.instructions()}"
+        return f"{input_prompt}\n\n{self.example_prompt}"
+
+    def _argument_prompt(self, other_opinions) -> str:
 
         other_opinions_block = "\n\n".join([
                 f"Agent {o['name']} predicted: \"{o['prediction']}\"\nExplanation: \"{o['explanation']}\""
@@ -105,15 +177,38 @@ class TradingAgent(BaseAgent):
             "style": self.style,
         }
 
-        argument_prompt = format_prompt(self.ARGUMENT_PROMPT,arguments)
+        # Structured mode: the JSON output instructions replace the example output format
+        if self.structured_output:
+            return f"{format_prompt(ARGUMENT_PROMPT, arguments)}\n\n{ARGUMENT_SCHEMA.instructions()}"
+        return format_prompt(self.ARGUMENT_PROMPT,arguments)
 
-        # Get raw response from the base class
-        input_prompt = argument_prompt
-        raw_response, status = self.response_chat(input_prompt=input_prompt)
+    def _reflection_prompt(self) -> str:
+
+        reflect_dict = {"asset": self.asset}
+        if self.structured_output:
+            return f"{format_prompt(FINAL_REFLECTION_PROMPT, reflect_dict)}\n\n{DECISION_SCHEMA.instructions()}"
+        return format_prompt(self.REFLECTION_PROMPT,reflect_dict)
+
+    @traced("parse")
+    def _parse_decision(self, raw_response: str, status: str) -> tuple[str, str]:
 
         if status != "Success":
             return "Error", status
 
+        # Extract prediction and explanation
+        extracted_response = self.extract_prediction(raw_response)
+
+        if extracted_response["prediction"] == "Unknown":
+            self.log.warning("LLM returned 'Unknown' as the prediction. Check the response format.")
+
+        return extracted_response["prediction"], extracted_response["explanation"]
+
+    @traced("parse")
+    def _parse_argument(self, raw_response: str, status: str) -> tuple[str, str, str]:
+
+        if status != "Success":
+            return "Error", status, "Error"
+
         # Extract prediction and explanation
         extracted_response = self.extract_argument(raw_response)
 
@@ -121,26 +216,28 @@ class TradingAgent(BaseAgent):
             self.log.warning("LLM returned 'Unknown' as the prediction. Check the response format.")
 
         return extracted_response["agreement"], extracted_response["response"], extracted_response["prediction"]
-    
-    def reflection(self):
-
-        reflect_dict = {"asset": self.asset}
-        reflect_prompt = format_prompt(self.REFLECTION_PROMPT,reflect_dict)
-
-        # Get raw response from the base class
-        input_prompt = reflect_prompt
-        raw_response, status = self.response_chat(input_prompt=input_prompt)
 
+    @traced("parse")
+    def _parse_decision_fields(self, fields: dict, status: str) -> tuple[str, str]:
+        """Prediction and explanation of a validated structured response."""
         if status != "Success":
             return "Error", status
 
-        # Extract prediction and explanation
-        extracted_response = self.extract_prediction(raw_response)
+        if "prediction" not in fields:
+            self.log.warning("LLM returned no valid prediction after the follow-up requests.")
 
-        if extracted_response["prediction"] == "Unknown":
-            self.log.warning("LLM returned 'Unknown' as the prediction. Check the response format.")
+        return fields.get("prediction", "Unknown"), fields.get("explanation", "No explanation found.")
 
-        return extracted_response["prediction"], extracted_response["explanation"]
+    @traced("parse")
+    def _parse_argument_fields(self, fields: dict, status: str) -> tuple[str, str, str]:
+        """Agreement, response and prediction of a validated structured response."""
+        if status != "Success":
+            return "Error", status, "Error"
+
+        if "agreement" not in fields or "prediction" not in fields:
+            self.log.warning("LLM returned no valid agreement or prediction after the follow-up requests.")
+
+        return fields.get("agreement", "Unknown"), fields.get("response", "No explanation found."), fields.get("prediction", "Unknown")
 
     def extract_prediction(self, response_content: str) -> Dict[str, str]:
         """
@@ -159,6 +256,19 @@ class TradingAgent(BaseAgent):
 
         return {"prediction": prediction, "explanation": explanation}     
 
+    def argument_complete(self, partial_response: str) -> bool:
+        """
+        Whether a partial (streamed) argument already holds everything the debate round uses: the
+        agreement and a complete prediction line (the response text precedes the prediction).
+        """
+        if self.structured_output:
+            return len(ARGUMENT_SCHEMA.partial(partial_response)) == len(ARGUMENT_SCHEMA.fields)
+
+        extracted_response = self.extract_argument(partial_response)
+        prediction_line = re.search(r"Prediction:\s*[^\n*]+\n", partial_response, re.IGNORECASE)
+        return (extracted_response["agreement"] != "Unknown" and prediction_line is not None
+                and extracted_response["prediction"] in PREDICTION_OPTIONS)
+
     def extract_argument(self, response_content: str) -> Dict[str, str]:
 
         # Extract prediction using regex
@@ -178,7 +288,8 @@ class TradingAgent(BaseAgent):
 
 
 class FilterAgent(BaseAgent):
-    def __init__(self, name: str, asset: str, prompt_num_relevance: str = "1-2", logger_name: str = "FilterAgent", model: str = "deepseek-r1:1.5b", has_system_prompt: bool = False):
+    def __init__(self, name: str, asset: str, prompt_num_relevance: str = "1-2", logger_name: str = "FilterAgent", model: str = "deepseek-r1:1.5b", has_system_prompt: bool = False,
+                 llm_client: dict = None):
         """
         Superclass of LLMAgent for summarizing and selecting impactful news.
 
@@ -186,6 +297,7 @@ class FilterAgent(BaseAgent):
         :param asset: The asset being analyzed (e.g., "US 10-year Treasury bonds").
         :param logger_name: Name of the logger (default: "SummaryAgent").
         :param model: The LLM model to use (default: "deepseek-r1:1.5b").
+        :param llm_client: LLM client settings (llm_client section of the configuration file).
         """
         self.asset = asset
         self.prompt_num_relevance = prompt_num_relevance
@@ -202,10 +314,13 @@ class FilterAgent(BaseAgent):
         )
 
         # Initialize the base class
-        super().__init__(name=name, logger_name=logger_name, model=model, system_prompt=system_prompt, has_system_prompt=self.has_system_prompt)
+        super().__init__(name=name, logger_name=logger_name, model=model, system_prompt=system_prompt, has_system_prompt=self.has_system_prompt,
+                         llm_client=llm_client)
 
         self.log.info(f"Initialized SummaryAgent for {self.asset} with model {self.model}")
 
+    @traced("filter_news")
+    @metered("filter_news")
     def filter_news(self, news_entries: str) -> pd.DataFrame:
         """
         Gets the most impactful news by interacting with the LLM and extracting the selected news.
@@ -213,21 +328,24 @@ class FilterAgent(BaseAgent):
         :param news_entries: A string containing news titles and summaries.
         :return: A DataFrame containing Date, Source, Title, and Summary.
         """
-        # Format the input prompt
-        self.INPUT_PROMPT = Collection(MACROECONOMIC_NEWS_PROMPT,
-                                       self.EXPECTED_OUTPUT_PROMPT)
-        input = {"news_entries": news_entries, "asset": self.asset, "prompt_num_relevance": self.prompt_num_relevance}
-        input_prompt = format_prompt(self.INPUT_PROMPT, input)
+        input_prompt = self._filter_prompt(news_entries)
 
-        # Get raw response from the base class
-        raw_response, status = self.response_chat(input_prompt)
+        if self.structured_output:
+            # JSON response validated against the filter schema (missing fields are asked for separately)
+            fields, status = self.structured_chat(input_prompt, FILTER_SCHEMA)
+        else:
+            # Get raw response from the base class
+            raw_response, status = self.response_chat(input_prompt)
 
         if status != "Success":
             self.log.error(f"Failed to get response from LLM: {status}")
             return pd.DataFrame(columns=["Date", "Source", "Title", "Summary"]), False
 
         # Extract selected titles from the response
-        title_relevance_map = self._extract_titles(raw_response)
+        if self.structured_output:
+            title_relevance_map = {item["title"]: item["relevance"] for item in fields.get("selected", [])}
+        else:
+            title_relevance_map = self._extract_titles(raw_response)
         # self.log.info(raw_response)
         # print("Extracted Relevant Titles")
         # self.log.info(title_relevance_map)
@@ -238,6 +356,23 @@ class FilterAgent(BaseAgent):
         return df, status_flag
 
 
+    def _filter_prompt(self, news_entries: str) -> str:
+        input = {"news_entries": news_entries, "asset": self.asset, "prompt_num_relevance": self.prompt_num_relevance}
+
+        if self.structured_output:
+            return f"{format_prompt(MACROECONOMIC_NEWS_PROMPT, input)}\n\n{FILTER_SCHEMA.instructions()}"
+
+        # Format the input prompt
+        self.INPUT_PROMPT = Collection(MACROECONOMIC_NEWS_PROMPT,
+                                       self.EXPECTED_OUTPUT_PROMPT)
+        return format_prompt(self.INPUT_PROMPT, input)
+
+    def prompt_version(self) -> str:
+        """Short hash of the system and input prompt templates, which changes whenever the filter prompts do."""
+        template = f"{self.system_prompt}\n{self._filter_prompt('')}"
+        return hashlib.sha256(template.encode("utf-8")).hexdigest()[:12]
+
+    @traced("parse")
     def _extract_titles(self, raw_response: str) -> dict:
         """
         Extracts Titles and their corresponding Relevance from the raw LLM response.
@@ -245,18 +380,14 @@ class FilterAgent(BaseAgent):
         :param raw_response: The full text response from the LLM.
         :return: A dictionary {title: relevance}
         """
-        matches = re.findall(
-            r"(?:\*\*\[?Title\]?\*\*|\[?Title\]?:?)\s*\**(.*?)\**\s*\n?"  # Matches **[Title]**, [Title]:, **Title**
-            r"(?:\*\*\[?Relevance\]?\*\*|\[?Relevance\]?:?|Relevance:)\s*\**(.*?)\**\s*(?:\n|---)",  # Matches relevance
-            raw_response, 
-            re.DOTALL
-        )
+        matches = TITLE_RELEVANCE_PATTERN.findall(raw_response)
 
         # Convert list of tuples into a dictionary {title: relevance}
         title_relevance_map = {title.strip(): relevance.strip() for title, relevance in matches}
         return title_relevance_map
 
 
+    @traced("parse")
     def _extract_news_details(self, news_entries: str, title_relevance_map: dict) -> pd.DataFrame:
         """
         Extracts Date, Title, Source, Summary, and Relevance from news_entries.
@@ -272,34 +403,17 @@ class FilterAgent(BaseAgent):
             return pd.DataFrame(columns=["Date", "Source", "Title", "Summary", "Relevance"]), False
 
 
-        pattern = re.compile(
-            r"Date: \*\*(.*?)\*\*\n"
-            r"Title: \*(.*?)\* \(Source: (.*?)\)\n"
-            r"Summary: (.*?)(?=\nDate: |\Z)",  # Matches everything until the next "Date" or end of text
-            re.DOTALL
-        )
+        matches = [(date.strip(), title.strip(), source.strip(), summary.strip())
+                   for date, title, source, summary in NEWS_ENTRY_PATTERN.findall(news_entries)]
+        assignment = match_titles([title for _, title, _, _ in matches], list(title_relevance_map.keys()))
 
-        matches = pattern.findall(news_entries)
-        extracted_data = []
-
-        for date, title, source, summary in matches:
-            title = title.strip()
-
-            # Find the best matching title from the LLM response
-            match_result = process.extractOne(title, title_relevance_map.keys(), scorer=fuzz.token_sort_ratio) if title_relevance_map else None
-            
-            if match_result:
-                best_match, score, _ = match_result
-                if score >= 70:  # Consider titles with at least 80% similarity
-                    extracted_data.append({
-                        "Date": date.strip(),
-                        "Source": source.strip(),
-                        "Title": best_match,  # Use the best-matching extracted title
-                        "Summary": summary.strip(),
-                        "Relevance": title_relevance_map[best_match]  # Retrieve the corresponding relevance
-                    })
-            else:
-                self.log.warning(f"No match found for news title: '{title}'")
+        extracted_data = [{
+            "Date": date,
+            "Source": source,
+            "Title": assignment[i],  # Use the matched title returned by the LLM
+            "Summary": summary,
+            "Relevance": title_relevance_map[assignment[i]],
+        } for i, (date, title, source, summary) in enumerate(matches) if i in assignment]
 
         # df = pd.DataFrame(extracted_data)
         df = pd.DataFrame(extracted_data, columns=["Date", "Source", "Title", "Summary", "Relevance"])
@@ -322,3 +436,44 @@ class FilterAgent(BaseAgent):
 
 
         return df, status_flag      
+
+
+def match_titles(entry_titles: list, selected_titles: list, threshold: float = TITLE_MATCH_THRESHOLD) -> dict:
+    """
+    One-to-one matching of news entry titles to the titles returned by the LLM.
+
+    Verbatim titles are matched by hash first. The remaining ones are scored in a single batched
+    rapidfuzz.process.cdist call (token_sort_ratio) and assigned optimally, so two entries can never
+    claim the same LLM title.
+
+    :param entry_titles: Titles of the news entries sent to the LLM.
+    :param selected_titles: Titles returned by the LLM.
+    :param threshold: Minimum similarity (0-100) of a match.
+    :return: Dictionary {entry index: selected title}.
+    """
+    assignment = {}
+    remaining_titles = list(dict.fromkeys(selected_titles))
+
+    # Exact fast path
+    entry_index = {}
+    for i, title in enumerate(entry_titles):
+        entry_index.setdefault(title, i)
+    for title in list(remaining_titles):
+        if title in entry_index:
+            assignment[entry_index[title]] = title
+            remaining_titles.remove(title)
+
+    remaining_entries = [i for i in range(len(entry_titles)) if i not in assignment]
+    if not remaining_titles or not remaining_entries:
+        return assignment
+
+    # Similarity matrix (entries x LLM titles); scores below the threshold are zeroed
+    scores = process.cdist([entry_titles[i] for i in remaining_entries], remaining_titles,
+                           scorer=fuzz.token_sort_ratio, score_cutoff=threshold, workers=1)
+
+    # Optimal assignment: maximum total similarity, each entry and title used once
+    rows, columns = linear_sum_assignment(scores, maximize=True)
+    for row, column in zip(rows, columns):
+        if scores[row, column] >= threshold:
+            assignment[remaining_entries[row]] = remaining_titles[column]
+    return assignment
@@ -1,6 +1,7 @@
 import sys
 import os
 import re
+import asyncio
 from typing import Dict
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from threading import Lock
@@ -14,12 +15,15 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from Utilities.Logger import logger
 from LLMAgent.InstructionPrompt import *
 from LLMAgent.MacroAgent import TradingAgent
+from Utilities.Tracing import traced, propagate_context
+from LLMAgent.UsageMeter import metered
 
 lock = Lock()
 
 class MultiAgentNetwork():
     def __init__(self, asset: str, ticker: str, name: list, logger_name: list, model: list, verbose_debate: bool,
-                 style: list, risk_tolerance: list, has_system_prompt: list, chat_history_path: str):
+                 style: list, risk_tolerance: list, has_system_prompt: list, chat_history_path: str,
+                 llm_client: dict = None):
         """
         A network managing multiple TradingAgents.
 
@@ -30,6 +34,7 @@ class MultiAgentNetwork():
         :param style: List of trading styles (e.g., "mood", "momentum").
         :param risk_tolerance: List of risk tolerance levels (e.g., "low", "high").
         :param has_system_prompt: List indicating if each agent uses a system prompt.
+        :param llm_client: LLM client settings shared by all agents.
         """
         self.asset = asset
         self.ticker = ticker
@@ -40,6 +45,7 @@ class MultiAgentNetwork():
         self.risk_tolerance = risk_tolerance
         self.has_system_prompt = has_system_prompt
         self.chat_history_path=chat_history_path
+        self.llm_client = llm_client
 
         self.verbose_debate = verbose_debate
 
@@ -56,6 +62,7 @@ class MultiAgentNetwork():
                 risk_tolerance=self.risk_tolerance[i],
                 has_system_prompt=self.has_system_prompt[i],
                 chat_history_path=self.chat_history_path,
+                llm_client=self.llm_client,
             )
             self.trading_agents.append(agent)
 
@@ -81,6 +88,8 @@ class MultiAgentNetwork():
         # self.log.info(final_opinions)
         return final_opinions
 
+    @traced("constructive_speech")
+    @metered("constructive_speech")
     def constructive_speech(self, input_prompt: str):
         """
         Agents form initial opinions based on the input prompt.
@@ -94,7 +103,7 @@ class MultiAgentNetwork():
             return agent.name, prediction, explanation
 
         with ThreadPoolExecutor() as executor:
-            future_to_agent = {executor.submit(get_opinion, agent): agent for agent in self.trading_agents}
+            future_to_agent = {executor.submit(propagate_context(get_opinion), agent): agent for agent in self.trading_agents}
 
             for future in as_completed(future_to_agent):
                 agent_name, prediction, explanation = future.result()
@@ -108,6 +117,8 @@ class MultiAgentNetwork():
 
         return agent_opinions
 
+    @traced("cross_examination")
+    @metered("cross_examination")
     def cross_examination(self, agent_opinions, max_rounds: int):
         """
         Agents communicate in rounds where they argue and discuss all other agents' opinions
@@ -124,68 +135,76 @@ class MultiAgentNetwork():
             decisions = {}
 
             def process_agent(agent):
-                outputs = [f"\n{agent.name} is responding to all other agents...\n"]
-                agent_prediction = None
-                agent_explanation = None
-                agent_decision = None
-
-                # Aggregate all other agents' predictions and explanations
-                other_views = []
-                for other_name, opinion in agent_opinions.items():
-                    if other_name != agent.name:
-                        other_views.append({
-                            "name": other_name,
-                            "prediction": opinion["prediction"],
-                            "explanation": opinion["explanation"]
-                        })
 
                 # # Call agent's reasoning method with all other opinions at once
                 # with lock:
                 agreement, response, prediction = agent.argue(
-                    other_opinions=other_views
+                    other_opinions=self._other_views(agent, agent_opinions)
                 )
 
-                agent_prediction = prediction
-                agent_explanation = response
-                agent_decision = sentiment_to_decision(prediction)
-
-                outputs.append(f"[{agent.name}]  Agreement: {agreement}")
-                outputs.append(f"Response: {response}")
-                outputs.append(f"Prediction: {prediction}")
-                outputs.append(f"Decision: {agent_decision} \n")
-
-                # Store updated opinions and decisions
-                new_opinions[agent.name] = {
-                    "prediction": agent_prediction,
-                    "explanation": agent_explanation
-                }
-                decisions[agent.name] = agent_decision
-
-                return '\n'.join(outputs)
+                return self._record_argument(agent, agreement, response, prediction, new_opinions, decisions)
 
             with ThreadPoolExecutor() as executor:
-                futures = [executor.submit(process_agent, agent) for agent in self.trading_agents]
+                futures = [executor.submit(propagate_context(process_agent), agent) for agent in self.trading_agents]
 
                 for future in as_completed(futures):
                     if self.verbose_debate:
                         print(future.result())
 
             # Check for consensus
-            all_decisions = list(decisions.values())
-            if len(set(all_decisions)) == 1:
-                if self.verbose_debate:
-                    print(f"\nAll agents have reached consensus decision: '{all_decisions[0]}'\n")
+            if self._reached_consensus(decisions):
                 break
-            else:
-                if self.verbose_debate:
-                    print("\nNo consensus on decision yet. Continuing to next round...\n")
 
             agent_opinions = new_opinions  # Update for next round
         else:
             if self.verbose_debate:
                 print("\nMaximum rounds reached. No consensus on decision.\n")
 
+    def _other_views(self, agent, agent_opinions):
+        """Aggregate all other agents' predictions and explanations."""
+        other_views = []
+        for other_name, opinion in agent_opinions.items():
+            if other_name != agent.name:
+                other_views.append({
+                    "name": other_name,
+                    "prediction": opinion["prediction"],
+                    "explanation": opinion["explanation"]
+                })
+        return other_views
+
+    def _record_argument(self, agent, agreement, response, prediction, new_opinions, decisions):
+        """Stores an agent's updated opinion and decision, returning the formatted debate output."""
+        agent_decision = sentiment_to_decision(prediction)
+
+        outputs = [f"\n{agent.name} is responding to all other agents...\n"]
+        outputs.append(f"[{agent.name}]  Agreement: {agreement}")
+        outputs.append(f"Response: {response}")
+        outputs.append(f"Prediction: {prediction}")
+        outputs.append(f"Decision: {agent_decision} \n")
+
+        # Store updated opinions and decisions
+        new_opinions[agent.name] = {
+            "prediction": prediction,
+            "explanation": response
+        }
+        decisions[agent.name] = agent_decision
+
+        return '\n'.join(outputs)
+
+    def _reached_consensus(self, decisions):
+        all_decisions = list(decisions.values())
+        if len(set(all_decisions)) == 1:
+            if self.verbose_debate:
+                print(f"\nAll agents have reached consensus decision: '{all_decisions[0]}'\n")
+            return True
+
+        if self.verbose_debate:
+            print("\nNo consensus on decision yet. Continuing to next round...\n")
+        return False
+
 
+    @traced("reflection")
+    @metered("reflection")
     def reflection_phase(self):
         """
         After the discussion rounds, each agent reflects and provides a final prediction and explanation.
@@ -201,7 +220,7 @@ class MultiAgentNetwork():
             return agent.name, final_prediction, final_explanation
 
         with ThreadPoolExecutor() as executor:
-            futures = [executor.submit(agent_reflect, agent) for agent in self.trading_agents]
+            futures = [executor.submit(propagate_context(agent_reflect), agent) for agent in self.trading_agents]
 
             for future in as_completed(futures):
                 agent_name, final_prediction, final_explanation = future.result()
@@ -216,7 +235,97 @@ class MultiAgentNetwork():
         return final_opinions
     
 
+    async def aget_trading_decision(self, input_prompt: str, max_rounds: int = 5):
+        """
+        Asynchronous variant of get_trading_decision: all agents of a phase are awaited concurrently
+        on the running event loop instead of a thread pool.
+        """
+        agent_opinions = await self.aconstructive_speech(input_prompt)
+        await self.across_examination(agent_opinions, max_rounds)
+        return await self.areflection_phase()
+
+    @traced("constructive_speech")
+    @metered("constructive_speech")
+    async def aconstructive_speech(self, input_prompt: str):
+        """Asynchronous variant of constructive_speech."""
+        agent_opinions = {}
+        if self.verbose_debate:
+            print("\n[Step 1] Agents form initial opinions:\n")
+
+        opinions = await asyncio.gather(*(agent.aget_trading_decision(input_prompt) for agent in self.trading_agents))
+
+        for agent, (prediction, explanation) in zip(self.trading_agents, opinions):
+            agent_opinions[agent.name] = {
+                "prediction": prediction,
+                "explanation": explanation
+            }
+            if self.verbose_debate:
+                print(f"{agent.name} predicts: {prediction}")
+                print(f"Explanation: {explanation}\n")
+
+        return agent_opinions
+
+    @traced("cross_examination")
+    @metered("cross_examination")
+    async def across_examination(self, agent_opinions, max_rounds: int):
+        """Asynchronous variant of cross_examination."""
+        if self.verbose_debate:
+            print("\n[Step 2] Agents start discussion rounds:\n")
+
+        for round_num in range(max_rounds):
+            if self.verbose_debate:
+                print(f"\n--- Round {round_num + 1} ---\n")
+
+            new_opinions = {}
+            decisions = {}
+
+            arguments = await asyncio.gather(*(
+                agent.aargue(other_opinions=self._other_views(agent, agent_opinions)) for agent in self.trading_agents
+            ))
+
+            for agent, (agreement, response, prediction) in zip(self.trading_agents, arguments):
+                output = self._record_argument(agent, agreement, response, prediction, new_opinions, decisions)
+                if self.verbose_debate:
+                    print(output)
+
+            # Check for consensus
+            if self._reached_consensus(decisions):
+                break
+
+            agent_opinions = new_opinions  # Update for next round
+        else:
+            if self.verbose_debate:
+                print("\nMaximum rounds reached. No consensus on decision.\n")
+
+    @traced("reflection")
+    @metered("reflection")
+    async def areflection_phase(self):
+        """Asynchronous variant of reflection_phase."""
+        if self.verbose_debate:
+            print("\n[Step 3] Agents reflect and update their final views:\n")
+        final_opinions = {}
+
+        reflections = await asyncio.gather(*(agent.areflection() for agent in self.trading_agents))
+
+        for agent, (final_prediction, final_explanation) in zip(self.trading_agents, reflections):
+            final_opinions[agent.name] = {
+                "prediction": final_prediction,
+                "explanation": final_explanation
+            }
+            if self.verbose_debate:
+                print(f"{agent.name}'s Final Prediction: {final_prediction}")
+                print(f"{agent.name}'s Final Explanation: {final_explanation}\n")
+
+        return final_opinions
+
+
+    # Start a new conversation for all agents
+    def reset_session(self):
+        for agent in self.trading_agents:
+            agent.reset_session()
+
     # Save chat history for all agents
+    @traced("save_chat_history")
     def save_chat_history(self, date):
         for agent in self.trading_agents:
             agent.save_chat_history(date=date)
\ No newline at end of file
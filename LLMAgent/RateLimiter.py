@@ -0,0 +1,236 @@
+import os
+import json
+import time
+import asyncio
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+# POSIX file locks coordinate all Pool workers; without them the limiter only covers one process
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from Utilities.Logger import logger
+
+
+class RateLimiter:
+    """
+    Adaptive rate limiter shared by all worker processes of a backtest.
+
+    The limiter state lives in a small JSON file guarded by an exclusive file lock, so every Pool
+    worker (and every thread in it) draws from the same budget:
+
+    - requests per minute and tokens per minute are token buckets refilled continuously;
+    - the number of requests in flight is bounded by an adaptive concurrency limit (AIMD): it is
+      multiplied by `decrease_factor` on a 429 or when the latency exceeds `latency_target`, and grows
+      by one request per window of successful requests otherwise.
+
+    Slots held by processes that died are reclaimed, so a crashed worker cannot starve the others.
+    """
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, state_path: str, requests_per_minute: float = 600, tokens_per_minute: float = 2_000_000,
+                 max_concurrency: int = 32, min_concurrency: int = 1, decrease_factor: float = 0.5,
+                 latency_target: float = None, decrease_cooldown: float = 5.0, poll_interval: float = 0.05):
+        """
+        :param state_path: Path to the shared limiter state file.
+        :param requests_per_minute: Request budget per minute across all processes.
+        :param tokens_per_minute: Token budget per minute across all processes.
+        :param max_concurrency: Upper bound of the adaptive concurrency limit.
+        :param min_concurrency: Lower bound of the adaptive concurrency limit.
+        :param decrease_factor: Multiplicative decrease of the concurrency limit on congestion.
+        :param latency_target: Latency (seconds) above which a request counts as congestion (None to ignore latency).
+        :param decrease_cooldown: Seconds between two multiplicative decreases (one burst of 429s is one signal).
+        :param poll_interval: Maximum seconds between two attempts to acquire a slot.
+        """
+        self.state_path = Path(state_path)
+        self.lock_path = self.state_path.with_name(self.state_path.name + ".lock")
+        self.requests_per_minute = float(requests_per_minute)
+        self.tokens_per_minute = float(tokens_per_minute)
+        self.max_concurrency = int(max_concurrency)
+        self.min_concurrency = int(min_concurrency)
+        self.decrease_factor = decrease_factor
+        self.latency_target = latency_target
+        self.decrease_cooldown = decrease_cooldown
+        self.poll_interval = poll_interval
+
+        self._thread_lock = threading.Lock()
+        self.log = logger(name="RateLimiter", log_file="Logs/backtest.log")
+        os.makedirs(self.state_path.parent, exist_ok=True)
+
+    @property
+    def settings(self) -> tuple:
+        return (str(self.state_path), self.requests_per_minute, self.tokens_per_minute, self.max_concurrency,
+                self.min_concurrency, self.decrease_factor, self.latency_target, self.decrease_cooldown, self.poll_interval)
+
+    @classmethod
+    def shared(cls, *settings):
+        """Returns the limiter of the current process for the given settings."""
+        key = (os.getpid(), settings)
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(*settings)
+            return cls._instances[key]
+
+    @classmethod
+    def from_config(cls, llm_client: dict):
+        """Builds the shared limiter from the llm_client configuration section (None if disabled)."""
+        state_path = (llm_client or {}).get("rate_limit_state_path")
+        if not state_path:
+            return None
+        return cls.shared(
+            str(state_path),
+            llm_client.get("requests_per_minute", 600),
+            llm_client.get("tokens_per_minute", 2_000_000),
+            llm_client.get("max_concurrent_requests", 32),
+            llm_client.get("min_concurrent_requests", 1),
+            llm_client.get("decrease_factor", 0.5),
+            llm_client.get("latency_target"),
+            llm_client.get("decrease_cooldown", 5.0),
+            llm_client.get("poll_interval", 0.05),
+        )
+
+    def __reduce__(self):
+        # Locks are per process: re-attach to the worker's own instance (the state file is shared)
+        return (RateLimiter.shared, self.settings)
+
+    @contextmanager
+    def _locked_state(self):
+        """Yields the shared state under an exclusive lock and writes it back afterwards."""
+        with self._thread_lock, open(self.lock_path, "a+") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                state = self._read_state()
+                yield state
+                tmp_path = self.state_path.with_name(f"{self.state_path.name}.{os.getpid()}.tmp")
+                with open(tmp_path, "w") as f:
+                    json.dump(state, f)
+                os.replace(tmp_path, self.state_path)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_state(self) -> dict:
+        try:
+            with open(self.state_path, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            now = time.time()
+            return {
+                "request_tokens": self.requests_per_minute, "token_tokens": self.tokens_per_minute, "refilled": now,
+                "limit": float(self.max_concurrency), "in_flight": {}, "last_decrease": 0.0,
+                "throttled": 0, "completed": 0,
+            }
+
+    def _refill(self, state: dict, now: float):
+        elapsed = max(now - state["refilled"], 0.0)
+        state["request_tokens"] = min(self.requests_per_minute, state["request_tokens"] + elapsed * self.requests_per_minute / 60)
+        state["token_tokens"] = min(self.tokens_per_minute, state["token_tokens"] + elapsed * self.tokens_per_minute / 60)
+        state["refilled"] = now
+
+    @staticmethod
+    def _reclaim_dead_slots(state: dict):
+        for pid in list(state["in_flight"]):
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                del state["in_flight"][pid]
+            except PermissionError:
+                pass
+
+    def _try_acquire(self, tokens: int) -> float:
+        """Takes a slot if the budgets allow it; returns 0 on success or the seconds to wait otherwise."""
+        # A single request larger than the whole token budget must still be able to run
+        tokens = min(tokens, self.tokens_per_minute)
+
+        with self._locked_state() as state:
+            now = time.time()
+            self._refill(state, now)
+            self._reclaim_dead_slots(state)
+
+            in_flight = sum(state["in_flight"].values())
+            if in_flight >= max(int(state["limit"]), self.min_concurrency):
+                return self.poll_interval
+
+            waits = []
+            if state["request_tokens"] < 1:
+                waits.append((1 - state["request_tokens"]) * 60 / self.requests_per_minute)
+            if state["token_tokens"] < tokens:
+                waits.append((tokens - state["token_tokens"]) * 60 / self.tokens_per_minute)
+            if waits:
+                return max(waits)
+
+            state["request_tokens"] -= 1
+            state["token_tokens"] -= tokens
+            pid = str(os.getpid())
+            state["in_flight"][pid] = state["in_flight"].get(pid, 0) + 1
+            return 0.0
+
+    def acquire(self, tokens: int):
+        """Blocks until a request of the estimated number of tokens may be sent."""
+        while True:
+            wait = self._try_acquire(tokens)
+            if wait == 0:
+                return
+            time.sleep(min(max(wait, self.poll_interval), 1.0))
+
+    async def aacquire(self, tokens: int):
+        """Asynchronous variant of acquire for the asyncio execution mode."""
+        while True:
+            wait = await asyncio.to_thread(self._try_acquire, tokens)
+            if wait == 0:
+                return
+            await asyncio.sleep(min(max(wait, self.poll_interval), 1.0))
+
+    def release(self, estimated_tokens: int, used_tokens: int = None, status_code: int = None, latency: float = None):
+        """
+        Returns the slot of a finished request and adapts the concurrency limit.
+
+        :param estimated_tokens: Tokens reserved by acquire.
+        :param used_tokens: Tokens actually used (reported usage), to correct the token budget.
+        :param status_code: HTTP status of the attempt (None for connection errors and timeouts).
+        :param latency: Seconds the attempt took.
+        """
+        with self._locked_state() as state:
+            now = time.time()
+            self._refill(state, now)
+
+            pid = str(os.getpid())
+            if state["in_flight"].get(pid, 0) > 1:
+                state["in_flight"][pid] -= 1
+            else:
+                state["in_flight"].pop(pid, None)
+
+            if used_tokens is not None:
+                state["token_tokens"] = min(self.tokens_per_minute, state["token_tokens"] + min(estimated_tokens, self.tokens_per_minute) - used_tokens)
+
+            congested = status_code == 429 or (self.latency_target is not None and latency is not None and latency > self.latency_target)
+            if congested:
+                state["throttled"] += 1
+                if now - state["last_decrease"] >= self.decrease_cooldown:
+                    previous = state["limit"]
+                    state["limit"] = max(float(self.min_concurrency), state["limit"] * self.decrease_factor)
+                    state["last_decrease"] = now
+                    self.log.warning(f"Congestion ({'429' if status_code == 429 else f'latency {latency:.1f}s'}): concurrency limit {previous:.1f} -> {state['limit']:.1f}")
+            elif status_code is not None and status_code < 500:
+                # Additive increase: about one more concurrent request per window of successful requests
+                state["completed"] += 1
+                state["limit"] = min(float(self.max_concurrency), state["limit"] + 1 / max(state["limit"], 1.0))
+
+    def stats(self) -> dict:
+        """Current shared limiter state."""
+        with self._locked_state() as state:
+            self._refill(state, time.time())
+            return {
+                "concurrency_limit": round(state["limit"], 2),
+                "in_flight": sum(state["in_flight"].values()),
+                "request_tokens": round(state["request_tokens"], 1),
+                "token_tokens": round(state["token_tokens"]),
+                "throttled": state["throttled"],
+                "completed": state["completed"],
+            }
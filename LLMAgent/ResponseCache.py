@@ -0,0 +1,302 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import asyncio
+import hashlib
+import weakref
+import threading
+
+from Utilities.Logger import logger
+
+
+class ResponseCache:
+    """
+    Content-addressed, on-disk cache of LLM responses shared by all threads and processes of a backtest.
+
+    Responses are stored in SQLite (WAL mode) keyed by a SHA-256 hash of the request payload (model,
+    messages and sampling parameters). The cache is bounded in size with least-recently-used eviction,
+    keeps hit/miss counters, and deduplicates concurrent identical requests (single flight): threads of
+    the same process wait on an in-memory event, other processes wait on a claim row in the database,
+    so only one network call is made per distinct request.
+    """
+
+    # Payload fields that do not change the completion
+    IGNORED_FIELDS = ("stream", "stream_options")
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, cache_path: str, max_bytes: int = 512 * 1024 * 1024,
+                 inflight_timeout: float = 600.0, poll_interval: float = 0.5):
+        """
+        :param cache_path: Path to the SQLite cache file.
+        :param max_bytes: Maximum total size of cached responses before LRU eviction.
+        :param inflight_timeout: Seconds after which another process' unfinished claim is considered stale.
+        :param poll_interval: Seconds between cache polls while waiting on another process.
+        """
+        self.cache_path = str(cache_path)
+        self.max_bytes = int(max_bytes)
+        self.inflight_timeout = inflight_timeout
+        self.poll_interval = poll_interval
+
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+        self._async_flights = weakref.WeakKeyDictionary()
+        self._counter_lock = threading.Lock()
+        self.log = logger(name="ResponseCache", log_file="Logs/backtest.log")
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+        self._create_tables()
+
+    @classmethod
+    def shared(cls, cache_path: str, max_bytes: int = 512 * 1024 * 1024):
+        """Returns the cache instance of the current process for the given path."""
+        key = (os.getpid(), os.path.abspath(cache_path))
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(cache_path, max_bytes=max_bytes)
+            return cls._instances[key]
+
+    @classmethod
+    def from_config(cls, llm_client: dict):
+        """Builds the shared cache from the llm_client configuration section (None if disabled)."""
+        cache_path = (llm_client or {}).get("response_cache_path")
+        if not cache_path:
+            return None
+        max_mb = llm_client.get("response_cache_max_mb", 512)
+        return cls.shared(cache_path, max_bytes=int(max_mb * 1024 * 1024))
+
+    def __reduce__(self):
+        # Connections, locks and events are per process: re-attach to the worker's own instance
+        return (ResponseCache.shared, (self.cache_path, self.max_bytes))
+
+    @property
+    def owner(self) -> str:
+        """Identifier of the current process for inflight claims."""
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """SQLite connection of the current thread."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.cache_path, timeout=60, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _create_tables(self):
+        conn = self.connection
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL
+            )""")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        conn.execute("CREATE TABLE IF NOT EXISTS inflight (key TEXT PRIMARY KEY, owner TEXT NOT NULL, started REAL NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        conn.execute("INSERT OR IGNORE INTO counters (name, value) VALUES ('hits', 0), ('misses', 0), ('bytes', 0), ('evictions', 0)")
+
+    @classmethod
+    def make_key(cls, payload: dict) -> str:
+        """SHA-256 of the canonical JSON of the request payload."""
+        canonical = {key: value for key, value in payload.items() if key not in cls.IGNORED_FIELDS}
+        encoded = json.dumps(canonical, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def is_complete(response: dict) -> bool:
+        """Whether a response can be cached (streams stopped early hold a truncated completion)."""
+        return all(choice.get("finish_reason") != "early_stop" for choice in response.get("choices", []))
+
+    def get(self, key: str):
+        """Returns the cached response for the key (refreshing its LRU position), or None."""
+        conn = self.connection
+        row = conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key: str, model: str, response: dict):
+        """Stores a response and evicts least recently used entries beyond the size bound."""
+        encoded = json.dumps(response, ensure_ascii=False)
+        size = len(encoded.encode("utf-8"))
+        now = time.time()
+
+        conn = self.connection
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            previous = conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, encoded, size, now, now),
+            )
+            conn.execute("UPDATE counters SET value = value + ? WHERE name = 'bytes'", (size - (previous[0] if previous else 0),))
+            conn.execute("DELETE FROM inflight WHERE key = ?", (key,))
+            self._evict(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _evict(self, conn: sqlite3.Connection):
+        """Deletes least recently used responses until the cache is below 90% of its size bound."""
+        total_bytes = conn.execute("SELECT value FROM counters WHERE name = 'bytes'").fetchone()[0]
+        if total_bytes <= self.max_bytes:
+            return
+
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC").fetchall():
+            if total_bytes <= target:
+                break
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total_bytes -= size
+            evicted += 1
+
+        conn.execute("UPDATE counters SET value = ? WHERE name = 'bytes'", (total_bytes,))
+        conn.execute("UPDATE counters SET value = value + ? WHERE name = 'evictions'", (evicted,))
+        self.log.info(f"Evicted {evicted} cached responses ({total_bytes / 1e6:.1f} MB left in {self.cache_path})")
+
+    def _count(self, name: str):
+        with self._counter_lock:
+            setattr(self, name, getattr(self, name) + 1)
+        self.connection.execute("UPDATE counters SET value = value + 1 WHERE name = ?", (name,))
+
+    def _claim(self, key: str) -> bool:
+        """Claims the computation of a key for this process, taking over stale claims."""
+        conn = self.connection
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT owner, started FROM inflight WHERE key = ?", (key,)).fetchone()
+            if row is not None and time.time() - row[1] < self.inflight_timeout:
+                conn.execute("COMMIT")
+                return False
+            conn.execute("INSERT OR REPLACE INTO inflight (key, owner, started) VALUES (?, ?, ?)", (key, self.owner, time.time()))
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _release(self, key: str):
+        self.connection.execute("DELETE FROM inflight WHERE key = ? AND owner = ?", (key, self.owner))
+
+    def get_or_compute(self, payload: dict, compute):
+        """
+        Returns the cached response for the payload, or calls `compute` exactly once across all
+        concurrent identical requests and caches its result.
+
+        :param payload: The request payload.
+        :param compute: Callable returning (response_json, status); only complete "Success" responses are cached.
+        :return: A tuple (response_json, status, cache_hit).
+        """
+        key = self.make_key(payload)
+
+        while True:
+            response = self.get(key)
+            if response is not None:
+                self._count("hits")
+                return response, "Success", True
+
+            # Single flight within the process: one leader thread per key
+            with self._flights_lock:
+                event = self._flights.get(key)
+                is_leader = event is None
+                if is_leader:
+                    event = self._flights[key] = threading.Event()
+
+            if not is_leader:
+                event.wait()
+                continue
+
+            try:
+                # Single flight across processes: wait while another process computes the key
+                while not self._claim(key):
+                    time.sleep(self.poll_interval)
+                    response = self.get(key)
+                    if response is not None:
+                        self._count("hits")
+                        return response, "Success", True
+
+                response = self.get(key)
+                if response is not None:
+                    self._release(key)
+                    self._count("hits")
+                    return response, "Success", True
+
+                self._count("misses")
+                try:
+                    response, status = compute()
+                except BaseException:
+                    self._release(key)
+                    raise
+
+                if status == "Success" and self.is_complete(response):
+                    self.put(key, payload.get("model"), response)
+                else:
+                    self._release(key)
+                return response, status, False
+            finally:
+                with self._flights_lock:
+                    self._flights.pop(key, None)
+                event.set()
+
+    async def aget_or_compute(self, payload: dict, acompute):
+        """
+        Asynchronous variant of get_or_compute for the asyncio execution mode. Concurrent identical
+        requests on the same event loop await a single computation; database access runs in a thread.
+
+        :param payload: The request payload.
+        :param acompute: Coroutine function returning (response_json, status).
+        :return: A tuple (response_json, status, cache_hit).
+        """
+        key = self.make_key(payload)
+        flights = self._async_flights.setdefault(asyncio.get_running_loop(), {})
+
+        while True:
+            response = await asyncio.to_thread(self.get, key)
+            if response is not None:
+                await asyncio.to_thread(self._count, "hits")
+                return response, "Success", True
+
+            if key in flights:
+                await asyncio.wait([flights[key]])
+                continue
+
+            flight = flights[key] = asyncio.get_running_loop().create_future()
+            try:
+                await asyncio.to_thread(self._count, "misses")
+                response, status = await acompute()
+                if status == "Success" and self.is_complete(response):
+                    await asyncio.to_thread(self.put, key, payload.get("model"), response)
+                return response, status, False
+            finally:
+                flights.pop(key, None)
+                flight.set_result(None)
+
+    def stats(self) -> dict:
+        """Hit/miss counters of this process and persisted totals of the cache file."""
+        totals = dict(self.connection.execute("SELECT name, value FROM counters").fetchall())
+        entries = self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {
+            "process_hits": self.hits,
+            "process_misses": self.misses,
+            "total_hits": totals.get("hits", 0),
+            "total_misses": totals.get("misses", 0),
+            "evictions": totals.get("evictions", 0),
+            "entries": entries,
+            "bytes": totals.get("bytes", 0),
+        }
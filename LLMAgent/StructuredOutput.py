@@ -0,0 +1,192 @@
+import re
+import json
+
+from LLMAgent.InstructionPrompt import PREDICTION_OPTIONS
+
+
+# Prefix of the follow-up prompts asking for missing fields (also recognised by the mock server)
+REASK_PREFIX = "Your previous answer was incomplete."
+
+AGREEMENT_OPTIONS = ("Agree", "Partially Agree", "Disagree")
+
+_FENCE_PATTERN = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL | re.IGNORECASE)
+_TRAILING_COMMA_PATTERN = re.compile(r",\s*([}\]])")
+# Complete "key": "string" pairs of a (possibly partial) JSON object
+_STRING_FIELD_PATTERN = re.compile(r'"(\w+)"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+def _normalise(value: str) -> str:
+    return " ".join(re.findall(r"[a-z0-9]+", str(value).lower()))
+
+
+def loads_lenient(text: str):
+    """
+    Parses the JSON object of an LLM response, repairing the usual near misses: code fences, text
+    around the object, trailing commas, and a response cut off before its closing brackets.
+
+    :return: The parsed object, or None if no object can be recovered.
+    """
+    if not text:
+        return None
+    fenced = _FENCE_PATTERN.search(text)
+    text = fenced.group(1) if fenced else text
+
+    start = text.find("{")
+    if start < 0:
+        return None
+    text = _TRAILING_COMMA_PATTERN.sub(r"\1", text[start:]).rstrip()
+
+    try:
+        # Text after the object is ignored
+        return json.JSONDecoder().raw_decode(text)[0]
+    except json.JSONDecodeError:
+        pass
+
+    # Truncated object: close it, dropping unfinished trailing fields until it parses
+    for cut in [len(text)] + [i for i in range(len(text) - 1, 0, -1) if text[i] == ","][:20]:
+        try:
+            return json.loads(_TRAILING_COMMA_PATTERN.sub(r"\1", _close(text[:cut])))
+        except json.JSONDecodeError:
+            continue
+    return None
+
+
+def _close(text: str) -> str:
+    """Text followed by the quote and brackets it leaves open."""
+    closing, in_string, escaped = [], False, False
+    for char in text:
+        if in_string:
+            in_string = escaped or char != '"'
+            escaped = char == "\\" and not escaped
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            closing.append("}" if char == "{" else "]")
+        elif char in "}]" and closing:
+            closing.pop()
+    return text + ('"' if in_string else "") + "".join(reversed(closing))
+
+
+class OutputSchema:
+
+    def __init__(self, name: str, fields: dict):
+        """
+        Expected JSON object of an agent phase.
+
+        Each field is described by a dict with "description" and optionally "enum" (allowed string
+        values, matched case- and punctuation-insensitively), "items" (fields of the objects of a
+        list field) and "required" (default True; optional fields are never re-asked for).
+
+        :param name: Phase name (e.g. "decision").
+        :param fields: {key: field description}, in the order the LLM should write them.
+        """
+        self.name = name
+        self.fields = fields
+
+    def instructions(self, keys: list = None) -> str:
+        """Output format block appended to the prompt (JSON mode requires the word "json" in the prompt)."""
+        lines = []
+        for key in keys or self.fields:
+            field = self.fields[key]
+            if "enum" in field:
+                lines.append(f'- "{key}": one of {", ".join(json.dumps(option) for option in field["enum"])}. {field["description"]}')
+            elif "items" in field:
+                item_keys = ", ".join(f'"{item}" ({description})' for item, description in field["items"].items())
+                lines.append(f'- "{key}": list of objects with {item_keys}. {field["description"]}')
+            else:
+                lines.append(f'- "{key}": string. {field["description"]}')
+        return ("Respond only with a single JSON object (no text before or after it) with the following keys:\n"
+                + "\n".join(lines))
+
+    def reask_prompt(self, missing: list) -> str:
+        """Short follow-up asking only for the missing or invalid fields."""
+        return f"{REASK_PREFIX} Reply with the missing fields only.\n\n{self.instructions(missing)}"
+
+    def validate(self, data, keys: list = None) -> tuple[dict, list]:
+        """
+        Repairs and validates a parsed object.
+
+        :param data: Parsed JSON (anything; non-objects count as empty).
+        :param keys: Fields to validate (default: all).
+        :return: The valid fields and the list of missing or invalid ones.
+        """
+        keys = list(keys or self.fields)
+        data = {str(key).strip().lower(): value for key, value in data.items()} if isinstance(data, dict) else {}
+
+        valid, missing = {}, []
+        for key in keys:
+            value = self._repair(self.fields[key], data.get(key))
+            if value is not None:
+                valid[key] = value
+            elif self.fields[key].get("required", True):
+                missing.append(key)
+        return valid, missing
+
+    def parse(self, text: str, keys: list = None) -> tuple[dict, list]:
+        """Valid fields of a raw response and the missing or invalid ones."""
+        data = loads_lenient(text)
+        if not isinstance(data, dict):
+            data = self.labelled_fields(text or "")
+        return self.validate(data, keys)
+
+    def labelled_fields(self, text: str) -> dict:
+        """String fields of a plain-text answer ("Prediction: Bullish"), each running until the next label."""
+        labels = "|".join(re.escape(key) for key, field in self.fields.items() if "items" not in field)
+        if not labels:
+            return {}
+        matches = list(re.finditer(rf"^[\W_]*({labels})[\W_]*:\s*", text, re.IGNORECASE | re.MULTILINE))
+        return {match.group(1).lower(): text[match.end():matches[i + 1].start() if i + 1 < len(matches) else len(text)].strip()
+                for i, match in enumerate(matches)}
+
+    def partial(self, text: str) -> dict:
+        """Valid string fields already complete in a partial (streamed) response."""
+        fields = {key.lower(): value for key, value in _STRING_FIELD_PATTERN.findall(text)}
+        return {key: value for key, value in ((key, self._repair(self.fields[key], fields.get(key))) for key in self.fields)
+                if value is not None}
+
+    @staticmethod
+    def _repair(field: dict, value):
+        if "items" in field:
+            if isinstance(value, dict):
+                value = [value]
+            if not isinstance(value, list):
+                return None
+            item_keys = list(field["items"])
+            items = []
+            for item in value:
+                # A bare string is taken as the first item field (e.g. a title without relevance)
+                item = {item_keys[0]: item} if isinstance(item, str) else item
+                if not isinstance(item, dict):
+                    continue
+                item = {str(key).strip().lower(): value for key, value in item.items()}
+                if str(item.get(item_keys[0]) or "").strip():
+                    items.append({key: str(item.get(key) or "").strip() for key in item_keys})
+            return items or None
+
+        if value is None or isinstance(value, (dict, list)):
+            return None
+        value = str(value).strip().strip("*").strip()
+        if not value:
+            return None
+        if "enum" in field:
+            options = {_normalise(option): option for option in field["enum"]}
+            return options.get(_normalise(value))
+        return value
+
+
+DECISION_SCHEMA = OutputSchema("decision", {
+    "prediction": {"enum": PREDICTION_OPTIONS, "description": "Next day price movement of the asset."},
+    "explanation": {"description": "Detailed explanation of the prediction."},
+})
+
+ARGUMENT_SCHEMA = OutputSchema("argument", {
+    "agreement": {"enum": AGREEMENT_OPTIONS, "description": "Whether you agree with the other agents."},
+    "response": {"description": "Why you agree or disagree with the other agents' views."},
+    "prediction": {"enum": PREDICTION_OPTIONS, "description": "Your (possibly updated) prediction."},
+})
+
+FILTER_SCHEMA = OutputSchema("filter", {
+    "selected": {"items": {"title": "exact title of the news", "relevance": "why it is relevant"},
+                 "description": "Selected news, most relevant first."},
+    "summary": {"description": "Overall summary of the selected news.", "required": False},
+})
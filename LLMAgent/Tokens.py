@@ -0,0 +1,32 @@
+import math
+
+
+# Average characters per token of the DeepSeek tokenizer on English text (used when no usage is reported)
+CHARS_PER_TOKEN = 4.0
+
+# Formatting overhead of a chat message (role and separators)
+TOKENS_PER_MESSAGE = 4
+
+
+def estimate_text_tokens(text: str) -> int:
+    """Approximate number of tokens of a text."""
+    return math.ceil(len(text or "") / CHARS_PER_TOKEN)
+
+
+def estimate_message_tokens(message: dict) -> int:
+    """Approximate number of tokens of a single chat message."""
+    return TOKENS_PER_MESSAGE + estimate_text_tokens(message.get("content", ""))
+
+
+def estimate_prompt_tokens(messages: list) -> int:
+    """Approximate number of prompt tokens of a chat completion request."""
+    return sum(estimate_message_tokens(message) for message in messages)
+
+
+def usage_tokens(response_json: dict):
+    """Total tokens reported in the usage field of a chat completion response (None if absent)."""
+    usage = (response_json or {}).get("usage") or {}
+    total = usage.get("total_tokens")
+    if total is None and "prompt_tokens" in usage:
+        total = usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0)
+    return total
@@ -0,0 +1,393 @@
+import os
+import json
+import time
+import random
+import asyncio
+import weakref
+import threading
+import email.utils
+import requests
+from requests.adapters import HTTPAdapter
+
+# Optional dependency: only needed for the asyncio execution mode
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from Utilities.Logger import logger
+from LLMAgent.Tokens import usage_tokens, estimate_text_tokens
+
+
+class Transport:
+    """
+    Shared HTTP transport of all LLM agents in a process.
+
+    Requests go through one pooled keep-alive session (requests for the synchronous path, aiohttp for
+    the asyncio execution mode), so TCP and TLS setup is paid once per connection instead of once per
+    call. Every attempt has connect and read timeouts; connection errors, timeouts, 429 and 5xx
+    responses are retried with exponential backoff and full jitter, honouring `Retry-After`.
+    The latency of every attempt is logged and accumulated in per-process statistics.
+    """
+
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, connect_timeout: float = 10.0, read_timeout: float = 300.0, max_retries: int = 5,
+                 backoff_base: float = 1.0, backoff_max: float = 60.0, pool_maxsize: int = 64):
+        """
+        :param connect_timeout: Seconds to establish a connection.
+        :param read_timeout: Seconds to wait for the response (per attempt).
+        :param max_retries: Number of retries after the first attempt.
+        :param backoff_base: Base delay in seconds of the exponential backoff.
+        :param backoff_max: Maximum delay in seconds between two attempts.
+        :param pool_maxsize: Maximum number of pooled connections per host.
+        """
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = int(max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool_maxsize = int(pool_maxsize)
+
+        self._session = None
+        self._session_pid = None
+        self._session_lock = threading.Lock()
+        self._async_sessions = weakref.WeakKeyDictionary()
+        self._stats_lock = threading.Lock()
+        self._stats = {"requests": 0, "attempts": 0, "retries": 0, "failures": 0, "latency_seconds": 0.0}
+        self.log = logger(name="Transport", log_file="Logs/backtest.log")
+
+    @property
+    def settings(self) -> tuple:
+        return (self.connect_timeout, self.read_timeout, self.max_retries, self.backoff_base, self.backoff_max, self.pool_maxsize)
+
+    @classmethod
+    def shared(cls, *settings):
+        """Returns the transport of the current process for the given settings."""
+        key = (os.getpid(), settings)
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(*settings)
+            return cls._instances[key]
+
+    @classmethod
+    def from_config(cls, llm_client: dict):
+        """Builds the shared transport from the llm_client configuration section."""
+        llm_client = llm_client or {}
+        return cls.shared(
+            llm_client.get("connect_timeout", 10.0),
+            llm_client.get("read_timeout", 300.0),
+            llm_client.get("max_retries", 5),
+            llm_client.get("backoff_base", 1.0),
+            llm_client.get("backoff_max", 60.0),
+            llm_client.get("pool_maxsize", 64),
+        )
+
+    def __reduce__(self):
+        # Sessions and locks are per process: re-attach to the worker's own instance
+        return (Transport.shared, self.settings)
+
+    @property
+    def session(self) -> requests.Session:
+        """
+        Pooled keep-alive session of the current process, shared by all its threads (the adapter's
+        connection pool is thread-safe and holds up to pool_maxsize connections per host), so
+        short-lived thread pools reuse the open connections. A forked worker builds its own.
+        """
+        if self._session is None or self._session_pid != os.getpid():
+            with self._session_lock:
+                if self._session is None or self._session_pid != os.getpid():
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_maxsize, max_retries=0)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._session = session
+                    self._session_pid = os.getpid()
+        return self._session
+
+    def async_session(self):
+        """Returns the aiohttp session of the running event loop, creating it on first use."""
+        if aiohttp is None:
+            raise ImportError("aiohttp is required for the asyncio execution mode (pip install aiohttp)")
+
+        loop = asyncio.get_running_loop()
+        session = self._async_sessions.get(loop)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=0, limit_per_host=self.pool_maxsize),
+                timeout=aiohttp.ClientTimeout(connect=self.connect_timeout, sock_read=self.read_timeout),
+            )
+            self._async_sessions[loop] = session
+        return session
+
+    async def close_async_session(self):
+        """Closes the aiohttp session of the running event loop."""
+        session = self._async_sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None and not session.closed:
+            await session.close()
+
+    def post(self, url: str, headers: dict, payload: dict, label: str = "", limiter=None, tokens: int = 0,
+             stop_when=None) -> tuple[dict, str]:
+        """
+        Posts a JSON payload, retrying transient failures.
+
+        :param url: Endpoint URL.
+        :param headers: Request headers.
+        :param payload: JSON payload.
+        :param label: Name used in the latency logs (e.g., the agent name).
+        :param limiter: Optional shared RateLimiter every attempt has to pass.
+        :param tokens: Estimated tokens of the request (reserved in the limiter's token budget).
+        :param stop_when: For streamed requests ("stream": True), optional predicate on the partial content;
+                          the stream is closed as soon as it returns True.
+        :return: A tuple containing the response JSON (None on failure) and a status message.
+        :raises requests.exceptions.RequestException: If the last attempt failed to connect or timed out.
+        """
+        self._count("requests")
+        for attempt in range(self.max_retries + 1):
+            if limiter is not None:
+                limiter.acquire(tokens)
+            start_time = time.time()
+            response_json, status_code, latency = None, None, None
+            try:
+                response = self.session.post(url, headers=headers, json=payload, stream=bool(payload.get("stream")),
+                                             timeout=(self.connect_timeout, self.read_timeout))
+                # Every response is read and closed here (streamed error responses included), so its pooled
+                # connection is returned before any backoff
+                with response:
+                    if response.status_code == 200 and payload.get("stream"):
+                        accumulator = StreamAccumulator(start_time, stop_when)
+                        for line in response.iter_lines(chunk_size=None):
+                            if accumulator.feed(line):
+                                break
+                        response_json = self._finish_stream(accumulator, label)
+                    elif response.status_code == 200:
+                        response_json = response.json()
+                    else:
+                        response_text = response.text
+                        retry_after = response.headers.get("Retry-After")
+                status_code = response.status_code
+                latency = self._record_attempt(label, attempt, start_time, status_code)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                latency = self._record_attempt(label, attempt, start_time, repr(e))
+                if attempt == self.max_retries:
+                    self._count("failures")
+                    raise
+            finally:
+                # The slot is returned whatever the attempt raised (decode errors, bad stream lines, ...)
+                if limiter is not None:
+                    limiter.release(tokens, usage_tokens(response_json), status_code,
+                                    latency if latency is not None else time.time() - start_time)
+
+            if status_code is None:
+                time.sleep(self._backoff(attempt))
+                continue
+            if status_code == 200:
+                return response_json, "Success"
+
+            if status_code in self.RETRY_STATUS and attempt < self.max_retries:
+                time.sleep(self._backoff(attempt, retry_after))
+                continue
+
+            self._count("failures")
+            self.log.error(f"API Error {status_code}: {response_text}")
+            return None, f"API Error {status_code}"
+
+    async def apost(self, url: str, headers: dict, payload: dict, label: str = "", limiter=None, tokens: int = 0,
+                    stop_when=None) -> tuple[dict, str]:
+        """
+        Asynchronous variant of post on the running event loop.
+
+        :raises aiohttp.ClientError | asyncio.TimeoutError: If the last attempt failed to connect or timed out.
+        """
+        self._count("requests")
+        session = self.async_session()
+        for attempt in range(self.max_retries + 1):
+            if limiter is not None:
+                await limiter.aacquire(tokens)
+            start_time = time.time()
+            response_json, status_code, latency = None, None, None
+            try:
+                async with session.post(url, headers=headers, json=payload) as response:
+                    if response.status == 200 and payload.get("stream"):
+                        accumulator = StreamAccumulator(start_time, stop_when)
+                        async for line in response.content:
+                            if accumulator.feed(line):
+                                break
+                        response_json = self._finish_stream(accumulator, label)
+                    elif response.status == 200:
+                        response_json = await response.json(content_type=None)
+                    else:
+                        response_text = await response.text()
+                        retry_after = response.headers.get("Retry-After")
+                    status_code = response.status
+                latency = self._record_attempt(label, attempt, start_time, status_code)
+            except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+                latency = self._record_attempt(label, attempt, start_time, repr(e))
+                if attempt == self.max_retries:
+                    self._count("failures")
+                    raise
+            finally:
+                # The slot is returned whatever the attempt raised, including task cancellation
+                # (the release runs to completion in its worker thread even if this await is cancelled)
+                if limiter is not None:
+                    await asyncio.to_thread(limiter.release, tokens, usage_tokens(response_json), status_code,
+                                            latency if latency is not None else time.time() - start_time)
+
+            if status_code is None:
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+            if status_code == 200:
+                return response_json, "Success"
+
+            if status_code in self.RETRY_STATUS and attempt < self.max_retries:
+                await asyncio.sleep(self._backoff(attempt, retry_after))
+                continue
+
+            self._count("failures")
+            self.log.error(f"API Error {status_code}: {response_text}")
+            return None, f"API Error {status_code}"
+
+    def _finish_stream(self, accumulator, label: str) -> dict:
+        """Assembles a streamed completion and records its time-to-first-token and throughput."""
+        response_json = accumulator.response_json()
+        metrics = accumulator.metrics()
+        with self._stats_lock:
+            self._stats["streams"] = self._stats.get("streams", 0) + 1
+            self._stats["early_stops"] = self._stats.get("early_stops", 0) + accumulator.stopped_early
+            if metrics["ttft_seconds"] is not None:
+                self._stats["ttft_seconds"] = self._stats.get("ttft_seconds", 0.0) + metrics["ttft_seconds"]
+        self.log.info(
+            f"Stream for {label or 'LLM'}: first token after {metrics['ttft_seconds']} seconds, "
+            f"{metrics['completion_tokens']} tokens at {metrics['tokens_per_second']} tokens/sec"
+            + (" (stopped early)" if accumulator.stopped_early else "")
+        )
+        return response_json
+
+    def _backoff(self, attempt: int, retry_after: str = None) -> float:
+        """Full-jitter exponential backoff, never shorter than the server's Retry-After."""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        return max(delay, self._parse_retry_after(retry_after))
+
+    @staticmethod
+    def _parse_retry_after(retry_after: str) -> float:
+        """Retry-After in seconds (delta-seconds or HTTP-date), 0 if absent or invalid."""
+        if not retry_after:
+            return 0.0
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            pass
+        try:
+            return max(email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return 0.0
+
+    def _record_attempt(self, label: str, attempt: int, start_time: float, outcome):
+        latency = time.time() - start_time
+        with self._stats_lock:
+            self._stats["attempts"] += 1
+            self._stats["retries"] += attempt > 0
+            self._stats["latency_seconds"] += latency
+        self.log.info(f"Request attempt {attempt + 1}/{self.max_retries + 1} for {label or 'LLM'}: {outcome} in {latency:.2f} seconds")
+        return latency
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def stats(self) -> dict:
+        """Request, attempt, retry and failure counters of this process."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["mean_attempt_seconds"] = round(stats["latency_seconds"] / stats["attempts"], 3) if stats["attempts"] else None
+        if stats.get("streams"):
+            stats["mean_ttft_seconds"] = round(stats.pop("ttft_seconds", 0.0) / stats["streams"], 3)
+        stats["latency_seconds"] = round(stats["latency_seconds"], 3)
+        return stats
+
+
+class StreamAccumulator:
+    """
+    Incremental reader of a server-sent-events chat completion stream.
+
+    Content and reasoning deltas are appended as the chunks arrive; the optional `stop_when`
+    predicate is evaluated on the partial content after every chunk, so the caller can stop
+    reading as soon as the part of the answer it needs is complete.
+    """
+
+    def __init__(self, start_time: float, stop_when=None):
+        self.start_time = start_time
+        self.stop_when = stop_when
+        self.content = []
+        self.reasoning_content = []
+        self.usage = None
+        self.finish_reason = None
+        self.first_token_time = None
+        self.end_time = None
+        self.stopped_early = False
+
+    def feed(self, line) -> bool:
+        """Consumes one SSE line; returns True once the stream is finished or may be stopped."""
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.strip()
+        if not line.startswith("data:"):
+            return False
+
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            self.end_time = time.time()
+            return True
+
+        chunk = json.loads(data)
+        self.usage = chunk.get("usage") or self.usage
+        for choice in chunk.get("choices") or []:
+            delta = choice.get("delta") or {}
+            if delta.get("content") or delta.get("reasoning_content"):
+                if self.first_token_time is None:
+                    self.first_token_time = time.time()
+                self.content.append(delta.get("content") or "")
+                self.reasoning_content.append(delta.get("reasoning_content") or "")
+            self.finish_reason = choice.get("finish_reason") or self.finish_reason
+
+        self.end_time = time.time()
+        if self.stop_when is not None and self.finish_reason is None and self.stop_when("".join(self.content)):
+            self.stopped_early = True
+            return True
+        return False
+
+    def response_json(self) -> dict:
+        """The completion in the non-streamed response format."""
+        message = {"role": "assistant", "content": "".join(self.content)}
+        reasoning_content = "".join(self.reasoning_content)
+        if reasoning_content:
+            message["reasoning_content"] = reasoning_content
+        response_json = {"choices": [{"index": 0, "message": message,
+                                      "finish_reason": "early_stop" if self.stopped_early else self.finish_reason}]}
+        if self.usage is not None:
+            response_json["usage"] = self.usage
+        return response_json
+
+    def metrics(self) -> dict:
+        """Time to first token and generation throughput of the stream."""
+        completion_tokens = (self.usage or {}).get("completion_tokens")
+        if completion_tokens is None:
+            completion_tokens = estimate_text_tokens("".join(self.content) + "".join(self.reasoning_content))
+        ttft = self.first_token_time - self.start_time if self.first_token_time is not None else None
+        generation_time = self.end_time - self.first_token_time if self.first_token_time is not None and self.end_time else None
+        return {
+            "ttft_seconds": round(ttft, 3) if ttft is not None else None,
+            "completion_tokens": completion_tokens,
+            "tokens_per_second": round(completion_tokens / generation_time, 1) if generation_time else None,
+        }
+
+
+async def close_async_sessions():
+    """Closes the aiohttp sessions that the transports of this process opened on the running event loop."""
+    with Transport._instances_lock:
+        transports = [transport for (pid, _), transport in Transport._instances.items() if pid == os.getpid()]
+    for transport in transports:
+        await transport.close_async_session()
@@ -0,0 +1,311 @@
+import os
+import json
+import time
+import inspect
+import functools
+import threading
+import contextvars
+import pandas as pd
+from pathlib import Path
+from contextlib import contextmanager
+
+from Utilities.Logger import logger
+from LLMAgent.Tokens import estimate_prompt_tokens, estimate_text_tokens
+
+
+# List prices in USD per million tokens (override with usage_prices in the llm_client section)
+DEFAULT_PRICES = {
+    "deepseek-chat": {"input_cache_hit": 0.028, "input_cache_miss": 0.28, "output": 0.42},
+    "deepseek-reasoner": {"input_cache_hit": 0.028, "input_cache_miss": 0.28, "output": 0.42},
+}
+
+TOKEN_COLUMNS = ["prompt_tokens", "completion_tokens", "cached_tokens", "reasoning_tokens", "total_tokens"]
+
+LEDGER_COLUMNS = ["date", "phase", "agent", "model", *TOKEN_COLUMNS, "cost", "estimated"]
+
+# Date and phase of the LLM calls made in the current thread or asyncio task
+_usage_tags = contextvars.ContextVar("usage_tags", default={})
+
+
+@contextmanager
+def usage_tags(**tags):
+    """Tags the LLM calls made inside the block (e.g. date="2024-01-02" or phase="reflection")."""
+    token = _usage_tags.set({**_usage_tags.get(), **tags})
+    try:
+        yield
+    finally:
+        _usage_tags.reset(token)
+
+
+def metered(phase: str):
+    """Decorator tagging the LLM calls of a function (or coroutine function) with a phase."""
+    def decorator(function):
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with usage_tags(phase=phase):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with usage_tags(phase=phase):
+                return function(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def parse_usage(response_json: dict):
+    """
+    Token counts of the usage field of a chat completion response (None if absent).
+
+    Cached prompt tokens are read from DeepSeek's prompt_cache_hit_tokens or the OpenAI-style
+    prompt_tokens_details, reasoning tokens from completion_tokens_details.
+    """
+    usage = (response_json or {}).get("usage")
+    if not usage:
+        return None
+
+    prompt_tokens = usage.get("prompt_tokens") or 0
+    completion_tokens = usage.get("completion_tokens") or 0
+    cached_tokens = usage.get("prompt_cache_hit_tokens")
+    if cached_tokens is None:
+        cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+    reasoning_tokens = (usage.get("completion_tokens_details") or {}).get("reasoning_tokens") or 0
+
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cached_tokens": cached_tokens,
+        "reasoning_tokens": reasoning_tokens,
+        "total_tokens": usage.get("total_tokens") or prompt_tokens + completion_tokens,
+    }
+
+
+def estimate_usage(response_json: dict, messages: list) -> dict:
+    """
+    Approximate token counts of a call without a usage field (e.g. a stream closed early, before
+    its final usage chunk): the prompt messages and the streamed content and reasoning.
+    """
+    message = (((response_json or {}).get("choices") or [{}])[0]).get("message") or {}
+    prompt_tokens = estimate_prompt_tokens(messages or [])
+    completion_tokens = estimate_text_tokens(message.get("content")) + estimate_text_tokens(message.get("reasoning_content"))
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cached_tokens": 0,
+        "reasoning_tokens": 0,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+class UsageMeter:
+    """
+    Per-call token and cost ledger.
+
+    Every completed LLM request is appended to a JSONL ledger with its agent, phase, model and
+    date, its prompt, completion, cached and reasoning tokens, and its cost. All processes append
+    to the same file (one O_APPEND write per call, so lines never interleave). Response cache hits
+    cost nothing and are not metered.
+    """
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, ledger_path: str, prices: dict = None):
+        """
+        :param ledger_path: Path to the JSONL usage ledger.
+        :param prices: USD per million tokens by model: {"input_cache_hit", "input_cache_miss", "output"}.
+        """
+        self.ledger_path = Path(ledger_path)
+        self.prices = {**DEFAULT_PRICES, **(prices or {})}
+
+        self._fd = None
+        self._lock = threading.Lock()
+        self.log = logger(name="UsageMeter", log_file="Logs/backtest.log")
+
+    @classmethod
+    def shared(cls, ledger_path: str, prices: dict = None):
+        """Returns the meter of the current process for the given ledger."""
+        key = (os.getpid(), os.path.abspath(ledger_path))
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(ledger_path, prices=prices)
+            return cls._instances[key]
+
+    @classmethod
+    def from_config(cls, llm_client: dict):
+        """Builds the shared meter from the llm_client configuration section (None if disabled)."""
+        ledger_path = (llm_client or {}).get("usage_ledger_path")
+        if not ledger_path:
+            return None
+        return cls.shared(str(ledger_path), prices=llm_client.get("usage_prices"))
+
+    def __reduce__(self):
+        # File descriptors are per process: re-attach to the worker's own meter
+        return (UsageMeter.shared, (str(self.ledger_path), self.prices))
+
+    def cost(self, model: str, usage: dict) -> float:
+        """Cost in USD of a call (0 for models without a price)."""
+        prices = self.prices.get(model)
+        if prices is None:
+            return 0.0
+        cache_miss_tokens = usage["prompt_tokens"] - usage["cached_tokens"]
+        return (usage["cached_tokens"] * prices.get("input_cache_hit", 0.0)
+                + cache_miss_tokens * prices.get("input_cache_miss", 0.0)
+                + usage["completion_tokens"] * prices.get("output", 0.0)) / 1_000_000
+
+    def record(self, agent: str, model: str, response_json: dict, messages: list = None):
+        """
+        Appends the usage of a completed request to the ledger.
+
+        :param messages: Prompt messages of the request, to estimate the usage of a response that
+                         reports none (the record is then marked as estimated).
+        """
+        usage = parse_usage(response_json)
+        estimated = usage is None
+        if estimated:
+            usage = estimate_usage(response_json, messages)
+
+        tags = _usage_tags.get()
+        record = {
+            "time": round(time.time(), 3),
+            "date": tags.get("date"),
+            "phase": tags.get("phase"),
+            "agent": agent,
+            "model": model,
+            **usage,
+            "cost": round(self.cost(model, usage), 8),
+            "estimated": estimated,
+            "pid": os.getpid(),
+        }
+
+        with self._lock:
+            if self._fd is None:
+                os.makedirs(self.ledger_path.parent, exist_ok=True)
+                self._fd = os.open(self.ledger_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            os.write(self._fd, (json.dumps(record) + "\n").encode("utf-8"))
+
+
+def read_ledger(ledger_path, offset: int = 0) -> tuple[pd.DataFrame, int]:
+    """
+    Usage records of a ledger from a byte offset on.
+
+    :return: DataFrame with one row per call, and the offset after the last complete line.
+    """
+    if not os.path.exists(ledger_path):
+        return pd.DataFrame(columns=LEDGER_COLUMNS), offset
+
+    with open(ledger_path, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+
+    # A line still being written by another process is read on the next call
+    complete = data[:data.rfind(b"\n") + 1]
+    records = [json.loads(line) for line in complete.decode("utf-8").splitlines() if line.strip()]
+    return pd.DataFrame(records, columns=LEDGER_COLUMNS), offset + len(complete)
+
+
+def summarise_usage(ledger_path, by: list = ("date", "agent", "phase", "model")) -> pd.DataFrame:
+    """Calls, tokens and cost of a ledger, aggregated by the given fields."""
+    records, _ = read_ledger(ledger_path)
+    records = records.fillna({key: "unknown" for key in by})
+    return records.groupby(list(by)).agg(
+        calls=("model", "size"),
+        estimated_calls=("estimated", lambda estimated: int(estimated.fillna(False).astype(bool).sum())),
+        **{column: (column, "sum") for column in [*TOKEN_COLUMNS, "cost"]},
+    ).round({"cost": 8}).reset_index()
+
+
+def usage_summary_path(results_path) -> Path:
+    """Usage summary stored next to the results file."""
+    results_path = Path(results_path)
+    return results_path.with_name(f"{results_path.stem}_usage.csv")
+
+
+class UsageBudget:
+
+    def __init__(self, ledger_path: str, max_cost: float = None, max_tokens: int = None, warmup_dates: int = 1):
+        """
+        Cost and token caps of a backtest run, checked before each date is handed out.
+
+        Only the usage recorded after the budget was created counts. A new date is scheduled only
+        if the spend so far, plus the spend of the costliest date for every date in flight and the
+        new one, stays within the caps, so the run stops before a cap is exceeded rather than after.
+        Until the first date finishes there is no per-date estimate, so at most `warmup_dates` dates
+        are in flight.
+
+        :param ledger_path: Path to the usage ledger written by the agents.
+        :param max_cost: Maximum spend of the run in USD (None for no cap).
+        :param max_tokens: Maximum total tokens of the run (None for no cap).
+        :param warmup_dates: Dates in flight before the first one finishes.
+        """
+        self.ledger_path = ledger_path
+        self.max_cost = max_cost
+        self.max_tokens = max_tokens
+        self.warmup_dates = max(int(warmup_dates), 1)
+        self.cost = 0.0
+        self.tokens = 0
+        self.calls = 0
+        self.exhausted = False
+        self._by_date = {}
+
+        self._offset = os.path.getsize(ledger_path) if os.path.exists(ledger_path) else 0
+        self._lock = threading.Lock()
+        self.log = logger(name="UsageBudget", log_file="Logs/backtest.log")
+
+    @classmethod
+    def from_config(cls, llm_client: dict):
+        """Builds the run budget from the llm_client configuration section (None without caps or ledger)."""
+        llm_client = llm_client or {}
+        max_cost, max_tokens = llm_client.get("budget_max_cost"), llm_client.get("budget_max_tokens")
+        if not llm_client.get("usage_ledger_path") or (max_cost is None and max_tokens is None):
+            return None
+        return cls(str(llm_client["usage_ledger_path"]), max_cost=max_cost, max_tokens=max_tokens,
+                   warmup_dates=llm_client.get("budget_warmup_dates", 1))
+
+    def refresh(self):
+        """Adds the calls appended to the ledger since the last refresh."""
+        records, self._offset = read_ledger(self.ledger_path, self._offset)
+        self.calls += len(records)
+        self.cost += float(records["cost"].sum())
+        self.tokens += int(records["total_tokens"].sum())
+        for date, day in records.groupby(records["date"].fillna("unknown")):
+            cost, tokens = self._by_date.get(date, (0.0, 0))
+            self._by_date[date] = (cost + float(day["cost"].sum()), tokens + int(day["total_tokens"].sum()))
+
+    def needs_estimate(self, in_flight: int, completed: int) -> bool:
+        """Whether the next date must wait for the first one to finish (and give a per-date estimate)."""
+        return completed == 0 and in_flight >= self.warmup_dates
+
+    def allows(self, in_flight: int, completed: int) -> bool:
+        """
+        Whether another date can be scheduled.
+
+        :param in_flight: Dates handed out but not finished.
+        :param completed: Dates finished in this run.
+        """
+        with self._lock:
+            if self.exhausted:
+                return False
+            self.refresh()
+
+            # Costliest date so far (at least the average, which includes the partial spend of the dates in flight)
+            for index, (name, spent, cap) in enumerate((("cost", self.cost, self.max_cost), ("tokens", self.tokens, self.max_tokens))):
+                if cap is None:
+                    continue
+                per_date = max([spent / completed if completed else 0] + [day[index] for day in self._by_date.values()])
+                projected = spent + per_date * (in_flight + 1)
+                if projected > cap or spent >= cap:
+                    self.exhausted = True
+                    self.log.warning(f"Usage budget reached: {name} {spent:,.4f} spent, {projected:,.4f} projected with "
+                                     f"{in_flight} dates in flight (cap {cap:,}). No new dates are scheduled; "
+                                     f"raise the cap and run with --resume to continue.")
+                    return False
+            return True
+
+    def report(self) -> str:
+        with self._lock:
+            self.refresh()
+        return f"{self.calls} LLM calls, {self.tokens:,} tokens, ${self.cost:,.4f}"
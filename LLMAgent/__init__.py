@@ -1,9 +1,20 @@
 from .InstructionPrompt import *
+from .Transport import Transport
+from .RateLimiter import RateLimiter
+from .ContextWindow import ContextWindow
+from .UsageMeter import UsageMeter, UsageBudget
+from .StructuredOutput import OutputSchema
 from .BaseAgent import BaseAgent
 from .MacroAgent import TradingAgent, FilterAgent
 from .MultiAgent import MultiAgentNetwork
 
 __all__ = [
+    "Transport",
+    "RateLimiter",
+    "ContextWindow",
+    "UsageMeter",
+    "UsageBudget",
+    "OutputSchema",
     "BaseAgent",
     "TradingAgent",
     "FilterAgent",
@@ -0,0 +1,135 @@
+import os
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from threading import Lock
+
+from Utilities.Logger import logger
+
+
+class IndicatorSnapshot:
+    """
+    Point-in-time (as-of) view of one macro indicator frequency file.
+
+    The indicator panel is loaded once per process and kept as sorted observation dates, one value
+    array per indicator and one publication delay per indicator. "Last N published values as of
+    date D" is answered with a binary search on the observation dates, the publication delays are
+    applied as a single vectorised mask, and only the N returned rows are rendered as strings.
+    """
+
+    FREQ_DAYS = {"Daily": 1, "Weekly": 7, "Monthly": 30, "Quarterly": 90}
+
+    _registry = {}
+    _registry_lock = Lock()
+
+    def __init__(self, macro_csv, mapping_csv):
+        """
+        :param macro_csv: Path to the processed indicator CSV of a single frequency.
+        :param mapping_csv: Path to indicator_mapping.csv (Series ID, Renamed Series, Delay (Days)).
+        """
+        self.macro_csv = Path(macro_csv)
+        self.mapping_csv = Path(mapping_csv)
+        self.signature = self._signature(self.macro_csv, self.mapping_csv)
+        self.log = logger(name="IndicatorSnapshot", log_file="Logs/backtest.log")
+
+        # Infer frequency from the filename
+        self.frequency = next((freq for freq in self.FREQ_DAYS if freq in str(self.macro_csv)), "Unknown")
+        self.period_days = self.FREQ_DAYS.get(self.frequency)
+
+        self._load()
+        self.log.info(f"Indexed {len(self.dates)} {self.frequency} observations of {len(self.columns)} indicators from {self.macro_csv}")
+
+    @classmethod
+    def from_paths(cls, macro_csv, mapping_csv):
+        """Returns the shared snapshot for the given files, reloading it only if either file changed."""
+        key = (os.path.abspath(macro_csv), os.path.abspath(mapping_csv))
+        with cls._registry_lock:
+            snapshot = cls._registry.get(key)
+            if snapshot is None or snapshot.signature != cls._signature(macro_csv, mapping_csv):
+                snapshot = cls(macro_csv, mapping_csv)
+                cls._registry[key] = snapshot
+            return snapshot
+
+    @staticmethod
+    def _signature(*paths):
+        return tuple((os.stat(path).st_mtime_ns, os.stat(path).st_size) for path in paths)
+
+    def _load(self):
+        macro_df = pd.read_csv(self.macro_csv)
+        mapping_df = pd.read_csv(self.mapping_csv)
+
+        macro_df['Date'] = pd.to_datetime(macro_df['Date'])
+        macro_df = macro_df.sort_values(by='Date', ascending=True, kind="mergesort").reset_index(drop=True)
+
+        # Map Series IDs to Renamed Series
+        rename_dict = dict(zip(mapping_df['Series ID'], mapping_df['Renamed Series']))
+        macro_df.rename(columns=rename_dict, inplace=True)
+
+        self.columns = [col for col in macro_df.columns if col != "Date"]
+        self.dates = macro_df['Date'].to_numpy(dtype="datetime64[ns]")
+        self.values = [macro_df[col].to_numpy() for col in self.columns]
+
+        # Publication delay per indicator (NaT for indicators without a known delay)
+        delay_dict = dict(zip(mapping_df['Renamed Series'], mapping_df['Delay (Days)']))
+        self.delays = np.array(
+            [np.timedelta64(int(delay_dict[col]), "D") if pd.notna(delay_dict.get(col)) else np.timedelta64("NaT")
+             for col in self.columns],
+            dtype="timedelta64[ns]",
+        )
+
+    def as_of(self, current_date, last_periods=4):
+        """
+        Returns the last `last_periods` observations strictly before `current_date`, with values that
+        were not yet published on `current_date` masked.
+
+        :param current_date: The as-of date.
+        :param last_periods: Number of observations to return.
+        :return: (observation dates, published mask of shape [rows, indicators], row indices)
+        """
+        current = pd.to_datetime(current_date).to_datetime64()
+        end = np.searchsorted(self.dates, current, side="left")
+        rows = np.arange(max(end - last_periods, 0), end)
+        row_dates = self.dates[rows]
+
+        # An observation is published once current_date - delay has passed its date
+        cutoffs = current - self.delays
+        published = row_dates[:, None] <= cutoffs[None, :]
+        published |= np.isnat(cutoffs)[None, :]
+
+        return row_dates, published, rows
+
+    def format(self, current_date, last_periods=4):
+        """
+        Renders the as-of snapshot as the aligned text table used in the LLM prompt.
+
+        :param current_date: The as-of date.
+        :param last_periods: Number of observations to present.
+        :return: Formatted indicator table.
+        """
+        current = pd.to_datetime(current_date)
+        row_dates, published, rows = self.as_of(current, last_periods=last_periods)
+
+        # Compute period difference for concise LLM prompt
+        row_dates = pd.DatetimeIndex(row_dates)
+        if self.period_days is not None:
+            period_diff = [str(diff) for diff in (current - row_dates).days // self.period_days]
+            date_labels = [f"{date} (Past {diff} {self.frequency})" for date, diff in zip(row_dates.strftime('%Y-%m-%d'), period_diff)]
+        else:
+            period_diff = ["N/A"] * len(rows)
+            date_labels = list(row_dates.astype(str))
+
+        table = {"Date": date_labels}
+        for j, col in enumerate(self.columns):
+            table[col] = [str(value) if is_published else "Not Yet Published"
+                          for value, is_published in zip(self.values[j][rows], published[:, j])]
+        table["Period Diff"] = period_diff
+
+        # Determine column widths for alignment
+        col_widths = {col: max([len(str(col))] + [len(cell) for cell in cells]) + 2 for col, cells in table.items()}
+
+        # Construct formatted table
+        header = " | ".join(col.ljust(col_widths[col]) for col in table)
+        separator = "-" * len(header)
+        table_rows = [" | ".join(table[col][i].ljust(col_widths[col]) for col in table) for i in range(len(rows))]
+
+        return f"Here are the {self.frequency} macroeconomic indicators and their values:\n{header}\n{separator}\n" + "\n".join(table_rows)
@@ -0,0 +1,354 @@
+import re
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from Utilities.Logger import logger
+from LLMAgent.InstructionPrompt import PREDICTION_OPTIONS
+from LLMAgent.StructuredOutput import REASK_PREFIX
+from LLMAgent.Tokens import estimate_prompt_tokens, estimate_text_tokens
+
+
+# Latency of a completion (seconds before the first token): distribution, median and spread
+LATENCY_PROFILES = {
+    "none": {"distribution": "constant", "median": 0.0},
+    "fast": {"distribution": "lognormal", "median": 0.05, "sigma": 0.3},
+    "chat": {"distribution": "lognormal", "median": 1.5, "sigma": 0.5},
+    "reasoner": {"distribution": "lognormal", "median": 8.0, "sigma": 0.6},
+    "uniform": {"distribution": "uniform", "low": 0.5, "high": 3.0},
+}
+
+
+class MockLLMServer:
+    """
+    Local stand-in for the DeepSeek chat completions API (`POST /v1/chat/completions`).
+
+    Answers are generated from the prompt, in the formats the agents parse: the FilterAgent gets
+    `[Title]`/`[Relevance]` pairs naming news of its input, debate rounds get
+    `Agreement:`/`Response:`/`Prediction:` and decisions and reflections get
+    `Prediction:`/`Explanation:`. Requests in JSON mode (`response_format` json_object) get a JSON
+    object with the keys listed in the prompt's output instructions. Responses carry a `usage` field
+    and can be streamed as server-sent events. Latency follows a configurable profile, a share of the
+    requests can be answered with 429 (with Retry-After) or 5xx errors, and a share of the answers can
+    slip from the requested format, so throughput and resilience work can be done offline.
+
+    Point the agents at it with `base_url: "http://127.0.0.1:<port>/v1"` in the llm_client section.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_profile: str = "fast",
+                 latency_scale: float = 1.0, tokens_per_second: float = None, error_rate_429: float = 0.0,
+                 error_rate_5xx: float = 0.0, retry_after: float = 1.0, format_error_rate: float = 0.0, seed: int = None):
+        """
+        :param host: Host to bind.
+        :param port: Port to bind (0 picks a free port).
+        :param latency_profile: Name of a LATENCY_PROFILES entry, or a dict of the same form.
+        :param latency_scale: Factor applied to every sampled latency.
+        :param tokens_per_second: Generation speed of streamed responses (None streams instantly).
+        :param error_rate_429: Share of requests answered with 429 Too Many Requests.
+        :param error_rate_5xx: Share of requests answered with 500, 502 or 503.
+        :param retry_after: Retry-After header (seconds) of the 429 responses.
+        :param format_error_rate: Share of answers that slip from the format (mislabelled fields in
+                                  text answers, a missing field in JSON answers).
+        :param seed: Seed of the latency and error sampling.
+        """
+        self.latency = LATENCY_PROFILES[latency_profile] if isinstance(latency_profile, str) else dict(latency_profile)
+        self.latency_scale = latency_scale
+        self.tokens_per_second = tokens_per_second
+        self.error_rate_429 = error_rate_429
+        self.error_rate_5xx = error_rate_5xx
+        self.retry_after = retry_after
+        self.format_error_rate = format_error_rate
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counts = {"requests": 0, "errors_429": 0, "errors_5xx": 0, "streams": 0}
+        self._phases = {}
+        self.log = logger(name="MockLLMServer", log_file="Logs/backtest.log")
+
+        self.httpd = ThreadingHTTPServer((host, port), _make_handler(self))
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        """Serves in a background thread; returns the server."""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="MockLLMServer", daemon=True)
+        self._thread.start()
+        self.log.info(f"Mock LLM server listening on {self.base_url}")
+        return self
+
+    def stop(self):
+        """Stops serving and closes the socket."""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def stats(self) -> dict:
+        """Requests served, injected errors and requests per phase."""
+        with self._lock:
+            return {**self._counts, "phases": dict(self._phases)}
+
+    def sample_latency(self) -> float:
+        """Seconds before the first token of a completion."""
+        profile = self.latency
+        with self._lock:
+            if profile["distribution"] == "lognormal":
+                latency = self._random.lognormvariate(0.0, profile.get("sigma", 0.5)) * profile["median"]
+            elif profile["distribution"] == "uniform":
+                latency = self._random.uniform(profile["low"], profile["high"])
+            else:
+                latency = profile.get("median", 0.0)
+        return max(latency * self.latency_scale, 0.0)
+
+    def sample_error(self):
+        """HTTP status of an injected error, or None to answer normally."""
+        with self._lock:
+            draw = self._random.random()
+            if draw < self.error_rate_429:
+                return 429
+            if draw < self.error_rate_429 + self.error_rate_5xx:
+                return self._random.choice((500, 502, 503))
+        return None
+
+    def sample_format_error(self) -> bool:
+        """Whether the next answer slips from the requested format."""
+        with self._lock:
+            return self._random.random() < self.format_error_rate
+
+    def record(self, name: str):
+        with self._lock:
+            self._counts[name] += 1
+
+    def record_phase(self, phase: str):
+        with self._lock:
+            self._phases[phase] = self._phases.get(phase, 0) + 1
+
+    def usage(self, payload: dict, content: str) -> dict:
+        """
+        Usage field in DeepSeek's format: the conversation before the last message counts as a
+        context cache hit, and reasoner models add hidden reasoning tokens to the completion.
+        """
+        messages = payload.get("messages") or []
+        prompt_tokens = estimate_prompt_tokens(messages)
+        cache_hit_tokens = estimate_prompt_tokens(messages[:-1])
+        reasoning_tokens = 3 * estimate_text_tokens(content) if "reasoner" in payload.get("model", "") else 0
+        completion_tokens = estimate_text_tokens(content) + reasoning_tokens
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_cache_hit_tokens": cache_hit_tokens,
+            "prompt_cache_miss_tokens": prompt_tokens - cache_hit_tokens,
+            "completion_tokens_details": {"reasoning_tokens": reasoning_tokens},
+        }
+
+    def completion(self, payload: dict) -> tuple[str, str]:
+        """Phase of the request and the answer content for it."""
+        messages = payload.get("messages") or []
+        prompt = next((message["content"] for message in reversed(messages) if message["role"] == "user"), "")
+
+        # Deterministic per conversation, so repeated requests (and the response cache) see the same answer
+        rng = random.Random(json.dumps(messages, sort_keys=True))
+        prediction = rng.choice(PREDICTION_OPTIONS)
+        format_error = self.sample_format_error()
+
+        if (payload.get("response_format") or {}).get("type") == "json_object":
+            return self.json_completion(messages, prompt, rng, prediction, format_error)
+
+        phase, content = self.text_completion(prompt, rng, prediction)
+        if format_error:
+            # Labels the agents' parsers do not recognise
+            content = content.replace("[Title]:", "Headline:").replace("Prediction:", "Forecast:")
+        return phase, content
+
+    def text_completion(self, prompt: str, rng: random.Random, prediction: str) -> tuple[str, str]:
+        """Phase and free-text answer in the labelled formats of the example prompts."""
+        if "[Relevance]" in prompt:
+            titles = re.findall(r"Title: \*(.*?)\* \(Source:", prompt)
+            num_relevance = re.search(r"top (\d+)(?:-(\d+))? most relevant", prompt)
+            num_titles = int(num_relevance.group(2) or num_relevance.group(1)) if num_relevance else 3
+            selected = titles[:num_titles]
+            entries = [f"[Title]: **{title}**\n[Relevance]: **Mock relevance of this headline for the asset.**\n"
+                       for title in selected]
+            content = "\n".join(entries) + "\n**Overall Summary**\nMock summary of the selected news.\n"
+            return "filter", content
+
+        if "Agreement:" in prompt:
+            agreement = rng.choice(("Agree", "Disagree"))
+            return "argue", (f"Agreement: {agreement}\n"
+                             f"Response: Mock response weighing the other agents' views.\n\n"
+                             f"Prediction: {prediction}\n")
+
+        phase = "reflection" if "Final Reflection" in prompt else "decision"
+        return phase, (f"Prediction: {prediction}\n\n"
+                       f"Explanation: Mock explanation of the {phase} based on the macroeconomic data and news.\n")
+
+    def json_completion(self, messages: list, prompt: str, rng: random.Random, prediction: str, format_error: bool) -> tuple[str, str]:
+        """Phase and JSON answer with the keys listed in the output instructions of the prompt."""
+        keys = re.findall(r'^- "(\w+)":', prompt, re.MULTILINE)
+
+        # Follow-ups for missing fields refer to the news of the earlier prompt in the conversation
+        conversation = "\n".join(message["content"] for message in messages if message["role"] == "user")
+        titles = re.findall(r"Title: \*(.*?)\* \(Source:", conversation)
+        num_relevance = re.search(r"top (\d+)(?:-(\d+))? most relevant", conversation)
+        num_titles = int(num_relevance.group(2) or num_relevance.group(1)) if num_relevance else 3
+
+        if prompt.startswith(REASK_PREFIX):
+            phase = "reask"
+        elif "selected" in keys:
+            phase = "filter"
+        elif "agreement" in keys:
+            phase = "argue"
+        else:
+            phase = "reflection" if "Final Reflection" in prompt else "decision"
+
+        values = {
+            "agreement": rng.choice(("Agree", "Disagree")),
+            "response": "Mock response weighing the other agents' views.",
+            "prediction": prediction,
+            "explanation": f"Mock explanation of the {phase} based on the macroeconomic data and news.",
+            "selected": [{"title": title, "relevance": "Mock relevance of this headline for the asset."}
+                         for title in titles[:num_titles]],
+            "summary": "Mock summary of the selected news.",
+        }
+        content = {key: values[key] for key in keys if key in values}
+        if format_error and content:
+            # The field the agent needs most goes missing
+            content.pop(next((key for key in ("selected", "prediction") if key in content), next(iter(content))))
+        return phase, json.dumps(content)
+
+
+def _make_handler(server: MockLLMServer):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            # Requests are counted in stats(); per-request access logs would flood the console
+            pass
+
+        def handle(self):
+            try:
+                super().handle()
+            except (BrokenPipeError, ConnectionResetError):
+                # The client closed the connection, e.g. a stream stopped early (stream_early_exit)
+                pass
+
+        def _send_json(self, status: int, body: dict, headers: dict = None):
+            encoded = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(encoded)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(encoded)
+
+        def _send_chunk(self, data: str):
+            encoded = data.encode("utf-8")
+            self.wfile.write(f"{len(encoded):x}\r\n".encode("ascii") + encoded + b"\r\n")
+            self.wfile.flush()
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+                return
+
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            server.record("requests")
+
+            error = server.sample_error()
+            if error == 429:
+                server.record("errors_429")
+                self._send_json(429, {"error": {"message": "Rate limit reached (mock)"}}, {"Retry-After": str(server.retry_after)})
+                return
+            if error is not None:
+                server.record("errors_5xx")
+                self._send_json(error, {"error": {"message": f"Server error {error} (mock)"}})
+                return
+
+            phase, content = server.completion(payload)
+            server.record_phase(phase)
+
+            completion_id = f"mock-{time.time_ns()}"
+            model = payload.get("model", "mock")
+            usage = server.usage(payload, content)
+
+            time.sleep(server.sample_latency())
+
+            if not payload.get("stream"):
+                self._send_json(200, {
+                    "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                    "usage": usage,
+                })
+                return
+
+            server.record("streams")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            # One delta per word, paced at the configured generation speed
+            for piece in re.findall(r"\S+\s*", content):
+                chunk = {"id": completion_id, "object": "chat.completion.chunk", "model": model,
+                         "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                self._send_chunk(f"data: {json.dumps(chunk)}\n\n")
+                if server.tokens_per_second:
+                    time.sleep(estimate_text_tokens(piece) / server.tokens_per_second)
+
+            final = {"id": completion_id, "object": "chat.completion.chunk", "model": model,
+                     "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            if (payload.get("stream_options") or {}).get("include_usage"):
+                final["usage"] = usage
+            self._send_chunk(f"data: {json.dumps(final)}\n\n")
+            self._send_chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+
+    return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local DeepSeek-compatible mock LLM server")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Host to bind")
+    parser.add_argument("--port", type=int, default=8000, help="Port to bind")
+    parser.add_argument("--latency-profile", type=str, default="fast", choices=sorted(LATENCY_PROFILES), help="Latency profile of the completions")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Factor applied to every sampled latency")
+    parser.add_argument("--tokens-per-second", type=float, default=None, help="Generation speed of streamed responses")
+    parser.add_argument("--error-rate-429", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--error-rate-5xx", type=float, default=0.0, help="Share of requests answered with 500/502/503")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After (seconds) of the 429 responses")
+    parser.add_argument("--format-error-rate", type=float, default=0.0, help="Share of answers that slip from the requested format")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the latency and error sampling")
+    args = parser.parse_args()
+
+    server = MockLLMServer(host=args.host, port=args.port, latency_profile=args.latency_profile,
+                           latency_scale=args.latency_scale, tokens_per_second=args.tokens_per_second,
+                           error_rate_429=args.error_rate_429, error_rate_5xx=args.error_rate_5xx,
+                           retry_after=args.retry_after, format_error_rate=args.format_error_rate, seed=args.seed)
+    print(f"Mock LLM server listening on {server.base_url} (set base_url in the llm_client section)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(f"Served: {server.stats()}")
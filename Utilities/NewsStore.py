@@ -0,0 +1,131 @@
+import os
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from threading import Lock
+from itertools import chain
+
+# Optional dependency: only needed to read the partitioned Parquet layout
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+from Utilities.Logger import logger
+
+
+class NewsStore:
+    """
+    Date-indexed, in-memory view of a news table (MacroNews.csv, AggregatedNews.csv or the
+    date-partitioned Parquet dataset written by NewsDataProcessor).
+
+    The table is parsed, de-duplicated and sorted by timestamp exactly once per process. Window
+    queries are answered with binary searches on the sorted timestamps, so selecting the news of
+    a lookback window costs O(d log n + k) for d requested days and k matching rows.
+    """
+
+    _registry = {}
+    _registry_lock = Lock()
+
+    def __init__(self, path):
+        """
+        :param path: Path to the news CSV file. If a sibling "<name>.parquet" dataset exists and is
+                     at least as recent as the CSV, the Parquet dataset is memory-mapped instead.
+        """
+        self.path = Path(path)
+        self.log = logger(name="NewsStore", log_file="Logs/backtest.log")
+
+        self.source = self._resolve_source(self.path)
+        self.signature = self._signature(self.source)
+        self.frame = self._load()
+        self.timestamps = self.frame["Date"].to_numpy(dtype="datetime64[ns]")
+
+        self.log.info(f"Indexed {len(self.frame)} news entries from {self.source}")
+
+    @classmethod
+    def from_path(cls, path):
+        """
+        Returns the shared store for the given path, reloading it only if the underlying file changed
+        (e.g. AggregatedNews.csv being updated by the FilterAgent during a backtest).
+        """
+        key = os.path.abspath(path)
+        with cls._registry_lock:
+            store = cls._registry.get(key)
+            source = cls._resolve_source(Path(path))
+            if store is None or store.source != source or store.signature != cls._signature(source):
+                store = cls(path)
+                cls._registry[key] = store
+            return store
+
+    @staticmethod
+    def _resolve_source(path):
+        """Prefers the partitioned Parquet layout when it is available and not older than the CSV."""
+        parquet_path = path.with_suffix(".parquet")
+        if pq is None or not parquet_path.is_dir():
+            return path
+        if path.exists() and os.stat(path).st_mtime_ns > os.stat(parquet_path).st_mtime_ns:
+            return path
+        return parquet_path
+
+    @staticmethod
+    def _signature(source):
+        stat = os.stat(source)  # Raises FileNotFoundError for missing news files
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _load(self):
+        if self.source.is_dir():
+            table = pq.read_table(self.source, memory_map=True)
+            df = table.to_pandas()
+            df = df.drop(columns=[col for col in ("Day",) if col in df.columns])
+
+            # Arrow returns None for missing strings, the CSV reader returns NaN
+            for col in df.select_dtypes(include="object").columns:
+                df[col] = df[col].where(df[col].notna(), np.nan)
+        else:
+            df = pd.read_csv(self.source)
+
+        df = df.drop_duplicates()
+        df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
+        df = df.dropna(subset=["Date"])
+
+        # Stable sort keeps the file order for news published at the same timestamp
+        df = df.sort_values(by="Date", ascending=True, kind="mergesort").reset_index(drop=True)
+        return df
+
+    def window(self, filter_dates=None):
+        """
+        Returns the news published on any of the given calendar days, sorted by date.
+
+        :param filter_dates: (Nested) list of dates. If None, the whole table is returned.
+        :return: DataFrame slice of the matching news entries.
+        """
+        if not filter_dates:
+            return self.frame
+
+        days = np.unique(np.array(
+            [pd.Timestamp(date).normalize().to_datetime64() for date in flatten_dates(filter_dates)],
+            dtype="datetime64[ns]",
+        ))
+        if len(days) == 0:
+            return self.frame.iloc[0:0]
+
+        # Merge consecutive days into contiguous ranges before searching
+        breaks = np.flatnonzero(np.diff(days) != np.timedelta64(1, "D")) + 1
+        range_starts = days[np.r_[0, breaks]]
+        range_ends = days[np.r_[breaks - 1, len(days) - 1]] + np.timedelta64(1, "D")
+
+        lower = np.searchsorted(self.timestamps, range_starts, side="left")
+        upper = np.searchsorted(self.timestamps, range_ends, side="left")
+
+        if len(lower) == 1:
+            return self.frame.iloc[lower[0]:upper[0]]
+
+        index = np.concatenate([np.arange(lo, hi) for lo, hi in zip(lower, upper)])
+        return self.frame.iloc[index]
+
+
+# Flatten a (possibly nested) list of dates
+def flatten_dates(dates):
+    if isinstance(dates, (list, tuple)) and dates and isinstance(dates[0], (list, tuple)):
+        return list(chain.from_iterable(dates))
+    return list(dates)
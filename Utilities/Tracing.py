@@ -0,0 +1,219 @@
+import os
+import re
+import json
+import time
+import inspect
+import argparse
+import functools
+import itertools
+import threading
+import contextvars
+import multiprocessing
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from datetime import datetime
+from contextlib import contextmanager
+
+
+# Trace file of the current run; set by start_trace and inherited by the worker processes
+TRACE_PATH_ENV = "MACRO_STRATEGY_TRACE_PATH"
+
+# Innermost open span of the current thread or asyncio task
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+_span_ids = itertools.count(1)
+_files = {}
+_files_lock = threading.Lock()
+
+
+class Span:
+
+    def __init__(self, name: str, parent, tags: dict):
+        """
+        A timed section of the backtest. Spans nest: a span opened while another one is open in the
+        same thread or asyncio task becomes its child and inherits its tags (e.g. the date).
+
+        :param name: Stage name (e.g. "aggregation", "llm_call", "reflection").
+        :param parent: Enclosing span (None for a root span).
+        :param tags: Tags of the span, added to those of the parent.
+        """
+        self.name = name
+        self.span_id = f"{os.getpid()}-{next(_span_ids)}"
+        self.parent_id = parent.span_id if parent is not None else None
+        self.depth = parent.depth + 1 if parent is not None else 0
+        self.tags = {**(parent.tags if parent is not None else {}), **tags}
+
+    def tag(self, **tags):
+        """Adds tags to the span (e.g. results only known at the end of the section)."""
+        self.tags.update(tags)
+
+
+def start_trace(trace_dir: str) -> Path:
+    """
+    Starts the trace of a run: spans of this process and of the worker processes started afterwards
+    are appended to a new JSONL file in the trace directory.
+
+    :param trace_dir: Directory of the trace files.
+    :return: Path to the trace file.
+    """
+    os.makedirs(trace_dir, exist_ok=True)
+    trace_path = Path(trace_dir) / f"trace-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl"
+    os.environ[TRACE_PATH_ENV] = str(trace_path)
+    return trace_path
+
+
+def stop_trace():
+    """Stops recording spans in this process."""
+    os.environ.pop(TRACE_PATH_ENV, None)
+
+
+def _write(trace_path: str, record: dict):
+    # One O_APPEND write per span, so lines of concurrent processes never interleave
+    key = (os.getpid(), trace_path)
+    with _files_lock:
+        fd = _files.get(key)
+        if fd is None:
+            fd = _files[key] = os.open(trace_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    os.write(fd, (json.dumps(record, default=str) + "\n").encode("utf-8"))
+
+
+def _worker_name() -> str:
+    return re.sub(r"ForkPoolWorker-(\d+)", r"Worker \1", multiprocessing.current_process().name)
+
+
+@contextmanager
+def span(name: str, **tags):
+    """
+    Times the enclosed section as a span of the current trace (a no-op when no trace is running).
+
+    :param name: Stage name.
+    :param tags: Tags of the span (e.g. date, agent, model).
+    """
+    trace_path = os.environ.get(TRACE_PATH_ENV)
+    if not trace_path:
+        yield None
+        return
+
+    current = Span(name, _current_span.get(), tags)
+    token = _current_span.set(current)
+    start_wall = time.time()
+    start_time = time.perf_counter()
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - start_time
+        _current_span.reset(token)
+        _write(trace_path, {
+            "name": current.name,
+            "span_id": current.span_id,
+            "parent_id": current.parent_id,
+            "depth": current.depth,
+            "start": round(start_wall, 6),
+            "duration": round(duration, 6),
+            "pid": os.getpid(),
+            "worker": _worker_name(),
+            "thread": threading.current_thread().name,
+            "tags": current.tags,
+            "error": error,
+        })
+
+
+def traced(name: str = None, **tags):
+    """Decorator recording every call of a function (or coroutine function) as a span."""
+    def decorator(function):
+        span_name = name or function.__name__
+
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name, **tags):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(span_name, **tags):
+                return function(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def propagate_context(function):
+    """
+    Binds a callable to a copy of the current context, so spans opened in a ThreadPoolExecutor or
+    run_in_executor thread nest under the span that submitted it. Call once per submission.
+    """
+    context = contextvars.copy_context()
+    return functools.partial(context.run, function)
+
+
+def read_trace(trace_path) -> pd.DataFrame:
+    """Spans of a trace file, one row per span (tags expanded into columns)."""
+    with open(trace_path, "r") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    if not records:
+        return pd.DataFrame(columns=["name", "span_id", "parent_id", "depth", "start", "duration", "pid", "worker", "thread", "error"])
+
+    spans = pd.DataFrame(records)
+    tags = pd.json_normalize(spans.pop("tags").tolist())
+    return pd.concat([spans, tags.add_prefix("tag.")], axis=1)
+
+
+def summarise(trace_path, by: list = None) -> pd.DataFrame:
+    """
+    Per-stage latency breakdown of a trace.
+
+    :param trace_path: Path to the trace file.
+    :param by: Additional tag names to break the stages down by (e.g. ["date"] or ["agent"]).
+    :return: DataFrame with the number of spans, total, mean, p50, p95 and max seconds of each stage,
+             and its share of the run's wall time.
+    """
+    spans = read_trace(trace_path)
+    if spans.empty:
+        return pd.DataFrame()
+
+    keys = ["name"] + [f"tag.{tag}" for tag in (by or []) if f"tag.{tag}" in spans.columns]
+    wall_time = (spans["start"] + spans["duration"]).max() - spans["start"].min()
+
+    summary = spans.groupby(keys, dropna=False)["duration"].agg(
+        count="count",
+        total_seconds="sum",
+        mean_seconds="mean",
+        p50_seconds=lambda d: np.percentile(d, 50),
+        p95_seconds=lambda d: np.percentile(d, 95),
+        max_seconds="max",
+    )
+    # Summed over all workers and threads, so the share exceeds 1 for stages that run in parallel
+    summary["share_of_wall_time"] = summary["total_seconds"] / wall_time if wall_time > 0 else np.nan
+
+    # Outermost stages first, then by total time
+    depth = spans.groupby(keys, dropna=False)["depth"].min()
+    summary = summary.assign(depth=depth).sort_values(["depth", "total_seconds"], ascending=[True, False])
+    return summary.round(4)
+
+
+def latest_trace(trace_dir) -> Path:
+    """Most recent trace file of a trace directory."""
+    traces = sorted(Path(trace_dir).glob("trace-*.jsonl"), key=os.path.getmtime)
+    if not traces:
+        raise FileNotFoundError(f"No trace files in {trace_dir}")
+    return traces[-1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-stage latency breakdown of a backtest trace")
+    parser.add_argument("trace", type=str, help="Trace file (JSONL), or a trace directory for its latest trace")
+    parser.add_argument("-b", "--by", type=str, nargs="*", default=None, help="Tags to break the stages down by (e.g. date agent)")
+    args = parser.parse_args()
+
+    trace_path = latest_trace(args.trace) if os.path.isdir(args.trace) else Path(args.trace)
+    pd.set_option("display.width", 200)
+    pd.set_option("display.max_rows", None)
+    print(f"Trace: {trace_path}\n")
+    print(summarise(trace_path, by=args.by).to_string())
@@ -1,6 +1,10 @@
 from .Logger import logger
 from .ConfigLoader import BacktestConfigurationLoader, filter_valid_kwargs
+from .NewsStore import NewsStore
+from .IndicatorSnapshot import IndicatorSnapshot
 
 __all__ = ["logger",
            "BacktestConfigurationLoader",
-           "filter_valid_kwargs",]
\ No newline at end of file
+           "filter_valid_kwargs",
+           "NewsStore",
+           "IndicatorSnapshot",]
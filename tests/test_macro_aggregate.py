@@ -0,0 +1,38 @@
+import sys
+import os
+import yaml
+import pandas as pd
+from pathlib import Path
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from Backtest.MacroAggregate import MacroAggregator, NO_RELEVANT_NEWS
+from Benchmark import make_synthetic_data, scenario_config
+from Utilities import filter_valid_kwargs
+
+CONFIG_PATH = Path(__file__).resolve().parents[1] / "benchmark_config.yaml"
+
+
+def make_aggregator(tmp_path) -> MacroAggregator:
+    """Aggregator over the benchmark's synthetic data (no LLM server: every test window must be covered)."""
+    with open(CONFIG_PATH, "r") as f:
+        config = yaml.safe_load(f)
+    data_root = make_synthetic_data(tmp_path / "Data", **{**config["synthetic_data"], "num_days": 10})
+    scenario = scenario_config(config["scenarios"][0], config["defaults"], data_root, config["synthetic_data"]["start_date"],
+                               tmp_path, "http://127.0.0.1:9")
+    return MacroAggregator(**filter_valid_kwargs(MacroAggregator, scenario))
+
+
+def test_aggregate_all_window_covered_without_news(tmp_path):
+    aggregator = make_aggregator(tmp_path)
+    date = pd.Timestamp("2024-01-05")
+    filter_dates = [date - pd.Timedelta(days=i) for i in range(3, -1, -1)]
+
+    # Every day of the lookback window was filtered, and the FilterAgent kept no news
+    aggregator.news_store.mark_covered({day.strftime("%Y-%m-%d"): 0 for day in filter_dates}, "test-model", "test-version")
+    assert aggregator.uncovered_days([filter_dates], any_version=True) == []
+
+    aggregator.set_current_date(current_date=date)
+    aggregated_output = aggregator.aggregate_all(filter_dates=[filter_dates], filter_agent=False)
+
+    assert NO_RELEVANT_NEWS in aggregated_output
+    assert "Macro Indicators:" in aggregated_output